@@ -0,0 +1,42 @@
+"""auditoria incremental (pendencias + snapshot)
+
+Revision ID: 0010_auditoria_incremental
+Revises: 0009_icp_brasil_fields
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_auditoria_incremental"
+down_revision = "0009_icp_brasil_fields"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "auditoria_pendencias",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+        sa.Column("procedimento_id", sa.Integer(), nullable=False),
+        sa.Column("competencia", sa.String(length=6), nullable=False),
+        sa.Column("marcado_em", sa.DateTime(), nullable=True),
+    )
+    op.create_index("idx_auditpend_tenant_competencia", "auditoria_pendencias", ["tenant_id", "competencia"])
+
+    op.create_table(
+        "auditoria_snapshots",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+        sa.Column("competencia", sa.String(length=6), nullable=False),
+        sa.Column("resultado_json", sa.JSON(), nullable=True),
+        sa.Column("atualizado_em", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("tenant_id", "competencia", name="uq_auditsnap_tenant_competencia"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("auditoria_snapshots")
+    op.drop_index("idx_auditpend_tenant_competencia", table_name="auditoria_pendencias")
+    op.drop_table("auditoria_pendencias")
@@ -0,0 +1,28 @@
+"""content-addressed exports (sha256 do arquivo e das entradas)
+
+Revision ID: 0011_export_content_hash
+Revises: 0010_auditoria_incremental
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_export_content_hash"
+down_revision = "0010_auditoria_incremental"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ("exportacoes_bpa", "exportacoes_apac"):
+        op.alter_column(table, "checksum", type_=sa.String(length=64), existing_type=sa.String(length=10), existing_nullable=True)
+        op.add_column(table, sa.Column("entrada_hash", sa.String(length=64), nullable=True))
+        op.create_index(f"ix_{table}_entrada_hash", table, ["entrada_hash"])
+
+
+def downgrade() -> None:
+    for table in ("exportacoes_bpa", "exportacoes_apac"):
+        op.drop_index(f"ix_{table}_entrada_hash", table_name=table)
+        op.drop_column(table, "entrada_hash")
+        op.alter_column(table, "checksum", type_=sa.String(length=10), existing_type=sa.String(length=64), existing_nullable=True)
@@ -0,0 +1,26 @@
+"""tamanho bruto/comprimido das exportacoes
+
+Revision ID: 0012_export_compressao
+Revises: 0011_export_content_hash
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012_export_compressao"
+down_revision = "0011_export_content_hash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ("exportacoes_bpa", "exportacoes_apac"):
+        op.add_column(table, sa.Column("tamanho_bytes", sa.Integer(), nullable=True))
+        op.add_column(table, sa.Column("tamanho_comprimido", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    for table in ("exportacoes_bpa", "exportacoes_apac"):
+        op.drop_column(table, "tamanho_comprimido")
+        op.drop_column(table, "tamanho_bytes")
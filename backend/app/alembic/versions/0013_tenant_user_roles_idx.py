@@ -0,0 +1,21 @@
+"""indice (tenant_id, user_id) para listagem de usuarios por tenant
+
+Revision ID: 0013_tenant_user_roles_idx
+Revises: 0012_export_compressao
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+
+revision = "0013_tenant_user_roles_idx"
+down_revision = "0012_export_compressao"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("idx_tenantuserrole_tenant_user", "tenant_user_roles", ["tenant_id", "user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_tenantuserrole_tenant_user", table_name="tenant_user_roles")
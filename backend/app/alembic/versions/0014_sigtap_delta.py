@@ -0,0 +1,32 @@
+"""importacao incremental do SIGTAP (registro de competencias + indice de vigencia)
+
+Revision ID: 0014_sigtap_delta
+Revises: 0013_tenant_user_roles_idx
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014_sigtap_delta"
+down_revision = "0013_tenant_user_roles_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sigtap_importacoes",
+        sa.Column("competencia", sa.String(length=6), primary_key=True),
+        sa.Column("importado_em", sa.DateTime(), nullable=True),
+        sa.Column("novos", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("alterados", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("inalterados", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("relatorio_json", sa.JSON(), nullable=True),
+    )
+    op.create_index("idx_sigtap_codigo_vigencia", "tabelas_sigtap", ["codigo", "vigencia_inicio"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_sigtap_codigo_vigencia", table_name="tabelas_sigtap")
+    op.drop_table("sigtap_importacoes")
@@ -0,0 +1,36 @@
+"""pendencia de auditoria unica por (tenant, procedimento, competencia)
+
+Revision ID: 0015_auditoria_pendencia_unica
+Revises: 0014_sigtap_delta
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+
+revision = "0015_auditoria_pendencia_unica"
+down_revision = "0014_sigtap_delta"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Mantem so a marcacao mais recente de cada procedimento antes de criar o indice unico
+    op.execute(
+        """
+        DELETE FROM auditoria_pendencias
+        WHERE id NOT IN (
+            SELECT max(id) FROM auditoria_pendencias
+            GROUP BY tenant_id, procedimento_id, competencia
+        )
+        """
+    )
+    op.create_index(
+        "uq_auditpend_tenant_proc_competencia",
+        "auditoria_pendencias",
+        ["tenant_id", "procedimento_id", "competencia"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_auditpend_tenant_proc_competencia", table_name="auditoria_pendencias")
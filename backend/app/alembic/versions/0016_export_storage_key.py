@@ -0,0 +1,33 @@
+"""chave do objeto no MinIO gravada na exportacao
+
+Revision ID: 0016_export_storage_key
+Revises: 0015_auditoria_pendencia_unica
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0016_export_storage_key"
+down_revision = "0015_auditoria_pendencia_unica"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table, tipo in (("exportacoes_bpa", "bpa"), ("exportacoes_apac", "apac")):
+        op.add_column(table, sa.Column("storage_key", sa.String(length=255), nullable=True))
+        # Linhas antigas: o .gz foi enviado exatamente quando o tamanho comprimido foi registrado
+        op.execute(
+            f"""
+            UPDATE {table}
+            SET storage_key = 'exports/{tipo}/' || tenant_id || '/' || checksum || '.rem'
+                || CASE WHEN tamanho_comprimido IS NOT NULL THEN '.gz' ELSE '' END
+            WHERE checksum IS NOT NULL AND status = 'gerado'
+            """
+        )
+
+
+def downgrade() -> None:
+    for table in ("exportacoes_bpa", "exportacoes_apac"):
+        op.drop_column(table, "storage_key")
@@ -0,0 +1,40 @@
+"""relacoes de compatibilidade do SIGTAP (CID, CBO, habilitacao, servico)
+
+Revision ID: 0017_sigtap_relacoes
+Revises: 0016_export_storage_key
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0017_sigtap_relacoes"
+down_revision = "0016_export_storage_key"
+branch_labels = None
+depends_on = None
+
+TABELAS = (
+    ("sigtap_procedimento_cid", "idx_sigtap_cid_proc_codigo", 4),
+    ("sigtap_procedimento_cbo", "idx_sigtap_cbo_proc_codigo", 6),
+    ("sigtap_procedimento_habilitacao", "idx_sigtap_hab_proc_codigo", 4),
+    ("sigtap_procedimento_servico", "idx_sigtap_serv_proc_codigo", 6),
+)
+
+
+def upgrade() -> None:
+    for tabela, indice, tamanho_codigo in TABELAS:
+        op.create_table(
+            tabela,
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("procedimento", sa.String(length=10), nullable=False),
+            sa.Column("codigo", sa.String(length=tamanho_codigo), nullable=False),
+            sa.Column("vigencia_inicio", sa.String(length=6), nullable=False),
+            sa.Column("vigencia_fim", sa.String(length=6), nullable=True),
+        )
+        op.create_index(indice, tabela, ["procedimento", "codigo", "vigencia_inicio"])
+
+
+def downgrade() -> None:
+    for tabela, indice, _ in TABELAS:
+        op.drop_index(indice, table_name=tabela)
+        op.drop_table(tabela)
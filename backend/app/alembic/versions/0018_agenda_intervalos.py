@@ -0,0 +1,32 @@
+"""duracao das agendas e indices por profissional/unidade/status e data
+
+Revision ID: 0018_agenda_intervalos
+Revises: 0017_sigtap_relacoes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0018_agenda_intervalos"
+down_revision = "0017_sigtap_relacoes"
+branch_labels = None
+depends_on = None
+
+INDICES = (
+    ("idx_agendas_tenant_prof_data", ["tenant_id", "profissional_id", "data"]),
+    ("idx_agendas_tenant_unidade_data", ["tenant_id", "unidade_id", "data"]),
+    ("idx_agendas_tenant_status_data", ["tenant_id", "status", "data"]),
+)
+
+
+def upgrade() -> None:
+    op.add_column("agendas", sa.Column("duracao_minutos", sa.Integer(), nullable=False, server_default="30"))
+    for nome, colunas in INDICES:
+        op.create_index(nome, "agendas", colunas)
+
+
+def downgrade() -> None:
+    for nome, _ in INDICES:
+        op.drop_index(nome, table_name="agendas")
+    op.drop_column("agendas", "duracao_minutos")
@@ -0,0 +1,36 @@
+"""modelos semanais de agenda por profissional
+
+Revision ID: 0019_agenda_modelos
+Revises: 0018_agenda_intervalos
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0019_agenda_modelos"
+down_revision = "0018_agenda_intervalos"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "agenda_modelos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+        sa.Column("unidade_id", sa.Integer(), sa.ForeignKey("unidades.id"), nullable=False),
+        sa.Column("profissional_id", sa.Integer(), sa.ForeignKey("profissionais.id"), nullable=False),
+        sa.Column("dia_semana", sa.Integer(), nullable=False),
+        sa.Column("hora_inicio", sa.Time(), nullable=False),
+        sa.Column("hora_fim", sa.Time(), nullable=False),
+        sa.Column("duracao_minutos", sa.Integer(), nullable=False, server_default="30"),
+        sa.Column("tipo", sa.String(length=50), nullable=False, server_default="consulta"),
+        sa.Column("ativo", sa.Boolean(), nullable=False, server_default=sa.true()),
+    )
+    op.create_index("idx_agenda_modelos_tenant_prof", "agenda_modelos", ["tenant_id", "profissional_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_agenda_modelos_tenant_prof", table_name="agenda_modelos")
+    op.drop_table("agenda_modelos")
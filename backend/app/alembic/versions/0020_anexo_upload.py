@@ -0,0 +1,29 @@
+"""metadados de upload dos anexos clinicos
+
+Revision ID: 0020_anexo_upload
+Revises: 0019_agenda_modelos
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0020_anexo_upload"
+down_revision = "0019_agenda_modelos"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("anexos_clinicos", sa.Column("storage_key", sa.String(length=255), nullable=True))
+    op.add_column("anexos_clinicos", sa.Column("nome_arquivo", sa.String(length=255), nullable=True))
+    op.add_column("anexos_clinicos", sa.Column("content_type", sa.String(length=100), nullable=True))
+    op.add_column("anexos_clinicos", sa.Column("tamanho_bytes", sa.Integer(), nullable=True))
+    op.add_column(
+        "anexos_clinicos", sa.Column("status", sa.String(length=20), nullable=False, server_default="disponivel")
+    )
+
+
+def downgrade() -> None:
+    for coluna in ("status", "tamanho_bytes", "content_type", "nome_arquivo", "storage_key"):
+        op.drop_column("anexos_clinicos", coluna)
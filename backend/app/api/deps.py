@@ -1,6 +1,23 @@
-from typing import Generator
-from app.database import get_db
+from typing import AsyncGenerator, Generator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db, get_async_read_db, get_db, get_read_db
 
 
 def get_db_session() -> Generator:
     yield from get_db()
+
+
+def get_read_db_session() -> Generator:
+    yield from get_read_db()
+
+
+async def get_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    async for db in get_async_db():
+        yield db
+
+
+async def get_async_read_db_session() -> AsyncGenerator[AsyncSession, None]:
+    async for db in get_async_read_db():
+        yield db
@@ -1,8 +1,14 @@
+import json
+from contextlib import AsyncExitStack
 from datetime import date, datetime
 from typing import Optional
 
+import httpx
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -10,7 +16,8 @@ from app import models
 from app.api.deps import get_db_session
 from app.core.config import settings
 from app.dependencies import get_current_tenant_id, get_current_user
-from app.services.ai_assistant import AiAssistantService
+from app.services import ai_cache
+from app.services.ai_assistant import AiAssistantService, LimiteConcorrenciaExcedido, limite_tenant
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
@@ -28,16 +35,12 @@ def _idade(data_nascimento: date, ref: date) -> int:
     return anos
 
 
-@router.post("/assistente")
-def assistente_clinico(
+def _montar_contexto(
     payload: AssistenteRequest,
-    db: Session = Depends(get_db_session),
-    current_user: models.Usuario = Depends(get_current_user),
-    current_tenant_id: int = Depends(get_current_tenant_id),
-):
-    if not settings.ai_api_key or not settings.ai_model_name:
-        raise HTTPException(status_code=503, detail="Assistente AI não configurado")
-
+    db: Session,
+    current_user: models.Usuario,
+    current_tenant_id: int,
+) -> dict:
     paciente = db.get(models.Paciente, payload.paciente_id) if payload.paciente_id else None
     atendimento = db.get(models.Atendimento, payload.atendimento_id) if payload.atendimento_id else None
     if atendimento and atendimento.tenant_id != current_tenant_id:
@@ -83,6 +86,98 @@ def assistente_clinico(
             {"codigo": p.sigtap_codigo, "cid": p.cid10, "quantidade": p.quantidade} for p in procedimentos
         ]
 
+    return contexto
+
+
+def _verificar_configuracao() -> None:
+    if not settings.ai_api_key or not settings.ai_model_name:
+        raise HTTPException(status_code=503, detail="Assistente AI não configurado")
+
+
+def _limite_excedido() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Limite de consultas simultaneas ao assistente atingido para o tenant",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _evento(nome: str, dados: dict) -> str:
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+@router.post("/assistente")
+async def assistente_clinico(
+    payload: AssistenteRequest,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(get_current_user),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    _verificar_configuracao()
+    contexto = await run_in_threadpool(_montar_contexto, payload, db, current_user, current_tenant_id)
+    service = AiAssistantService()
+    chave = ai_cache.chave_resposta(current_tenant_id, service.model, contexto, payload.mensagem)
+    resposta = await ai_cache.obter(chave)
+    if resposta is not None:
+        return {"resposta": resposta, "cache": True}
+    try:
+        async with limite_tenant(current_tenant_id):
+            resposta = await service.gerar_resposta(contexto, payload.mensagem)
+    except LimiteConcorrenciaExcedido:
+        raise _limite_excedido()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Falha ao consultar o assistente AI")
+    await ai_cache.guardar(chave, resposta)
+    return {"resposta": resposta, "cache": False}
+
+
+@router.post("/assistente/stream")
+async def assistente_clinico_stream(
+    payload: AssistenteRequest,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(get_current_user),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    Variante server-sent events: repassa os trechos da resposta assim que chegam do modelo.
+    """
+    _verificar_configuracao()
+    contexto = await run_in_threadpool(_montar_contexto, payload, db, current_user, current_tenant_id)
     service = AiAssistantService()
-    resposta = service.gerar_resposta(contexto, payload.mensagem)
-    return {"resposta": resposta}
+    chave = ai_cache.chave_resposta(current_tenant_id, service.model, contexto, payload.mensagem)
+    em_cache = await ai_cache.obter(chave)
+    if em_cache is not None:
+        async def do_cache():
+            yield _evento("trecho", {"texto": em_cache})
+            yield _evento("fim", {"cache": True})
+
+        return StreamingResponse(do_cache(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    # A vaga do tenant e reservada antes da resposta comecar (para responder 429) e
+    # liberada pelo gerador; a background task cobre desconexoes antes do primeiro trecho.
+    stack = AsyncExitStack()
+    try:
+        await stack.enter_async_context(limite_tenant(current_tenant_id))
+    except LimiteConcorrenciaExcedido:
+        raise _limite_excedido()
+
+    async def eventos():
+        async with stack:
+            trechos = []
+            try:
+                async for trecho in service.gerar_resposta_stream(contexto, payload.mensagem):
+                    trechos.append(trecho)
+                    yield _evento("trecho", {"texto": trecho})
+            except httpx.HTTPError:
+                yield _evento("erro", {"detail": "Falha ao consultar o assistente AI"})
+                return
+            # So respostas completas entram no cache
+            await ai_cache.guardar(chave, "".join(trechos))
+            yield _evento("fim", {"cache": False})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(stack.aclose),
+    )
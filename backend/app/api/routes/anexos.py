@@ -0,0 +1,195 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.api.deps import get_db_session, get_read_db_session
+from app.core.config import settings
+from app.dependencies import get_current_tenant_id, require_roles
+from app.models.entities import Role
+from app.schemas import base as schemas
+from app.services import anexo_storage, audit_log_service, minio_service
+
+router = APIRouter(tags=["anexos"])
+
+PAPEIS_ANEXO = (Role.CLINICO.value, Role.ADMIN_TENANT.value)
+
+
+def _atendimento_do_tenant(db: Session, atendimento_id: int, tenant_id: int) -> models.Atendimento:
+    atendimento = db.get(models.Atendimento, atendimento_id)
+    if not atendimento or atendimento.tenant_id != tenant_id:
+        raise HTTPException(status_code=404, detail="Atendimento nao encontrado")
+    return atendimento
+
+
+def _anexo_do_tenant(db: Session, anexo_id: int, tenant_id: int) -> models.AnexoClinico:
+    anexo = db.get(models.AnexoClinico, anexo_id)
+    if not anexo or anexo.tenant_id != tenant_id:
+        raise HTTPException(status_code=404, detail="Anexo nao encontrado")
+    return anexo
+
+
+def _registrar(db: Session, anexo: models.AnexoClinico, user_id: int, acao: str) -> models.AnexoClinico:
+    db.add(anexo)
+    db.commit()
+    db.refresh(anexo)
+    audit_log_service.log_action(
+        db, anexo.tenant_id, user_id, acao, "AnexoClinico", anexo.id, metadata={"sha256": anexo.hash, "tamanho": anexo.tamanho_bytes}
+    )
+    return anexo
+
+
+@router.put("/atendimentos/{atendimento_id}/anexos", response_model=schemas.AnexoClinico, status_code=201)
+async def upload_anexo(
+    atendimento_id: int,
+    request: Request,
+    tipo: str = Query(...),
+    nome_arquivo: str | None = Query(None),
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(*PAPEIS_ANEXO)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    Recebe o arquivo como corpo bruto da requisicao (Content-Type do proprio arquivo)
+    e o repassa em stream ao MinIO, calculando o SHA-256 no caminho.
+    """
+    await run_in_threadpool(_atendimento_do_tenant, db, atendimento_id, current_tenant_id)
+    declarado = request.headers.get("content-length")
+    if declarado and declarado.isdigit() and int(declarado) > anexo_storage.tamanho_maximo():
+        raise HTTPException(status_code=413, detail=f"Anexo maior que {settings.anexo_tamanho_maximo_mb} MB")
+
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    key = anexo_storage.anexo_key(current_tenant_id, atendimento_id)
+    try:
+        recebido = await anexo_storage.receber_stream(request.stream(), key, content_type)
+    except anexo_storage.TamanhoExcedido as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except minio_service.erros_s3():
+        raise HTTPException(status_code=502, detail="Falha ao gravar o anexo no armazenamento")
+
+    anexo = models.AnexoClinico(
+        tenant_id=current_tenant_id,
+        atendimento_id=atendimento_id,
+        tipo=tipo,
+        url=anexo_storage.url_objeto(key),
+        hash=recebido.sha256,
+        storage_key=key,
+        nome_arquivo=nome_arquivo,
+        content_type=content_type,
+        tamanho_bytes=recebido.tamanho_bytes,
+        status=anexo_storage.STATUS_DISPONIVEL,
+    )
+    return await run_in_threadpool(_registrar, db, anexo, current_user.id, "CRIAR_ANEXO")
+
+
+@router.post("/atendimentos/{atendimento_id}/anexos/upload-direto", status_code=201)
+def iniciar_upload_direto(
+    atendimento_id: int,
+    payload: schemas.AnexoUploadDireto,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(*PAPEIS_ANEXO)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    URL pre-assinada para o cliente enviar o arquivo direto ao MinIO. O anexo fica
+    `pendente` ate `POST /anexos/{id}/confirmar` conferir o hash declarado.
+    """
+    _atendimento_do_tenant(db, atendimento_id, current_tenant_id)
+    if payload.tamanho_bytes > anexo_storage.tamanho_maximo():
+        raise HTTPException(status_code=413, detail=f"Anexo maior que {settings.anexo_tamanho_maximo_mb} MB")
+    key = anexo_storage.anexo_key(current_tenant_id, atendimento_id)
+    url = minio_service.presign_put(key, payload.content_type, expires=settings.anexo_presign_expira_segundos)
+    if not url:
+        raise HTTPException(status_code=502, detail="Nao foi possivel assinar o upload")
+    anexo = models.AnexoClinico(
+        tenant_id=current_tenant_id,
+        atendimento_id=atendimento_id,
+        tipo=payload.tipo,
+        url=anexo_storage.url_objeto(key),
+        hash=payload.sha256.lower(),
+        storage_key=key,
+        nome_arquivo=payload.nome_arquivo,
+        content_type=payload.content_type,
+        tamanho_bytes=payload.tamanho_bytes,
+        status=anexo_storage.STATUS_PENDENTE,
+    )
+    db.add(anexo)
+    db.commit()
+    db.refresh(anexo)
+    return {
+        "anexo_id": anexo.id,
+        "upload_url": url,
+        "metodo": "PUT",
+        "headers": {"Content-Type": payload.content_type},
+        "expira_em_segundos": settings.anexo_presign_expira_segundos,
+    }
+
+
+def _rejeitar(db: Session, anexo: models.AnexoClinico, user_id: int, motivo: str) -> None:
+    minio_service.remover_objeto(anexo.storage_key)
+    anexo.status = anexo_storage.STATUS_REJEITADO
+    _registrar(db, anexo, user_id, "REJEITAR_ANEXO")
+    raise HTTPException(status_code=422, detail=motivo)
+
+
+@router.post("/anexos/{anexo_id}/confirmar", response_model=schemas.AnexoClinico)
+def confirmar_upload_direto(
+    anexo_id: int,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(*PAPEIS_ANEXO)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    Rele o objeto enviado e compara o SHA-256 calculado no servidor com o declarado.
+    O tamanho e conferido antes pelo HEAD: um objeto do tamanho errado e recusado sem
+    baixar o corpo.
+    """
+    anexo = _anexo_do_tenant(db, anexo_id, current_tenant_id)
+    if anexo.status != anexo_storage.STATUS_PENDENTE:
+        raise HTTPException(status_code=409, detail=f"Anexo ja {anexo.status}")
+    try:
+        tamanho = minio_service.tamanho_objeto(anexo.storage_key)
+        if tamanho != anexo.tamanho_bytes:
+            _rejeitar(db, anexo, current_user.id, "Tamanho do arquivo enviado difere do declarado")
+        calculado = anexo_storage.calcular_hash_objeto(anexo.storage_key)
+    except minio_service.erros_s3():
+        raise HTTPException(status_code=409, detail="Arquivo ainda nao enviado ao armazenamento")
+
+    if calculado.sha256 != anexo.hash or calculado.tamanho_bytes != anexo.tamanho_bytes:
+        _rejeitar(db, anexo, current_user.id, "Hash do arquivo enviado difere do declarado")
+    anexo.status = anexo_storage.STATUS_DISPONIVEL
+    return _registrar(db, anexo, current_user.id, "CRIAR_ANEXO")
+
+
+@router.get("/atendimentos/{atendimento_id}/anexos", response_model=List[schemas.AnexoClinico])
+def list_anexos(
+    atendimento_id: int,
+    db: Session = Depends(get_read_db_session),
+    _: models.Usuario = Depends(require_roles(*PAPEIS_ANEXO, Role.AUDITOR_INTERNO.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    stmt = (
+        select(models.AnexoClinico)
+        .where(models.AnexoClinico.tenant_id == current_tenant_id, models.AnexoClinico.atendimento_id == atendimento_id)
+        .order_by(models.AnexoClinico.id)
+    )
+    return db.scalars(stmt).all()
+
+
+@router.get("/anexos/{anexo_id}/download")
+def download_anexo(
+    anexo_id: int,
+    db: Session = Depends(get_read_db_session),
+    _: models.Usuario = Depends(require_roles(*PAPEIS_ANEXO, Role.AUDITOR_INTERNO.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    anexo = _anexo_do_tenant(db, anexo_id, current_tenant_id)
+    if anexo.status != anexo_storage.STATUS_DISPONIVEL or not anexo.storage_key:
+        raise HTTPException(status_code=409, detail="Anexo indisponivel")
+    url = minio_service.presign_get(anexo.storage_key)
+    if not url:
+        raise HTTPException(status_code=502, detail="Nao foi possivel assinar o download")
+    return {"url": url, "sha256": anexo.hash}
@@ -3,11 +3,12 @@ from typing import Optional
 
 import pyotp
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db_session
-from app.auth import authenticate_user, create_access_token, verify_password, get_password_hash
+from app.auth import authenticate_user_async, create_access_token, verify_password_async, get_password_hash_async
 from app.core.config import settings
 from app.dependencies import get_current_user
 from app import models
@@ -32,8 +33,8 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db_session)):
-    user, roles = authenticate_user(db, payload.email, payload.password, payload.tenant_id)
+async def login(payload: LoginRequest, db: Session = Depends(get_db_session)):
+    user, roles = await authenticate_user_async(db, payload.email, payload.password, payload.tenant_id)
     if user.mfa_enabled:
         if not user.mfa_secret:
             raise HTTPException(status_code=400, detail="MFA habilitado sem secret configurado")
@@ -57,20 +58,25 @@ class ChangePasswordRequest(BaseModel):
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     payload: ChangePasswordRequest,
     db: Session = Depends(get_db_session),
     current_user: models.Usuario = Depends(get_current_user),
 ):
-    if not verify_password(payload.senha_atual, current_user.hashed_password):
+    if not await verify_password_async(payload.senha_atual, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
-    current_user.hashed_password = get_password_hash(payload.senha_nova)
-    current_user.must_change_password = False
-    db.add(current_user)
-    db.commit()
+    hashed_password = await get_password_hash_async(payload.senha_nova)
+    await run_in_threadpool(_gravar_nova_senha, db, current_user, hashed_password)
     return {"status": "ok"}
 
 
+def _gravar_nova_senha(db: Session, user: models.Usuario, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    user.must_change_password = False
+    db.add(user)
+    db.commit()
+
+
 class MfaSetupResponse(BaseModel):
     otpauth_uri: str
 
@@ -5,13 +5,13 @@ from sqlalchemy.orm import Session
 
 from app import models
 from app.api.deps import get_db_session
-from app.dependencies import get_current_tenant_id, get_current_user, get_current_roles, require_roles
+from app.dependencies import get_current_tenant_id, get_current_user, get_current_roles, limitar_por_tenant, require_roles
 from app.services.cmd_service import CmdService
 
 router = APIRouter(prefix="/cmd", tags=["cmd"])
 
 
-@router.post("/contatos/sincronizar")
+@router.post("/contatos/sincronizar", dependencies=[Depends(limitar_por_tenant("cmd"))])
 def sincronizar_cmd(
     competencia: str,
     db: Session = Depends(get_db_session),
@@ -1,47 +1,39 @@
 ﻿from datetime import datetime, timedelta
-from pathlib import Path
+import time
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import StreamingResponse
 from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import hashlib
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.api.deps import get_db_session
+from app.api.deps import get_async_read_db_session, get_db_session, get_read_db_session
+from app.api.routes import exports
+from app.core import metrics
 from app import models
 from app.schemas import base as schemas
-from app.services import sigtap_rules
-from app.services import export_bpa, export_apac
-from app.services import minio_service
+from app.services import agenda_service
 from app.services import audit_log_service
+from app.services import auditoria_incremental
 from app.services import validators
+from app.services.export_pipeline import ContextoCompetencia
 from app.services.procedimento_validator import ProcedimentoValidatorService
 from app.dependencies import (
     apply_tenant_filter,
     ensure_same_tenant,
     get_current_tenant_id,
-    get_current_user,
+    get_current_user_async,
+    limitar_por_tenant,
     require_roles,
+    require_roles_async,
 )
 from app.models.entities import Role
 
 router = APIRouter()
 
 
-def _build_download_response(content: str, filename: str) -> StreamingResponse:
-    data = content.encode("ascii", errors="ignore")
-    return StreamingResponse(
-        iter([data]),
-        media_type="text/plain; charset=ascii",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"',
-            "Content-Length": str(len(data)),
-        },
-    )
-
-
 def _commit_and_refresh(db: Session, obj):
     db.add(obj)
     db.commit()
@@ -61,7 +53,7 @@ def create_tenant(
 
 @router.get("/tenants", response_model=List[schemas.Tenant])
 def list_tenants(
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     _: models.Usuario = Depends(require_roles(Role.SUPER_ADMIN.value)),
 ):
     return db.scalars(select(models.Tenant)).all()
@@ -83,12 +75,12 @@ def create_unidade(
 
 
 @router.get("/unidades", response_model=List[schemas.Unidade])
-def list_unidades(
-    db: Session = Depends(get_db_session),
+async def list_unidades(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     stmt = apply_tenant_filter(select(models.Unidade), models.Unidade, current_tenant_id)
-    return db.scalars(stmt).all()
+    return (await db.scalars(stmt)).all()
 
 
 @router.post("/profissionais", response_model=schemas.Profissional)
@@ -111,12 +103,12 @@ def create_profissional(
 
 
 @router.get("/profissionais", response_model=List[schemas.Profissional])
-def list_profissionais(
-    db: Session = Depends(get_db_session),
+async def list_profissionais(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     stmt = apply_tenant_filter(select(models.Profissional), models.Profissional, current_tenant_id)
-    return db.scalars(stmt).all()
+    return (await db.scalars(stmt)).all()
 
 
 @router.post("/pacientes", response_model=schemas.Paciente)
@@ -144,12 +136,12 @@ def create_paciente(
 
 
 @router.get("/pacientes", response_model=List[schemas.Paciente])
-def list_pacientes(
-    db: Session = Depends(get_db_session),
+async def list_pacientes(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     stmt = apply_tenant_filter(select(models.Paciente), models.Paciente, current_tenant_id)
-    return db.scalars(stmt).all()
+    return (await db.scalars(stmt)).all()
 
 
 @router.post("/agendas", response_model=schemas.Agenda)
@@ -167,23 +159,70 @@ def create_agenda(
     for ent in [unidade, profissional, paciente]:
         if ent and getattr(ent, "tenant_id", current_tenant_id) != current_tenant_id:
             raise HTTPException(status_code=403, detail="Referencia a outro tenant")
+    if data["status"] not in agenda_service.STATUS_INATIVOS:
+        _recusar_conflitos(db, current_tenant_id, data["profissional_id"], data["data"], data["duracao_minutos"])
     ag = models.Agenda(**data)
     obj = _commit_and_refresh(db, ag)
     audit_log_service.log_action(db, current_tenant_id, current_user.id, "CRIAR_AGENDA", "Agenda", obj.id)
     return obj
 
 
+def _recusar_conflitos(db: Session, tenant_id: int, profissional_id: int, inicio: datetime, duracao: int, ignorar_id=None):
+    conflitos = agenda_service.verificar_conflitos(db, tenant_id, profissional_id, inicio, duracao, ignorar_id=ignorar_id)
+    if conflitos:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Horario em conflito com a agenda {', '.join(map(str, conflitos))} do profissional",
+        )
+
+
 @router.get("/agendas", response_model=List[schemas.Agenda])
-def list_agendas(
-    db: Session = Depends(get_db_session),
+async def list_agendas(
+    de: datetime | None = Query(None),
+    ate: datetime | None = Query(None),
+    profissional_id: int | None = Query(None),
+    unidade_id: int | None = Query(None),
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     stmt = apply_tenant_filter(select(models.Agenda), models.Agenda, current_tenant_id)
-    return db.scalars(stmt).all()
+    if de is not None:
+        stmt = stmt.where(models.Agenda.data >= de)
+    if ate is not None:
+        stmt = stmt.where(models.Agenda.data < ate)
+    if profissional_id is not None:
+        stmt = stmt.where(models.Agenda.profissional_id == profissional_id)
+    if unidade_id is not None:
+        stmt = stmt.where(models.Agenda.unidade_id == unidade_id)
+    return (await db.scalars(stmt.order_by(models.Agenda.data, models.Agenda.id))).all()
+
+
+@router.get("/agendas/livres", response_model=List[schemas.Agenda])
+async def list_agendas_livres(
+    profissional_id: int | None = Query(None),
+    cbo: str | None = Query(None, description="Especialidade (CBO do profissional)"),
+    unidade_id: int | None = Query(None),
+    a_partir_de: datetime | None = Query(None),
+    limite: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db_session),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    if profissional_id is None and not cbo:
+        raise HTTPException(status_code=422, detail="Informe profissional_id ou cbo")
+    stmt = agenda_service.consulta_livres(
+        current_tenant_id,
+        a_partir_de or datetime.utcnow(),
+        limite,
+        profissional_id=profissional_id,
+        unidade_id=unidade_id,
+        cbo=cbo,
+    )
+    return (await db.scalars(stmt)).all()
 
 
 class AgendaUpdate(BaseModel):
     data: datetime | None = None
+    duracao_minutos: int | None = Field(None, ge=5, le=agenda_service.DURACAO_MAXIMA_MINUTOS)
     status: str | None = None
     paciente_id: int | None = None
 
@@ -201,10 +240,14 @@ def update_agenda(
         raise HTTPException(status_code=404, detail="Agenda nao encontrada")
     if payload.data:
         ag.data = payload.data
+    if payload.duracao_minutos:
+        ag.duracao_minutos = payload.duracao_minutos
     if payload.status:
         ag.status = payload.status
     if payload.paciente_id is not None:
         ag.paciente_id = payload.paciente_id
+    if (payload.data or payload.duracao_minutos or payload.status) and ag.status not in agenda_service.STATUS_INATIVOS:
+        _recusar_conflitos(db, current_tenant_id, ag.profissional_id, ag.data, ag.duracao_minutos, ignorar_id=ag.id)
     db.add(ag)
     db.commit()
     db.refresh(ag)
@@ -212,6 +255,81 @@ def update_agenda(
     return ag
 
 
+@router.post("/agendas/modelos", response_model=schemas.AgendaModelo)
+def create_agenda_modelo(
+    payload: schemas.AgendaModeloCreate,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(Role.RECEPCAO.value, Role.ADMIN_TENANT.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    unidade = db.get(models.Unidade, payload.unidade_id)
+    profissional = db.get(models.Profissional, payload.profissional_id)
+    for ent in [unidade, profissional]:
+        if not ent or ent.tenant_id != current_tenant_id:
+            raise HTTPException(status_code=403, detail="Referencia a outro tenant")
+    modelo = models.AgendaModelo(tenant_id=current_tenant_id, **payload.model_dump())
+    obj = _commit_and_refresh(db, modelo)
+    audit_log_service.log_action(db, current_tenant_id, current_user.id, "CRIAR_AGENDA_MODELO", "AgendaModelo", obj.id)
+    return obj
+
+
+@router.get("/agendas/modelos", response_model=List[schemas.AgendaModelo])
+async def list_agenda_modelos(
+    profissional_id: int | None = Query(None),
+    db: AsyncSession = Depends(get_async_read_db_session),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    stmt = apply_tenant_filter(select(models.AgendaModelo), models.AgendaModelo, current_tenant_id)
+    if profissional_id is not None:
+        stmt = stmt.where(models.AgendaModelo.profissional_id == profissional_id)
+    stmt = stmt.order_by(models.AgendaModelo.profissional_id, models.AgendaModelo.dia_semana, models.AgendaModelo.hora_inicio)
+    return (await db.scalars(stmt)).all()
+
+
+@router.delete("/agendas/modelos/{modelo_id}", status_code=204)
+def delete_agenda_modelo(
+    modelo_id: int,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(Role.RECEPCAO.value, Role.ADMIN_TENANT.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    modelo = db.get(models.AgendaModelo, modelo_id)
+    if not modelo or modelo.tenant_id != current_tenant_id:
+        raise HTTPException(status_code=404, detail="Modelo de agenda nao encontrado")
+    db.delete(modelo)
+    db.commit()
+    audit_log_service.log_action(db, current_tenant_id, current_user.id, "REMOVER_AGENDA_MODELO", "AgendaModelo", modelo_id)
+
+
+@router.post("/agendas/gerar")
+def gerar_agendas(
+    payload: schemas.AgendaGeracao,
+    db: Session = Depends(get_db_session),
+    current_user: models.Usuario = Depends(require_roles(Role.RECEPCAO.value, Role.ADMIN_TENANT.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    Gera as agendas livres do periodo a partir dos modelos, num insert em lote e com
+    um unico registro de auditoria.
+    """
+    try:
+        resultado = agenda_service.gerar_agendas(
+            db, current_tenant_id, payload.de, payload.ate, profissional_ids=payload.profissional_ids
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    # log_action faz o commit das agendas junto com a auditoria
+    audit_log_service.log_action(
+        db,
+        current_tenant_id,
+        current_user.id,
+        "GERAR_AGENDA",
+        "Agenda",
+        metadata={"de": payload.de.isoformat(), "ate": payload.ate.isoformat(), **resultado},
+    )
+    return resultado
+
+
 @router.post("/atendimentos", response_model=schemas.Atendimento)
 def create_atendimento(
     payload: schemas.AtendimentoCreate,
@@ -234,12 +352,12 @@ def create_atendimento(
 
 
 @router.get("/atendimentos", response_model=List[schemas.Atendimento])
-def list_atendimentos(
-    db: Session = Depends(get_db_session),
+async def list_atendimentos(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     stmt = apply_tenant_filter(select(models.Atendimento), models.Atendimento, current_tenant_id)
-    return db.scalars(stmt).all()
+    return (await db.scalars(stmt)).all()
 
 
 @router.post("/evolucoes", response_model=schemas.Evolucao)
@@ -276,13 +394,13 @@ def create_evolucao(
 
 
 @router.get("/evolucoes", response_model=List[schemas.Evolucao])
-def list_evolucoes(
-    db: Session = Depends(get_db_session),
+async def list_evolucoes(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
-    _: models.Usuario = Depends(require_roles(Role.CLINICO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value)),
+    _: models.Usuario = Depends(require_roles_async(Role.CLINICO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value)),
 ):
     stmt = apply_tenant_filter(select(models.EvolucaoProntuario), models.EvolucaoProntuario, current_tenant_id)
-    return db.scalars(stmt).all()
+    return (await db.scalars(stmt)).all()
 
 
 @router.post("/procedimentos", response_model=schemas.Procedimento)
@@ -322,69 +440,86 @@ def create_procedimento(
 
 
 @router.get("/procedimentos", response_model=List[schemas.Procedimento])
-def list_procedimentos(
-    db: Session = Depends(get_db_session),
+async def list_procedimentos(
+    db: AsyncSession = Depends(get_async_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
-    _: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value, Role.CLINICO.value)),
+    _: models.Usuario = Depends(require_roles_async(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value, Role.CLINICO.value)),
 ):
     stmt = apply_tenant_filter(select(models.ProcedimentoSUS), models.ProcedimentoSUS, current_tenant_id)
-    return db.scalars(stmt).all()
-
-
-def _competencia_aberta(db: Session, unidade_cnes: str, competencia: str) -> bool:
-    stmt = select(models.CompetenciaAberta).where(
-        models.CompetenciaAberta.unidade_cnes == unidade_cnes,
-        models.CompetenciaAberta.competencia == competencia,
-        models.CompetenciaAberta.aberta.is_(True),
-    )
-    return db.scalars(stmt).first() is not None
-
-
-def _audit_proc(db: Session, proc: models.ProcedimentoSUS):
-    atendimento = db.get(models.Atendimento, proc.atendimento_id)
-    paciente = db.get(models.Paciente, atendimento.paciente_id)
-    profissional = db.get(models.Profissional, atendimento.profissional_id)
-    unidade = db.get(models.Unidade, atendimento.unidade_id)
-    tabela = sigtap_rules.get_tabela_para_competencia(db, proc.sigtap_codigo, proc.competencia_aaaamm)
-    data_at = atendimento.data.date() if isinstance(atendimento.data, datetime) else atendimento.data
-    erros = sigtap_rules.validate_procedimento(db, paciente, proc, unidade, profissional, data_at, tabela_proc=tabela)
-    competencia_ok = _competencia_aberta(db, unidade.cnes, proc.competencia_aaaamm)
-    if not competencia_ok:
-        erros.append("competencia_fechada")
-    return erros
+    return (await db.scalars(stmt)).all()
 
 
-def audit_competencia_for_tenant(aaaamm: str, tenant_id: int, db: Session):
-    stmt = select(models.ProcedimentoSUS).where(
-        models.ProcedimentoSUS.competencia_aaaamm == aaaamm,
-        models.ProcedimentoSUS.tenant_id == tenant_id,
-    )
-    procedimentos = db.scalars(stmt).all()
-    resultado = []
-    for proc in procedimentos:
-        erros = _audit_proc(db, proc)
-        resultado.append({"procedimento_id": proc.id, "erros": erros})
-    return {"competencia": aaaamm, "erros": resultado}
+def audit_competencia_for_tenant(
+    aaaamm: str, tenant_id: int, db: Session, incremental: bool = False, persistir: bool = True
+):
+    """
+    Audita a competencia do tenant e, com `persistir`, grava o snapshot do resultado
+    e consome as pendencias incorporadas.
+
+    No modo incremental, apenas os procedimentos marcados como pendentes desde o
+    ultimo snapshot sao revalidados; sem snapshot, cai para a auditoria completa.
+    """
+    inicio = time.perf_counter()
+    pendencias = auditoria_incremental.pendencias(db, tenant_id, aaaamm)
+    erros_por_proc = auditoria_incremental.carregar_snapshot(db, tenant_id, aaaamm) if incremental else None
+    if erros_por_proc is None:
+        incremental = False
+        erros_por_proc = {}
+        contexto = ContextoCompetencia.carregar(db, tenant_id, aaaamm)
+    else:
+        for proc_id in pendencias:
+            erros_por_proc.pop(proc_id, None)
+        contexto = ContextoCompetencia.carregar(db, tenant_id, aaaamm, procedimento_ids=pendencias)
+    for item in contexto.itens:
+        erros_por_proc[item.proc.id] = contexto.auditar(item)
+    if persistir:
+        auditoria_incremental.salvar_snapshot(db, tenant_id, aaaamm, erros_por_proc, pendencias)
+    modo = "incremental" if incremental else "completa"
+    metrics.AUDITORIA_SEGUNDOS.labels(modo=modo, tenant_id=str(tenant_id)).observe(time.perf_counter() - inicio)
+    metrics.AUDITORIA_PROCEDIMENTOS.labels(modo=modo, tenant_id=str(tenant_id)).inc(len(contexto.itens))
+    metrics.contar_erros_auditoria(tenant_id, (e for erros in erros_por_proc.values() for e in erros))
+    resultado = [{"procedimento_id": proc_id, "erros": erros} for proc_id, erros in sorted(erros_por_proc.items())]
+    return {
+        "competencia": aaaamm,
+        "erros": resultado,
+        "incremental": incremental,
+        "revalidados": len(contexto.itens),
+    }
 
 
-@router.get("/audit/competencia/{aaaamm}")
+@router.get("/audit/competencia/{aaaamm}", dependencies=[Depends(limitar_por_tenant("auditoria"))])
 def audit_competencia(
     aaaamm: str,
+    incremental: bool = Query(False),
     db: Session = Depends(get_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
     _: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value)),
 ):
-    return audit_competencia_for_tenant(aaaamm, current_tenant_id, db)
+    """
+    Consulta a auditoria sem escrever no banco; no modo incremental parte do ultimo
+    snapshot gravado. Para gravar o snapshot use o POST.
+    """
+    return audit_competencia_for_tenant(aaaamm, current_tenant_id, db, incremental=incremental, persistir=False)
 
 
-def _garante_dir(path: Path):
-    path.parent.mkdir(parents=True, exist_ok=True)
+@router.post("/audit/competencia/{aaaamm}", dependencies=[Depends(limitar_por_tenant("auditoria"))])
+def registrar_audit_competencia(
+    aaaamm: str,
+    incremental: bool = Query(False),
+    db: Session = Depends(get_db_session),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+    _: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.AUDITOR_INTERNO.value)),
+):
+    """
+    Audita, grava o snapshot e consome as pendencias incorporadas.
+    """
+    return audit_competencia_for_tenant(aaaamm, current_tenant_id, db, incremental=incremental, persistir=True)
 
 
 @router.get("/core/dashboard")
-def dashboard(
-    db: Session = Depends(get_db_session),
-    current_user: models.Usuario = Depends(get_current_user),
+async def dashboard(
+    db: AsyncSession = Depends(get_async_read_db_session),
+    current_user: models.Usuario = Depends(get_current_user_async),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
     today = datetime.utcnow()
@@ -392,7 +527,7 @@ def dashboard(
     start_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     next_month = (start_month + timedelta(days=32)).replace(day=1)
 
-    total_atendimentos = db.scalar(
+    total_atendimentos = await db.scalar(
         select(func.count()).where(
             models.Atendimento.tenant_id == current_tenant_id,
             models.Atendimento.data >= start_month,
@@ -400,7 +535,7 @@ def dashboard(
         )
     ) or 0
 
-    total_pacientes = db.scalar(
+    total_pacientes = await db.scalar(
         select(func.count(func.distinct(models.Atendimento.paciente_id))).where(
             models.Atendimento.tenant_id == current_tenant_id,
             models.Atendimento.data >= start_month,
@@ -408,7 +543,7 @@ def dashboard(
         )
     ) or 0
 
-    total_procedimentos = db.scalar(
+    total_procedimentos = await db.scalar(
         select(func.count()).where(
             models.ProcedimentoSUS.tenant_id == current_tenant_id,
             models.ProcedimentoSUS.competencia_aaaamm == competencia,
@@ -416,7 +551,7 @@ def dashboard(
     ) or 0
 
     ok_field = models.ProcedimentoSUS.validacoes_json["ok"].as_boolean()
-    total_procedimentos_com_erro = db.scalar(
+    total_procedimentos_com_erro = await db.scalar(
         select(func.count()).where(
             models.ProcedimentoSUS.tenant_id == current_tenant_id,
             models.ProcedimentoSUS.competencia_aaaamm == competencia,
@@ -424,18 +559,18 @@ def dashboard(
         )
     ) or 0
 
-    exp_bpa = db.scalars(
+    exp_bpa = (await db.scalars(
         select(models.ExportacaoBPA)
         .where(models.ExportacaoBPA.tenant_id == current_tenant_id)
         .order_by(models.ExportacaoBPA.id.desc())
         .limit(3)
-    ).all()
-    exp_apac = db.scalars(
+    )).all()
+    exp_apac = (await db.scalars(
         select(models.ExportacaoAPAC)
         .where(models.ExportacaoAPAC.tenant_id == current_tenant_id)
         .order_by(models.ExportacaoAPAC.id.desc())
         .limit(3)
-    ).all()
+    )).all()
 
     def _map_exp(exp):
         return {
@@ -459,7 +594,7 @@ def dashboard(
     }
 
 
-@router.api_route("/exports/bpa", methods=["GET", "POST"])
+@router.api_route("/exports/bpa", methods=["GET", "POST"], dependencies=[Depends(limitar_por_tenant("exportacao"))])
 def export_bpa_endpoint(
     request: Request,
     competencia: str = Query(..., min_length=6, max_length=6),
@@ -469,11 +604,8 @@ def export_bpa_endpoint(
     current_user: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
-    audit = audit_competencia_for_tenant(competencia, current_tenant_id, db=db)
-    erros_globais = [e for item in audit["erros"] for e in item["erros"] if e]
-    if erros_globais:
-        raise HTTPException(status_code=400, detail={"erros": erros_globais})
-    conteudo, path = exports._generate_bpa(
+    artefato = exports.auditar_e_gerar(
+        "bpa",
         competencia=competencia,
         tenant_id=current_tenant_id,
         db=db,
@@ -482,28 +614,22 @@ def export_bpa_endpoint(
     )
 
     unidade_ref = db.scalars(select(models.Unidade).where(models.Unidade.tenant_id == current_tenant_id)).first()
-    exp = models.ExportacaoBPA(
-        tenant_id=current_tenant_id,
-        competencia=competencia,
-        unidade_id=unidade_ref.id if unidade_ref else None,
-        arquivo_path=path,
-        checksum="",
-        status="gerado",
-        erros_json={},
+    exp = exports.registrar_exportacao(
+        db, "bpa", current_tenant_id, competencia, unidade_ref.id if unidade_ref else None, artefato
+    )
+    audit_log_service.log_action(
+        db, current_tenant_id, current_user.id, "EXPORTAR_BPA", "ExportacaoBPA", exp.id, {"cache": artefato.cache}
     )
-    db.add(exp)
-    db.commit()
-    audit_log_service.log_action(db, current_tenant_id, current_user.id, "EXPORTAR_BPA", "ExportacaoBPA", exp.id)
 
     accept = request.headers.get("accept", "")
     if "application/json" in accept:
-        return {"url": path, "preview": conteudo[:400]}
+        return {"url": artefato.path, "preview": artefato.preview()}
 
     filename = f"BPA_{competencia}.rem"
-    return _build_download_response(conteudo, filename)
+    return exports.servir_arquivo(request, artefato.arquivo_local, filename)
 
 
-@router.api_route("/exports/apac", methods=["GET", "POST"])
+@router.api_route("/exports/apac", methods=["GET", "POST"], dependencies=[Depends(limitar_por_tenant("exportacao"))])
 def export_apac_endpoint(
     request: Request,
     competencia: str = Query(..., min_length=6, max_length=6),
@@ -511,129 +637,15 @@ def export_apac_endpoint(
     current_user: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
-    audit = audit_competencia_for_tenant(competencia, current_tenant_id, db=db)
-    erros_globais = [e for item in audit["erros"] for e in item["erros"] if e]
-    if erros_globais:
-        raise HTTPException(status_code=400, detail={"erros": erros_globais})
-    procedimentos = db.scalars(select(models.ProcedimentoSUS).where(
-        models.ProcedimentoSUS.competencia_aaaamm == competencia,
-        models.ProcedimentoSUS.tenant_id == current_tenant_id,
-    )).all()
-    procedimentos_apac = []
-    for proc in procedimentos:
-        tabela = sigtap_rules.get_tabela_para_competencia(db, proc.sigtap_codigo, proc.competencia_aaaamm)
-        if tabela and tabela.exige_apac:
-            procedimentos_apac.append(proc)
-    if not procedimentos_apac:
-        raise HTTPException(status_code=400, detail="Nenhum procedimento exige APAC nesta competencia")
-    proc = procedimentos_apac[0]
-    atendimento = db.get(models.Atendimento, proc.atendimento_id)
-    paciente = db.get(models.Paciente, atendimento.paciente_id)
-    profissional = db.get(models.Profissional, atendimento.profissional_id)
-    unidade = db.get(models.Unidade, atendimento.unidade_id)
-    corpo = {
-        "competencia": competencia,
-        "numero_apac": "0000000000001",
-        "uf": unidade.uf,
-        "cnes": unidade.cnes,
-        "data_autorizacao": atendimento.data.strftime("%Y%m%d"),
-        "data_validade": atendimento.data.strftime("%Y%m%d"),
-        "tipo_atendimento": "01",
-        "tipo_apac": "01",
-        "cns_paciente": paciente.cns,
-        "nome_paciente": paciente.nome,
-        "nome_mae": paciente.nome_mae or "",
-        "logradouro": (paciente.contato or {}).get("logradouro", "logradouro"),
-        "numero_endereco": str((paciente.contato or {}).get("numero", "0")),
-        "complemento": (paciente.contato or {}).get("complemento", ""),
-        "cep": str((paciente.contato or {}).get("cep", "0")),
-        "municipio_ibge": unidade.ibge_cod,
-        "data_nascimento": paciente.data_nascimento.strftime("%Y%m%d"),
-        "sexo": paciente.sexo,
-        "nome_medico_responsavel": profissional.nome,
-        "procedimento_principal": proc.sigtap_codigo,
-        "motivo_saida": "01",
-        "data_obito_alta": "",
-        "nome_autorizador": profissional.nome,
-        "cns_medico_resp": profissional.cns,
-        "cns_autorizador": profissional.cns,
-        "cid_associado": proc.cid10,
-        "num_prontuario": str(atendimento.id).zfill(10),
-        "cnes_solicitante": unidade.cnes,
-        "data_solicitacao": atendimento.data.strftime("%Y%m%d"),
-        "data_autorizacao": atendimento.data.strftime("%Y%m%d"),
-        "codigo_emissor": proc.sigtap_codigo,
-        "carater_atendimento": "01",
-        "apac_anterior": "",
-        "raca_cor": (paciente.contato or {}).get("raca_cor", "99"),
-        "nome_responsavel": paciente.nome_mae or paciente.nome,
-        "nacionalidade": (paciente.contato or {}).get("nacionalidade", "010"),
-        "etnia": (paciente.contato or {}).get("etnia", "") if (paciente.contato or {}).get("raca_cor") == "05" else "",
-        "cod_logradouro_ibge": (paciente.contato or {}).get("tipo_logradouro", "001"),
-        "bairro": (paciente.contato or {}).get("bairro", "bairro"),
-        "ddd": (paciente.contato or {}).get("ddd", ""),
-        "fone": (paciente.contato or {}).get("fone", ""),
-        "email": (paciente.contato or {}).get("email", ""),
-        "cns_executor": profissional.cns,
-        "cpf_paciente": paciente.cpf or "",
-        "ine": unidade.ibge_cod,
-        "pessoa_rua": (paciente.contato or {}).get("pessoa_rua", ""),
-        "fonte_orc": "",
-        "emenda": "",
-        "fim": "  ",
-        "data_processamento": atendimento.data.strftime("%Y%m%d"),
-        "data_inicio_validade": atendimento.data.strftime("%Y%m%d"),
-        "data_fim_validade": atendimento.data.strftime("%Y%m%d"),
-        "tipo_atendimento": "01",
-        "tipo_apac": "1",
-    }
-    procs = []
-    for proc in procedimentos_apac:
-        procs.append({
-            "competencia": competencia,
-            "numero_apac": corpo["numero_apac"],
-            "codigo": proc.sigtap_codigo,
-            "quantidade": proc.quantidade,
-            "cbo": proc.profissional_cbo,
-        })
-    conteudo = export_apac.gerar_arquivo(
-        competencia=competencia,
-        orgao="CER",
-        sigla="CER",
-        cnpj="00000000000000",
-        destino="SES",
-        versao="0.1.0",
-        corpo=corpo,
-        procedimentos=procs,
-    )
-    destino_path = Path("exports/apac") / f"apac_{competencia}.rem"
-    _garante_dir(destino_path)
-    destino_path.write_text(conteudo, encoding="utf-8")
-    key = f"exports/apac/apac_{competencia}.rem"
-    uploaded_key = minio_service.upload_bytes(key, conteudo.encode("ascii", errors="ignore"))
-    presigned = minio_service.presign_get(uploaded_key) if uploaded_key else None
-    exp = models.ExportacaoAPAC(
-        tenant_id=current_tenant_id,
-        competencia=competencia,
-        unidade_id=unidade.id,
-        arquivo_path=presigned or str(destino_path),
-        checksum="",
-        status="gerado",
-        erros_json={},
+    artefato = exports.auditar_e_gerar("apac", competencia=competencia, tenant_id=current_tenant_id, db=db)
+    exp = exports.registrar_exportacao(db, "apac", current_tenant_id, competencia, artefato.unidade_id, artefato)
+    audit_log_service.log_action(
+        db, current_tenant_id, current_user.id, "EXPORTAR_APAC", "ExportacaoAPAC", exp.id, {"cache": artefato.cache}
     )
-    db.add(exp)
-    db.commit()
-    audit_log_service.log_action(db, current_tenant_id, current_user.id, "EXPORTAR_APAC", "ExportacaoAPAC", exp.id)
 
     accept = request.headers.get("accept", "")
     if "application/json" in accept:
-        return {"url": presigned or str(destino_path), "preview": conteudo[:400]}
+        return {"url": artefato.path, "preview": artefato.preview()}
 
     filename = f"APAC_{competencia}.rem"
-    return _build_download_response(conteudo, filename)
-
-
-
-
-
-
+    return exports.servir_arquivo(request, artefato.arquivo_local, filename)
@@ -1,22 +1,213 @@
-from datetime import datetime
+import time
 from pathlib import Path
-from typing import Literal, Optional, List, Dict
+from typing import Iterator, Literal, NamedTuple, Optional, List, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app import models
-from app.api.deps import get_db_session
-from app.dependencies import get_current_tenant_id, require_roles
+from app.api.deps import get_db_session, get_read_db_session
+from app.core import metrics
+from app.dependencies import get_current_tenant_id, limitar_por_tenant, require_roles
 from app.models.entities import Role
-from app.services import audit_log_service, export_bpa, export_apac, minio_service, sigtap_rules
+from app.services import (
+    audit_log_service,
+    export_bpa,
+    export_apac,
+    export_pipeline,
+    export_storage,
+    minio_service,
+)
+from app.services.export_pipeline import ContextoCompetencia, ItemCompetencia
 
 router = APIRouter(prefix="/exports", tags=["exports"])
 
+MODELOS_EXPORTACAO = {"bpa": models.ExportacaoBPA, "apac": models.ExportacaoAPAC}
+BPA_PARAMETROS = {"orgao": "CER", "sigla": "CER", "cnpj": "00000000000000", "destino": "M", "versao": "0.1.0"}
+APAC_PARAMETROS = {"orgao": "CER", "sigla": "CER", "cnpj": "00000000000000", "destino": "SES", "versao": "0.1.0"}
+# Numero fixo que a rota /exports/apac sempre gravou na remessa
+NUMERO_APAC_EXPORTACAO = "0000000000001"
 
-def _garante_dir(path: Path):
-    path.parent.mkdir(parents=True, exist_ok=True)
+
+CHUNK_SIZE = 64 * 1024
+MEDIA_TYPE_REMESSA = "text/plain; charset=ascii"
+
+
+class ArtefatoExportacao(NamedTuple):
+    arquivo_local: Path
+    path: str
+    entrada_hash: str
+    arquivo_hash: str
+    cache: bool = False
+    unidade_id: int | None = None
+    conteudo: str | None = None  # presente apenas quando o arquivo acabou de ser gerado
+    tamanho_bytes: int | None = None
+    tamanho_comprimido: int | None = None
+    storage_key: str | None = None
+
+    def ler_conteudo(self) -> str:
+        if self.conteudo is not None:
+            return self.conteudo
+        return self.arquivo_local.read_bytes().decode("ascii")
+
+    def preview(self, tamanho: int = 400) -> str:
+        if self.conteudo is not None:
+            return self.conteudo[:tamanho]
+        with self.arquivo_local.open("rb") as fh:
+            return fh.read(tamanho).decode("ascii")
+
+
+def _artefato_em_cache(db: Session, tipo: str, tenant_id: int, entrada_hash: str) -> Optional[ArtefatoExportacao]:
+    model = MODELOS_EXPORTACAO[tipo]
+    exp = db.scalars(
+        select(model)
+        .where(
+            model.tenant_id == tenant_id,
+            model.entrada_hash == entrada_hash,
+            model.status == "gerado",
+        )
+        .order_by(model.id.desc())
+    ).first()
+    if not exp or not exp.checksum:
+        return None
+    arquivo_local = export_storage.caminho_local(tipo, tenant_id, exp.checksum)
+    if not arquivo_local.is_file():
+        # Arquivo local perdido (restart, redeploy, outra replica): reaproveita o objeto do MinIO
+        arquivo_local = export_storage.restaurar(tipo, tenant_id, exp.checksum, exp.storage_key)
+        if arquivo_local is None:
+            return None
+    return ArtefatoExportacao(
+        arquivo_local=arquivo_local,
+        path=export_storage.url_artefato(tipo, tenant_id, exp.checksum, exp.storage_key),
+        entrada_hash=entrada_hash,
+        arquivo_hash=exp.checksum,
+        cache=True,
+        unidade_id=exp.unidade_id,
+        tamanho_bytes=exp.tamanho_bytes,
+        tamanho_comprimido=exp.tamanho_comprimido,
+        storage_key=exp.storage_key,
+    )
+
+
+def _materializar(tipo: str, tenant_id: int, entrada_hash: str, conteudo: str, unidade_id: int | None = None) -> ArtefatoExportacao:
+    arquivo = export_storage.persistir(tipo, tenant_id, conteudo.encode("ascii", errors="ignore"))
+    return ArtefatoExportacao(
+        arquivo_local=export_storage.caminho_local(tipo, tenant_id, arquivo.arquivo_hash),
+        path=arquivo.url,
+        entrada_hash=entrada_hash,
+        arquivo_hash=arquivo.arquivo_hash,
+        unidade_id=unidade_id,
+        conteudo=conteudo,
+        tamanho_bytes=arquivo.tamanho_bytes,
+        tamanho_comprimido=arquivo.tamanho_comprimido,
+        storage_key=arquivo.storage_key,
+    )
+
+
+def _observar_geracao(tipo: str, tenant_id: int, inicio: float, linhas: int, artefato: ArtefatoExportacao) -> ArtefatoExportacao:
+    metrics.EXPORT_GERACAO_SEGUNDOS.labels(
+        tipo=tipo, tenant_id=str(tenant_id), cache=str(artefato.cache).lower()
+    ).observe(time.perf_counter() - inicio)
+    metrics.EXPORT_LINHAS.labels(tipo=tipo, tenant_id=str(tenant_id)).inc(linhas)
+    return artefato
+
+
+def _parse_range(header: str, tamanho: int) -> Optional[tuple[int, int]]:
+    """
+    Interpreta um unico intervalo `bytes=inicio-fim`. Retorna None para cabecalhos que
+    devem ser ignorados (formato desconhecido, multiplos intervalos) e levanta ValueError
+    quando o intervalo nao pode ser atendido.
+    """
+    unidade, _, faixa = header.partition("=")
+    if unidade.strip().lower() != "bytes" or "," in faixa:
+        return None
+    inicio_txt, sep, fim_txt = faixa.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        inicio = int(inicio_txt) if inicio_txt else None
+        fim = int(fim_txt) if fim_txt else None
+    except ValueError:
+        return None
+    if tamanho == 0:
+        # Arquivo vazio nao tem nenhum byte enderecavel
+        raise ValueError("arquivo vazio")
+    if inicio is None:
+        if not fim:
+            raise ValueError("intervalo vazio")
+        return max(tamanho - fim, 0), tamanho - 1
+    fim = tamanho - 1 if fim is None else fim
+    if inicio >= tamanho or fim < inicio:
+        raise ValueError("intervalo fora do arquivo")
+    return inicio, min(fim, tamanho - 1)
+
+
+def _iter_arquivo(path: Path, inicio: int, fim: int) -> Iterator[bytes]:
+    with path.open("rb") as fh:
+        fh.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            chunk = fh.read(min(CHUNK_SIZE, restante))
+            if not chunk:
+                break
+            restante -= len(chunk)
+            yield chunk
+
+
+def _aceita_gzip(request: Request) -> bool:
+    for item in request.headers.get("accept-encoding", "").split(","):
+        codificacao, _, params = item.strip().partition(";")
+        if codificacao.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def servir_arquivo(request: Request, path: Path, filename: str) -> Response:
+    """
+    Serve a remessa direto do disco (FileResponse), com suporte a Range de um intervalo.
+    Sem Range, clientes que aceitam gzip recebem o .gz pre-comprimido.
+    """
+    tamanho = path.stat().st_size
+    header_range = request.headers.get("range")
+    gz_path = export_storage.caminho_gzip(path)
+    if not header_range and _aceita_gzip(request) and gz_path.is_file():
+        return FileResponse(
+            gz_path,
+            media_type=MEDIA_TYPE_REMESSA,
+            filename=filename,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    if header_range:
+        try:
+            faixa = _parse_range(header_range, tamanho)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{tamanho}"})
+        if faixa:
+            inicio, fim = faixa
+            return StreamingResponse(
+                _iter_arquivo(path, inicio, fim),
+                status_code=206,
+                media_type=MEDIA_TYPE_REMESSA,
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"',
+                    "Content-Range": f"bytes {inicio}-{fim}/{tamanho}",
+                    "Content-Length": str(fim - inicio + 1),
+                    "Accept-Ranges": "bytes",
+                },
+            )
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPE_REMESSA,
+        filename=filename,
+        headers={"Accept-Ranges": "bytes", "Vary": "Accept-Encoding"},
+    )
+
+
+def servir_zip(path: Path, filename: str) -> FileResponse:
+    zip_path = export_storage.empacotar_zip(path, filename)
+    return FileResponse(zip_path, media_type="application/zip", filename=f"{Path(filename).stem}.zip")
 
 
 def _coletar_procedimentos_bpa(
@@ -25,49 +216,10 @@ def _coletar_procedimentos_bpa(
     db: Session,
     unidade_id: int | None = None,
     profissional_id: int | None = None,
+    contexto: ContextoCompetencia | None = None,
 ) -> List[Dict[str, str]]:
-    stmt = select(models.ProcedimentoSUS).where(
-        models.ProcedimentoSUS.competencia_aaaamm == competencia,
-        models.ProcedimentoSUS.tenant_id == tenant_id,
-    )
-    procedimentos = db.scalars(stmt).all()
-    linhas: List[Dict[str, str]] = []
-    for proc in procedimentos:
-        atendimento = db.get(models.Atendimento, proc.atendimento_id)
-        if not atendimento:
-            continue
-        if unidade_id and atendimento.unidade_id != unidade_id:
-            continue
-        if profissional_id and atendimento.profissional_id != profissional_id:
-            continue
-        paciente = db.get(models.Paciente, atendimento.paciente_id)
-        profissional = db.get(models.Profissional, atendimento.profissional_id)
-        unidade = db.get(models.Unidade, atendimento.unidade_id)
-        if not paciente or not profissional or not unidade:
-            continue
-        tabela = sigtap_rules.get_tabela_para_competencia(db, proc.sigtap_codigo, proc.competencia_aaaamm)
-        doc = sigtap_rules.decide_documento_bpa(paciente, tabela)
-        valor_procedimento = 0
-        if proc.valores and proc.valores.get("valor") is not None:
-            valor_procedimento = proc.valores.get("valor")
-        elif tabela and tabela.valor is not None:
-            valor_procedimento = float(tabela.valor)
-        linhas.append({
-            "cnes": unidade.cnes,
-            "competencia": proc.competencia_aaaamm,
-            "cns_prof": profissional.cns,
-            "cbo": proc.profissional_cbo,
-            "data_atendimento": atendimento.data.strftime("%Y%m%d"),
-            "procedimento": proc.sigtap_codigo,
-            "cns_paciente": paciente.cns if doc == "CNS" else "",
-            "cpf_paciente": paciente.cpf if doc == "CPF" else "",
-            "sexo": paciente.sexo,
-            "cid": proc.cid10,
-            "idade": sigtap_rules.calcular_idade(paciente.data_nascimento, atendimento.data.date()),
-            "quantidade": proc.quantidade,
-            "valor": valor_procedimento,
-        })
-    return linhas
+    contexto = contexto or ContextoCompetencia.carregar(db, tenant_id, competencia)
+    return [export_pipeline.linha_bpa(item) for item in contexto.filtrar(unidade_id, profissional_id)]
 
 
 def _generate_bpa(
@@ -77,25 +229,33 @@ def _generate_bpa(
     unidade_id: int | None = None,
     profissional_id: int | None = None,
 ) -> tuple[str, str]:
-    procedimentos = _coletar_procedimentos_bpa(competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id)
+    artefato = _gerar_artefato_bpa(competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id)
+    return artefato.ler_conteudo(), artefato.path
+
+
+def _gerar_artefato_bpa(
+    competencia: str,
+    tenant_id: int,
+    db: Session,
+    unidade_id: int | None = None,
+    profissional_id: int | None = None,
+    contexto: ContextoCompetencia | None = None,
+) -> ArtefatoExportacao:
+    inicio = time.perf_counter()
+    procedimentos = _coletar_procedimentos_bpa(
+        competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id, contexto=contexto
+    )
     if not procedimentos:
         raise HTTPException(status_code=400, detail="Nenhum procedimento encontrado para a competencia")
 
-    conteudo = export_bpa.gerar_arquivo(
-        competencia=competencia,
-        orgao="CER",
-        sigla="CER",
-        cnpj="00000000000000",
-        destino="M",
-        versao="0.1.0",
-        procedimentos=procedimentos,
-    )
-    destino_path = Path("exports/bpa") / f"bpa_{competencia}.rem"
-    _garante_dir(destino_path)
-    destino_path.write_text(conteudo, encoding="utf-8")
-    uploaded_key = minio_service.upload_bytes(f"exports/bpa/bpa_{competencia}.rem", conteudo.encode("ascii", errors="ignore"))
-    presigned = minio_service.presign_get(uploaded_key) if uploaded_key else None
-    return conteudo, presigned or str(destino_path)
+    entrada_hash = export_storage.digest_entrada("bpa", competencia, {"parametros": BPA_PARAMETROS, "procedimentos": procedimentos})
+    em_cache = _artefato_em_cache(db, "bpa", tenant_id, entrada_hash)
+    if em_cache:
+        return _observar_geracao("bpa", tenant_id, inicio, len(procedimentos), em_cache)
+
+    conteudo = export_bpa.gerar_arquivo(competencia=competencia, procedimentos=procedimentos, **BPA_PARAMETROS)
+    artefato = _materializar("bpa", tenant_id, entrada_hash, conteudo)
+    return _observar_geracao("bpa", tenant_id, inicio, len(procedimentos), artefato)
 
 
 def _coletar_procedimentos_apac(
@@ -104,25 +264,10 @@ def _coletar_procedimentos_apac(
     db: Session,
     unidade_id: int | None = None,
     profissional_id: int | None = None,
-) -> List[models.ProcedimentoSUS]:
-    stmt = select(models.ProcedimentoSUS).where(
-        models.ProcedimentoSUS.competencia_aaaamm == competencia,
-        models.ProcedimentoSUS.tenant_id == tenant_id,
-    )
-    procedimentos = db.scalars(stmt).all()
-    filtrados: List[models.ProcedimentoSUS] = []
-    for proc in procedimentos:
-        atendimento = db.get(models.Atendimento, proc.atendimento_id)
-        if not atendimento:
-            continue
-        if unidade_id and atendimento.unidade_id != unidade_id:
-            continue
-        if profissional_id and atendimento.profissional_id != profissional_id:
-            continue
-        tabela = sigtap_rules.get_tabela_para_competencia(db, proc.sigtap_codigo, proc.competencia_aaaamm)
-        if tabela and tabela.exige_apac:
-            filtrados.append(proc)
-    return filtrados
+    contexto: ContextoCompetencia | None = None,
+) -> List[ItemCompetencia]:
+    contexto = contexto or ContextoCompetencia.carregar(db, tenant_id, competencia)
+    return [item for item in contexto.filtrar(unidade_id, profissional_id) if item.tabela and item.tabela.exige_apac]
 
 
 def _generate_apac(
@@ -132,17 +277,27 @@ def _generate_apac(
     unidade_id: int | None = None,
     profissional_id: int | None = None,
 ) -> tuple[str, str]:
-    procedimentos_apac = _coletar_procedimentos_apac(
-        competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id
+    artefato = _gerar_artefato_apac(competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id)
+    return artefato.ler_conteudo(), artefato.path
+
+
+def _gerar_artefato_apac(
+    competencia: str,
+    tenant_id: int,
+    db: Session,
+    unidade_id: int | None = None,
+    profissional_id: int | None = None,
+    contexto: ContextoCompetencia | None = None,
+    numero_apac: str | None = None,
+) -> ArtefatoExportacao:
+    inicio = time.perf_counter()
+    itens_apac = _coletar_procedimentos_apac(
+        competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id, contexto=contexto
     )
-    if not procedimentos_apac:
+    if not itens_apac:
         raise HTTPException(status_code=400, detail="Nenhum procedimento exige APAC nesta competencia")
-    proc = procedimentos_apac[0]
-    atendimento = db.get(models.Atendimento, proc.atendimento_id)
-    paciente = db.get(models.Paciente, atendimento.paciente_id)
-    profissional = db.get(models.Profissional, atendimento.profissional_id)
-    unidade = db.get(models.Unidade, atendimento.unidade_id)
-    numero_apac = str(proc.id).zfill(13)
+    proc, atendimento, paciente, profissional, unidade, _ = itens_apac[0]
+    numero_apac = numero_apac or str(proc.id).zfill(13)
     corpo = {
         "competencia": competencia,
         "numero_apac": numero_apac,
@@ -200,7 +355,7 @@ def _generate_apac(
         "tipo_apac": "1",
     }
     procs = []
-    for proc in procedimentos_apac:
+    for proc in (item.proc for item in itens_apac):
         procs.append({
             "competencia": competencia,
             "numero_apac": numero_apac,
@@ -208,33 +363,99 @@ def _generate_apac(
             "quantidade": proc.quantidade,
             "cbo": proc.profissional_cbo,
         })
-    conteudo = export_apac.gerar_arquivo(
-        competencia=competencia,
-        orgao="CER",
-        sigla="CER",
-        cnpj="00000000000000",
-        destino="SES",
-        versao="0.1.0",
-        corpo=corpo,
-        procedimentos=procs,
+    entrada_hash = export_storage.digest_entrada(
+        "apac", competencia, {"parametros": APAC_PARAMETROS, "corpo": corpo, "procedimentos": procs}
+    )
+    em_cache = _artefato_em_cache(db, "apac", tenant_id, entrada_hash)
+    if em_cache:
+        return _observar_geracao("apac", tenant_id, inicio, len(procs), em_cache._replace(unidade_id=unidade.id))
+
+    conteudo = export_apac.gerar_arquivo(competencia=competencia, corpo=corpo, procedimentos=procs, **APAC_PARAMETROS)
+    artefato = _materializar("apac", tenant_id, entrada_hash, conteudo, unidade_id=unidade.id)
+    return _observar_geracao("apac", tenant_id, inicio, len(procs), artefato)
+
+
+def auditar_e_gerar(
+    tipo: str,
+    competencia: str,
+    tenant_id: int,
+    db: Session,
+    unidade_id: int | None = None,
+    profissional_id: int | None = None,
+) -> ArtefatoExportacao:
+    """
+    Audita a competencia e monta o arquivo sobre o mesmo contexto pre-carregado.
+    Qualquer erro de auditoria aborta a exportacao com o payload `{"erros": [...]}`.
+    So le a auditoria: o snapshot e as pendencias ficam com a rota de auditoria.
+    """
+    with metrics.cronometrar(metrics.AUDITORIA_SEGUNDOS, modo="exportacao", tenant_id=str(tenant_id)):
+        contexto = ContextoCompetencia.carregar(db, tenant_id, competencia)
+        erros_por_proc = {item.proc.id: contexto.auditar(item) for item in contexto.itens}
+    metrics.AUDITORIA_PROCEDIMENTOS.labels(modo="exportacao", tenant_id=str(tenant_id)).inc(len(contexto.itens))
+    erros_globais = [e for erros in erros_por_proc.values() for e in erros if e]
+    metrics.contar_erros_auditoria(tenant_id, erros_globais)
+    if erros_globais:
+        raise HTTPException(status_code=400, detail={"erros": erros_globais})
+    if tipo == "bpa":
+        return _gerar_artefato_bpa(
+            competencia, tenant_id, db, unidade_id=unidade_id, profissional_id=profissional_id, contexto=contexto
+        )
+    return _gerar_artefato_apac(
+        competencia,
+        tenant_id,
+        db,
+        unidade_id=unidade_id,
+        profissional_id=profissional_id,
+        contexto=contexto,
+        numero_apac=NUMERO_APAC_EXPORTACAO,
     )
-    destino_path = Path("exports/apac") / f"apac_{competencia}.rem"
-    _garante_dir(destino_path)
-    destino_path.write_text(conteudo, encoding="utf-8")
-    uploaded_key = minio_service.upload_bytes(f"exports/apac/apac_{competencia}.rem", conteudo.encode("ascii", errors="ignore"))
-    presigned = minio_service.presign_get(uploaded_key) if uploaded_key else None
-    return conteudo, presigned or str(destino_path)
+
+
+def registrar_exportacao(
+    db: Session,
+    tipo: str,
+    tenant_id: int,
+    competencia: str,
+    unidade_id: int | None,
+    artefato: ArtefatoExportacao,
+):
+    """
+    Reaproveita a exportacao com as mesmas entradas, ou cria uma nova linha para o artefato.
+    """
+    model = MODELOS_EXPORTACAO[tipo]
+    exp = db.scalars(
+        select(model)
+        .where(model.tenant_id == tenant_id, model.entrada_hash == artefato.entrada_hash)
+        .order_by(model.id.desc())
+    ).first()
+    if exp is None:
+        exp = model(tenant_id=tenant_id, competencia=competencia, unidade_id=unidade_id)
+    _aplicar_artefato(exp, artefato)
+    db.add(exp)
+    db.commit()
+    return exp
+
+
+def _aplicar_artefato(exp, artefato: ArtefatoExportacao) -> None:
+    exp.arquivo_path = artefato.path
+    exp.checksum = artefato.arquivo_hash
+    exp.entrada_hash = artefato.entrada_hash
+    exp.tamanho_bytes = artefato.tamanho_bytes
+    exp.tamanho_comprimido = artefato.tamanho_comprimido
+    exp.storage_key = artefato.storage_key
+    exp.status = "gerado"
+    exp.erros_json = {}
 
 
 @router.get("")
 def list_exports(
     tipo: Literal["bpa", "apac"],
     competencia: Optional[str] = Query(None, min_length=6, max_length=6),
-    db: Session = Depends(get_db_session),
+    db: Session = Depends(get_read_db_session),
     current_tenant_id: int = Depends(get_current_tenant_id),
     _: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.SUPER_ADMIN.value)),
 ):
-    model = models.ExportacaoBPA if tipo == "bpa" else models.ExportacaoAPAC
+    model = MODELOS_EXPORTACAO[tipo]
     stmt = select(model).where(model.tenant_id == current_tenant_id)
     if competencia:
         stmt = stmt.where(model.competencia == competencia)
@@ -243,7 +464,7 @@ def list_exports(
     return exports
 
 
-@router.post("/{tipo}/{export_id}/retry")
+@router.post("/{tipo}/{export_id}/retry", dependencies=[Depends(limitar_por_tenant("exportacao"))])
 def retry_export(
     tipo: Literal["bpa", "apac"],
     export_id: int,
@@ -251,21 +472,21 @@ def retry_export(
     current_user: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
-    model = models.ExportacaoBPA if tipo == "bpa" else models.ExportacaoAPAC
+    model = MODELOS_EXPORTACAO[tipo]
     exp = db.get(model, export_id)
     if not exp or exp.tenant_id != current_tenant_id:
         raise HTTPException(status_code=404, detail="Exportacao nao encontrada")
 
     competencia = exp.competencia
     try:
-        conteudo, path = _generate_bpa(competencia, current_tenant_id, db) if tipo == "bpa" else _generate_apac(competencia, current_tenant_id, db)
-        exp.arquivo_path = path
-        exp.status = "gerado"
-        exp.erros_json = {}
-        exp.checksum = ""  # manter compatível com pipeline atual
+        gerar = _gerar_artefato_bpa if tipo == "bpa" else _gerar_artefato_apac
+        artefato = gerar(competencia, current_tenant_id, db)
+        _aplicar_artefato(exp, artefato)
         db.add(exp)
         db.commit()
-        audit_log_service.log_action(db, current_tenant_id, current_user.id, "RETRY_EXPORT", model.__name__, exp.id)
+        audit_log_service.log_action(
+            db, current_tenant_id, current_user.id, "RETRY_EXPORT", model.__name__, exp.id, {"cache": artefato.cache}
+        )
     except HTTPException:
         raise
     except Exception as exc:
@@ -276,3 +497,37 @@ def retry_export(
         raise HTTPException(status_code=500, detail="Falha ao reprocessar exportacao")
 
     return exp
+
+
+@router.get("/{tipo}/{export_id}/download")
+def download_export(
+    request: Request,
+    tipo: Literal["bpa", "apac"],
+    export_id: int,
+    modo: Literal["arquivo", "redirect"] = Query("arquivo"),
+    formato: Literal["rem", "zip"] = Query("rem"),
+    db: Session = Depends(get_db_session),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+    _: models.Usuario = Depends(require_roles(Role.FATURAMENTO.value, Role.ADMIN_TENANT.value, Role.SUPER_ADMIN.value)),
+):
+    model = MODELOS_EXPORTACAO[tipo]
+    exp = db.get(model, export_id)
+    if not exp or exp.tenant_id != current_tenant_id:
+        raise HTTPException(status_code=404, detail="Exportacao nao encontrada")
+    if not exp.checksum or exp.status != "gerado":
+        raise HTTPException(status_code=409, detail="Exportacao sem artefato gerado")
+
+    filename = f"{tipo.upper()}_{exp.competencia}.rem"
+    arquivo_local = export_storage.caminho_local(tipo, current_tenant_id, exp.checksum)
+    if formato == "zip":
+        if not arquivo_local.is_file():
+            raise HTTPException(status_code=404, detail="Artefato da exportacao nao disponivel")
+        return servir_zip(arquivo_local, filename)
+    if modo == "arquivo" and arquivo_local.is_file():
+        return servir_arquivo(request, arquivo_local, filename)
+    presigned = minio_service.presign_get(exp.storage_key) if exp.storage_key else None
+    if presigned:
+        return RedirectResponse(presigned, status_code=307)
+    if arquivo_local.is_file():
+        return servir_arquivo(request, arquivo_local, filename)
+    raise HTTPException(status_code=404, detail="Artefato da exportacao nao disponivel")
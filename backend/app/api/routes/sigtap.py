@@ -4,8 +4,8 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_db_session
 from app.core.config import settings
 from app.services.sigtap_sync import SIGTAPSyncService, TabelaSIGTAPRepository
-from app.services import audit_log_service
-from app.dependencies import get_current_user, get_current_tenant_id, require_roles
+from app.services import audit_log_service, sigtap_backfill
+from app.dependencies import get_current_user, get_current_tenant_id, limitar_global, require_roles
 from app.models.entities import Role
 
 router = APIRouter(prefix="/sigtap", tags=["sigtap"])
@@ -18,7 +18,7 @@ def _require_admin(x_admin_token: str = Header(None, alias="X-Admin-Token")):
     return True
 
 
-@router.post("/sync")
+@router.post("/sync", dependencies=[Depends(limitar_global("sigtap"))])
 def trigger_sync(
     competencia: str = Query(..., min_length=6, max_length=6, regex="^\\d{6}$"),
     db: Session = Depends(get_db_session),
@@ -36,6 +36,47 @@ def trigger_sync(
         raise HTTPException(status_code=400, detail=str(exc))
 
 
+@router.post("/backfill", status_code=202, dependencies=[Depends(limitar_global("sigtap"))])
+def trigger_backfill(
+    inicio: str = Query(..., min_length=6, max_length=6, regex="^\\d{6}$"),
+    fim: str = Query(..., min_length=6, max_length=6, regex="^\\d{6}$"),
+    reimportar: bool = Query(False, description="Reaplica competencias ja importadas"),
+    db: Session = Depends(get_db_session),
+    _: bool = Depends(_require_admin),
+    current_user=Depends(require_roles(Role.ADMIN_TENANT.value, Role.SUPER_ADMIN.value)),
+    current_tenant_id: int = Depends(get_current_tenant_id),
+):
+    """
+    Enfileira a carga do intervalo de competencias; acompanhe em GET /sigtap/backfill/{task_id}.
+    """
+    try:
+        competencias = sigtap_backfill.competencias_intervalo(inicio, fim)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # Import tardio: o processo da API so carrega Celery/kombu quando de fato enfileira.
+    from app.services.sigtap_tasks import backfill_sigtap
+
+    tarefa = backfill_sigtap.delay(competencias, reimportar)
+    audit_log_service.log_action(
+        db, current_tenant_id, current_user.id, "BACKFILL_SIGTAP", "SIGTAP", f"{inicio}-{fim}", {"task_id": tarefa.id}
+    )
+    return {"task_id": tarefa.id, "competencias": competencias}
+
+
+@router.get("/backfill/{task_id}")
+def backfill_status(
+    task_id: str,
+    _: bool = Depends(_require_admin),
+    __=Depends(require_roles(Role.ADMIN_TENANT.value, Role.SUPER_ADMIN.value)),
+):
+    from app.celery_app import celery_app
+
+    resultado = celery_app.AsyncResult(task_id)
+    info = resultado.info if isinstance(resultado.info, dict) else None
+    erro = str(resultado.info) if resultado.failed() else None
+    return {"task_id": task_id, "estado": resultado.state, "progresso": info, "erro": erro}
+
+
 @router.get("/status")
 def sigtap_status(
     db: Session = Depends(get_db_session),
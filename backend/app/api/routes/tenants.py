@@ -1,13 +1,14 @@
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app import models
-from app.api.deps import get_db_session
-from app.auth import get_password_hash
+from app.api.deps import get_db_session, get_read_db_session
+from app.auth import get_password_hash_async
 from app.dependencies import require_roles
 
 
@@ -27,17 +28,24 @@ router = APIRouter(prefix="/tenants", tags=["tenants"])
 
 
 @router.get("", response_model=List[dict])
-def list_tenants(_: models.Usuario = Depends(require_roles(models.Role.SUPER_ADMIN.value)), db: Session = Depends(get_db_session)):
+def list_tenants(_: models.Usuario = Depends(require_roles(models.Role.SUPER_ADMIN.value)), db: Session = Depends(get_read_db_session)):
     tenants = db.scalars(select(models.Tenant)).all()
     return [{"id": t.id, "name": t.name, "cnpj": t.cnpj} for t in tenants]
 
 
 @router.post("", status_code=201)
-def create_tenant(
+async def create_tenant(
     payload: TenantCreateRequest,
     db: Session = Depends(get_db_session),
     _: models.Usuario = Depends(require_roles(models.Role.SUPER_ADMIN.value)),
 ):
+    admin_hash = None
+    if payload.admin_email and payload.admin_password:
+        admin_hash = await get_password_hash_async(payload.admin_password)
+    return await run_in_threadpool(_criar_tenant, db, payload, admin_hash)
+
+
+def _criar_tenant(db: Session, payload: TenantCreateRequest, admin_hash: Optional[str]) -> dict:
     existing = db.scalars(select(models.Tenant).where(models.Tenant.name == payload.name)).first()
     if existing:
         raise HTTPException(status_code=400, detail="Tenant ja existe")
@@ -46,13 +54,13 @@ def create_tenant(
     db.commit()
     db.refresh(tenant)
 
-    if payload.admin_email and payload.admin_password:
+    if admin_hash:
         user = db.scalars(select(models.Usuario).where(models.Usuario.email == payload.admin_email)).first()
         if not user:
             user = models.Usuario(
                 email=payload.admin_email,
                 nome="Admin Tenant",
-                hashed_password=get_password_hash(payload.admin_password),
+                hashed_password=admin_hash,
                 ativo=True,
                 must_change_password=True,
             )
@@ -1,13 +1,14 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import case, func, select
 from sqlalchemy.orm import Session
 
 from app import models
-from app.api.deps import get_db_session
-from app.auth import get_password_hash
+from app.api.deps import get_db_session, get_read_db_session
+from app.auth import get_password_hash_async
 from app.dependencies import get_current_tenant_id, get_current_user, require_roles
 
 
@@ -37,52 +38,125 @@ def _ensure_admin(user: models.Usuario):
         raise HTTPException(status_code=401, detail="Usuario invalido")
 
 
+LIMITE_PAGINA_USUARIOS = 100
+
+
+def _roles_agregadas(dialeto: str):
+    if dialeto == "postgresql":
+        return func.array_agg(models.TenantUserRole.role)
+    return func.group_concat(models.TenantUserRole.role, ",")
+
+
+def listar_usuarios(
+    db: Session,
+    tenant_id: int,
+    *,
+    nome: Optional[str] = None,
+    email: Optional[str] = None,
+    role: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = LIMITE_PAGINA_USUARIOS,
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    Usuarios do tenant com os papeis agregados numa unica consulta, paginados por id (keyset).
+    Retorna a pagina e o cursor da proxima (None na ultima). Com `limit=None`, todos.
+    """
+    tur = models.TenantUserRole
+    stmt = (
+        select(
+            models.Usuario.id,
+            models.Usuario.nome,
+            models.Usuario.email,
+            models.Usuario.ativo,
+            models.Usuario.must_change_password,
+            _roles_agregadas(db.get_bind().dialect.name).label("roles"),
+        )
+        .join(tur, tur.user_id == models.Usuario.id)
+        .where(tur.tenant_id == tenant_id, tur.ativo.is_(True))
+        .group_by(
+            models.Usuario.id,
+            models.Usuario.nome,
+            models.Usuario.email,
+            models.Usuario.ativo,
+            models.Usuario.must_change_password,
+        )
+        .order_by(models.Usuario.id)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    if cursor is not None:
+        stmt = stmt.where(models.Usuario.id > cursor)
+    if nome:
+        stmt = stmt.where(models.Usuario.nome.icontains(nome, autoescape=True))
+    if email:
+        stmt = stmt.where(models.Usuario.email.icontains(email, autoescape=True))
+    if role:
+        # Filtra pelo papel sem cortar os demais papeis do usuario da agregacao
+        stmt = stmt.having(func.max(case((tur.role == role, 1), else_=0)) == 1)
+
+    linhas = db.execute(stmt).all()
+    proximo = None
+    if limit is not None and len(linhas) > limit:
+        proximo = linhas[limit - 1].id
+        linhas = linhas[:limit]
+    usuarios = []
+    for linha in linhas:
+        roles = linha.roles.split(",") if isinstance(linha.roles, str) else list(linha.roles or [])
+        usuarios.append(
+            {
+                "id": linha.id,
+                "nome": linha.nome,
+                "email": linha.email,
+                "roles": sorted(roles),
+                "ativo": linha.ativo,
+                "must_change_password": linha.must_change_password,
+            }
+        )
+    return usuarios, proximo
+
+
 @router.get("", response_model=List[dict])
 def list_users(
-    db: Session = Depends(get_db_session),
+    response: Response,
+    nome: Optional[str] = None,
+    email: Optional[str] = None,
+    role: Optional[str] = None,
+    cursor: Optional[int] = Query(None, description="Valor de X-Next-Cursor da pagina anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Sem limit nem cursor, devolve todos os usuarios"),
+    db: Session = Depends(get_read_db_session),
     current_user: models.Usuario = Depends(require_roles(models.Role.ADMIN_TENANT.value, models.Role.SUPER_ADMIN.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
-    stmt = select(models.Usuario).join(models.TenantUserRole, models.TenantUserRole.user_id == models.Usuario.id).where(
-        models.TenantUserRole.tenant_id == current_tenant_id,
-        models.TenantUserRole.ativo.is_(True),
+    # Paginacao so quando pedida: clientes que nao seguem X-Next-Cursor recebem a lista inteira
+    if limit is None and cursor is not None:
+        limit = LIMITE_PAGINA_USUARIOS
+    usuarios, proximo = listar_usuarios(
+        db, current_tenant_id, nome=nome, email=email, role=role, cursor=cursor, limit=limit
     )
-    users = db.scalars(stmt).all()
-    result = []
-    for user in users:
-        roles_stmt = select(models.TenantUserRole.role).where(
-            models.TenantUserRole.user_id == user.id,
-            models.TenantUserRole.tenant_id == current_tenant_id,
-            models.TenantUserRole.ativo.is_(True),
-        )
-        roles = [r for r, in db.execute(roles_stmt).all()]
-        result.append(
-            {
-                "id": user.id,
-                "nome": user.nome,
-                "email": user.email,
-                "roles": roles,
-                "ativo": user.ativo,
-                "must_change_password": user.must_change_password,
-            }
-        )
-    return result
+    if proximo is not None:
+        response.headers["X-Next-Cursor"] = str(proximo)
+    return usuarios
 
 
 @router.post("", status_code=201)
-def create_user(
+async def create_user(
     payload: UserCreateRequest,
     db: Session = Depends(get_db_session),
     current_user: models.Usuario = Depends(require_roles(models.Role.ADMIN_TENANT.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
+    hashed_password = await get_password_hash_async(payload.senha)
+    return await run_in_threadpool(_criar_usuario, db, payload, hashed_password, current_tenant_id)
+
+
+def _criar_usuario(db: Session, payload: UserCreateRequest, hashed_password: str, current_tenant_id: int) -> dict:
     existing = db.scalars(select(models.Usuario).where(models.Usuario.email == payload.email)).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email ja cadastrado")
     user = models.Usuario(
         email=payload.email,
         nome=payload.nome,
-        hashed_password=get_password_hash(payload.senha),
+        hashed_password=hashed_password,
         ativo=True,
         must_change_password=payload.must_change_password,
     )
@@ -141,19 +215,24 @@ def deactivate_user(
 
 
 @router.post("/{user_id}/reset-password")
-def reset_password(
+async def reset_password(
     user_id: int,
     payload: ResetPasswordRequest,
     db: Session = Depends(get_db_session),
     current_user: models.Usuario = Depends(require_roles(models.Role.ADMIN_TENANT.value, models.Role.SUPER_ADMIN.value)),
     current_tenant_id: int = Depends(get_current_tenant_id),
 ):
-    user = db.get(models.Usuario, user_id)
+    user = await run_in_threadpool(db.get, models.Usuario, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario nao encontrado")
     new_password = payload.nova_senha or "Temp123!"
-    user.hashed_password = get_password_hash(new_password)
+    hashed_password = await get_password_hash_async(new_password)
+    await run_in_threadpool(_gravar_senha_temporaria, db, user, hashed_password)
+    return {"status": "ok", "senha_temporaria": new_password}
+
+
+def _gravar_senha_temporaria(db: Session, user: models.Usuario, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
     user.must_change_password = True
     db.add(user)
     db.commit()
-    return {"status": "ok", "senha_temporaria": new_password}
@@ -1,26 +1,79 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import jwt
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
+from app.core import metrics
 from app.core.config import settings
 from app import models
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes com custo diferente de `bcrypt_rounds` continuam validos e sao regravados no proximo login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
+# bcrypt e CPU pura: roda num executor proprio e limitado, fora do threadpool que atende as rotas.
+_bcrypt_executor = ThreadPoolExecutor(max_workers=settings.bcrypt_max_workers, thread_name_prefix="bcrypt")
+_bcrypt_vagas = threading.BoundedSemaphore(settings.bcrypt_max_workers + settings.bcrypt_fila_max)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+
+def _submeter_bcrypt(operacao: str, funcao: Callable, *args) -> Future:
+    if not _bcrypt_vagas.acquire(blocking=False):
+        metrics.SENHA_REJEITADAS.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servico de autenticacao sobrecarregado, tente novamente",
+            headers={"Retry-After": "1"},
+        )
+    enfileirado = time.perf_counter()
+    metrics.SENHA_FILA.inc()
+
+    def executar():
+        metrics.SENHA_ESPERA_SEGUNDOS.observe(time.perf_counter() - enfileirado)
+        with metrics.cronometrar(metrics.SENHA_BCRYPT_SEGUNDOS, operacao=operacao):
+            return funcao(*args)
+
+    def liberar(_):
+        metrics.SENHA_FILA.dec()
+        _bcrypt_vagas.release()
+
+    futuro = _bcrypt_executor.submit(executar)
+    futuro.add_done_callback(liberar)
+    return futuro
 
 
 def get_password_hash(password: str) -> str:
+    """
+    Hash direto na thread de quem chama, para scripts e testes. As rotas usam
+    `get_password_hash_async`, que passa pelo executor limitado.
+    """
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(_submeter_bcrypt("verificar", pwd_context.verify, plain_password, hashed_password))
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.wrap_future(_submeter_bcrypt("hash", pwd_context.hash, password))
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Retorna (valida, novo_hash); `novo_hash` so vem preenchido quando o hash atual usa custo/esquema obsoleto.
+    """
+    return await asyncio.wrap_future(
+        _submeter_bcrypt("verificar", pwd_context.verify_and_update, plain_password, hashed_password)
+    )
+
+
 def _get_roles_for_tenant(db: Session, user_id: int, tenant_id: int) -> List[str]:
     stmt = select(models.TenantUserRole.role).where(
         models.TenantUserRole.user_id == user_id,
@@ -51,11 +104,36 @@ def decode_token(token: str) -> dict:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalido")
 
 
-def authenticate_user(db: Session, email: str, password: str, tenant_id: int) -> tuple[models.Usuario, List[str]]:
+def _carregar_usuario(db: Session, email: str, tenant_id: int) -> tuple[Optional[models.Usuario], List[str]]:
     user = db.scalars(select(models.Usuario).where(models.Usuario.email == email)).first()
-    if not user or not user.ativo or not verify_password(password, user.hashed_password):
+    roles = _get_roles_for_tenant(db, user.id, tenant_id) if user and user.ativo else []
+    if user:
+        # Devolve a conexao ao pool antes do bcrypt; o usuario segue destacado com os atributos ja carregados.
+        db.expunge(user)
+    db.rollback()
+    return (user if user and user.ativo else None), roles
+
+
+def _regravar_hash(db: Session, user_id: int, novo_hash: str) -> None:
+    db.execute(update(models.Usuario).where(models.Usuario.id == user_id).values(hashed_password=novo_hash))
+    db.commit()
+
+
+async def authenticate_user_async(db: Session, email: str, password: str, tenant_id: int) -> tuple[models.Usuario, List[str]]:
+    """
+    Versao do login que nao prende o threadpool durante o bcrypt: banco no threadpool,
+    verificacao no executor de bcrypt. Regrava o hash quando o custo configurado mudou.
+    """
+    user, roles = await run_in_threadpool(_carregar_usuario, db, email, tenant_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais invalidas")
+    valida, novo_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valida:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais invalidas")
-    roles = _get_roles_for_tenant(db, user.id, tenant_id)
+    if novo_hash:
+        await run_in_threadpool(_regravar_hash, db, user.id, novo_hash)
+        user.hashed_password = novo_hash
+        metrics.SENHA_REHASH.inc()
     if not roles:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario sem acesso ao tenant")
     return user, roles
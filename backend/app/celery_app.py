@@ -1,5 +1,11 @@
+import logging
+import os
+import time
+
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_ready
 
+from app.core import metrics, query_stats
 from app.core.config import settings
 
 celery_app = Celery(
@@ -14,4 +20,79 @@ celery_app = Celery(
 
 celery_app.autodiscover_tasks(["app"])
 
+# Justica entre tenants: cada processo reserva uma tarefa por vez (sem reservar o lote de
+# um tenant) e a tarefa de tenant sem vaga (app.core.admissao) volta para o fim da fila.
+# acks_late fica so nas tarefas idempotentes (cargas SIGTAP): envios CMD e exportacoes
+# nao podem ser reentregues depois de uma queda do worker.
+celery_app.conf.worker_prefetch_multiplier = 1
+
+# Execucoes periodicas ficam no beat, fora dos processos que servem a API.
+celery_app.conf.beat_schedule = {
+    "sigtap-sync": {
+        "task": "sigtap.sync_current_competencia",
+        "schedule": settings.sigtap_job_interval_hours * 3600,
+    },
+    "cmd-tenants-ativos": {
+        "task": "cmd.disparar_tenants_ativos",
+        "schedule": settings.cmd_job_interval_minutes * 60,
+    },
+}
+
+logger = logging.getLogger("app.task")
+
+_inicio_tarefas: dict = {}
+
+
+@task_prerun.connect
+def _marcar_inicio_tarefa(task_id=None, **kwargs):
+    _inicio_tarefas[task_id] = (time.perf_counter(), *query_stats.iniciar())
+
+
+@task_postrun.connect
+def _observar_tarefa(task_id=None, task=None, state=None, **kwargs):
+    registro = _inicio_tarefas.pop(task_id, None)
+    if registro is None:
+        return
+    inicio, consultas, token = registro
+    query_stats.encerrar(token)
+    if task is None:
+        return
+    duracao = time.perf_counter() - inicio
+    metrics.CELERY_TAREFA_SEGUNDOS.labels(tarefa=task.name, estado=state or "desconhecido").observe(duracao)
+    logger.info(
+        "task",
+        extra={
+            "task": task.name,
+            "duration_ms": round(duracao * 1000, 2),
+            "db_queries": consultas.total,
+            "db_ms": round(consultas.tempo_ms, 2),
+        },
+    )
+    query_stats.verificar_n_mais_um(consultas, task.name)
+
+
+@worker_process_init.connect
+def _reiniciar_pool_no_filho(**kwargs):
+    from app.database import reiniciar_pool_apos_fork
+
+    reiniciar_pool_apos_fork()
+
+
+@worker_ready.connect
+def _expor_metricas_worker(**kwargs):
+    """
+    O worker nao passa pelo /metrics da API; expoe as proprias metricas em `celery_metrics_port`.
+    Com pool prefork, defina PROMETHEUS_MULTIPROC_DIR para agregar os processos filhos.
+    """
+    if not settings.celery_metrics_port:
+        return
+    from prometheus_client import REGISTRY, CollectorRegistry, multiprocess, start_http_server
+
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.celery_metrics_port, registry=registry)
+
+
 __all__ = ("celery_app",)
@@ -0,0 +1,275 @@
+"""
+Controle de admissao por tenant para operacoes pesadas (exportacao, auditoria de
+competencia, sync SIGTAP, envio CMD).
+
+Cada (operacao, tenant) tem ate `admissao_concorrencia_tenant` execucoes simultaneas e
+ate `admissao_fila_tenant` chamadas esperando vaga. Com a fila cheia, ou depois de
+`admissao_espera_max_segundos` na fila, a chamada e recusada com `TenantSaturado`
+(429 com Retry-After nas rotas; nova tentativa mais tarde nas tarefas Celery). Um
+tenant fechando a competencia ocupa no maximo as proprias vagas, nao o threadpool.
+
+Backend `local` conta por processo; com varios workers uvicorn ou Celery use `redis`,
+em que as vagas sao leases num sorted set por chave (expiram em
+`admissao_lease_segundos` se o processo morrer sem liberar). Nas rotas o Redis e
+acessado por `redis.asyncio`: um Redis lento atrasa so a requisicao que espera a
+vaga, nao o event loop.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+_INTERVALO_ESPERA = 0.05
+
+
+class TenantSaturado(Exception):
+    def __init__(self, operacao: str, tenant_id: Optional[int], retry_after: int):
+        super().__init__(f"Limite de operacoes '{operacao}' simultaneas do tenant atingido")
+        self.operacao = operacao
+        self.tenant_id = tenant_id
+        self.retry_after = retry_after
+
+
+class VagasLocais:
+    """
+    Vagas e fila contadas na memoria do processo.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._em_execucao: Dict[str, set] = {}
+        self._na_fila: Dict[str, int] = {}
+
+    def tentar_adquirir(self, chave: str, limite: int, token: str) -> bool:
+        with self._lock:
+            ocupadas = self._em_execucao.setdefault(chave, set())
+            if len(ocupadas) >= limite:
+                return False
+            ocupadas.add(token)
+            return True
+
+    def liberar(self, chave: str, token: str) -> None:
+        with self._lock:
+            self._em_execucao.get(chave, set()).discard(token)
+
+    def entrar_fila(self, chave: str, limite: int) -> bool:
+        with self._lock:
+            if self._na_fila.get(chave, 0) >= limite:
+                return False
+            self._na_fila[chave] = self._na_fila.get(chave, 0) + 1
+            return True
+
+    def sair_fila(self, chave: str) -> None:
+        with self._lock:
+            self._na_fila[chave] = max(0, self._na_fila.get(chave, 0) - 1)
+
+    # Operacoes em memoria nao bloqueiam o event loop
+    async def tentar_adquirir_async(self, chave: str, limite: int, token: str) -> bool:
+        return self.tentar_adquirir(chave, limite, token)
+
+    async def liberar_async(self, chave: str, token: str) -> None:
+        self.liberar(chave, token)
+
+    async def entrar_fila_async(self, chave: str, limite: int) -> bool:
+        return self.entrar_fila(chave, limite)
+
+    async def sair_fila_async(self, chave: str) -> None:
+        self.sair_fila(chave)
+
+
+# Remove leases vencidos e ocupa uma vaga se houver, atomicamente
+_SCRIPT_ADQUIRIR = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1] - ARGV[4])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return 1
+end
+return 0
+"""
+
+_SCRIPT_ENTRAR_FILA = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if n > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+
+class VagasRedis:
+    """
+    Vagas compartilhadas entre processos e maquinas. O cliente sincrono atende as
+    tarefas Celery; o assincrono (criado no primeiro uso, no loop do processo) as rotas.
+    """
+
+    def __init__(self, url: str) -> None:
+        import redis
+
+        self._url = url
+        self._cliente = redis.Redis.from_url(url, socket_connect_timeout=2, socket_timeout=2)
+        self._adquirir = self._cliente.register_script(_SCRIPT_ADQUIRIR)
+        self._entrar_fila = self._cliente.register_script(_SCRIPT_ENTRAR_FILA)
+        self._cliente_async = None
+
+    def _async(self):
+        if self._cliente_async is None:
+            import redis.asyncio as redis_async
+
+            cliente = redis_async.Redis.from_url(self._url, socket_connect_timeout=2, socket_timeout=2)
+            self._cliente_async = (
+                cliente,
+                cliente.register_script(_SCRIPT_ADQUIRIR),
+                cliente.register_script(_SCRIPT_ENTRAR_FILA),
+            )
+        return self._cliente_async
+
+    @staticmethod
+    def _args_adquirir(limite: int, token: str) -> list:
+        return [time.time(), limite, token, settings.admissao_lease_segundos]
+
+    def tentar_adquirir(self, chave: str, limite: int, token: str) -> bool:
+        return bool(self._adquirir(keys=[f"nexusclin:admissao:{chave}"], args=self._args_adquirir(limite, token)))
+
+    def liberar(self, chave: str, token: str) -> None:
+        self._cliente.zrem(f"nexusclin:admissao:{chave}", token)
+
+    def entrar_fila(self, chave: str, limite: int) -> bool:
+        argumentos = [limite, settings.admissao_lease_segundos]
+        return bool(self._entrar_fila(keys=[f"nexusclin:admissao_fila:{chave}"], args=argumentos))
+
+    def sair_fila(self, chave: str) -> None:
+        self._cliente.decr(f"nexusclin:admissao_fila:{chave}")
+
+    async def tentar_adquirir_async(self, chave: str, limite: int, token: str) -> bool:
+        _, adquirir, _ = self._async()
+        return bool(await adquirir(keys=[f"nexusclin:admissao:{chave}"], args=self._args_adquirir(limite, token)))
+
+    async def liberar_async(self, chave: str, token: str) -> None:
+        cliente, _, _ = self._async()
+        await cliente.zrem(f"nexusclin:admissao:{chave}", token)
+
+    async def entrar_fila_async(self, chave: str, limite: int) -> bool:
+        _, _, entrar_fila = self._async()
+        argumentos = [limite, settings.admissao_lease_segundos]
+        return bool(await entrar_fila(keys=[f"nexusclin:admissao_fila:{chave}"], args=argumentos))
+
+    async def sair_fila_async(self, chave: str) -> None:
+        cliente, _, _ = self._async()
+        await cliente.decr(f"nexusclin:admissao_fila:{chave}")
+
+
+_vagas = None
+_vagas_lock = threading.Lock()
+
+
+def vagas():
+    global _vagas
+    with _vagas_lock:
+        if _vagas is None:
+            _vagas = VagasRedis(settings.redis_url) if settings.admissao_backend == "redis" else VagasLocais()
+        return _vagas
+
+
+def redefinir() -> None:
+    global _vagas
+    with _vagas_lock:
+        _vagas = None
+
+
+class Permissao:
+    def __init__(self, chave: str, token: str) -> None:
+        self.chave = chave
+        self.token = token
+
+    def liberar(self) -> None:
+        vagas().liberar(self.chave, self.token)
+
+    async def liberar_async(self) -> None:
+        await vagas().liberar_async(self.chave, self.token)
+
+
+def _chave(operacao: str, tenant_id: Optional[int]) -> str:
+    return f"{operacao}:{tenant_id if tenant_id is not None else 'global'}"
+
+
+def _recusar(operacao: str, tenant_id: Optional[int], motivo: str) -> TenantSaturado:
+    metrics.ADMISSAO_REJEITADAS.labels(operacao=operacao, motivo=motivo).inc()
+    return TenantSaturado(operacao, tenant_id, settings.admissao_retry_after_segundos)
+
+
+def _tentar(operacao: str, tenant_id: Optional[int]) -> Optional[Permissao]:
+    chave, token = _chave(operacao, tenant_id), uuid.uuid4().hex
+    if vagas().tentar_adquirir(chave, settings.admissao_concorrencia_tenant, token):
+        return Permissao(chave, token)
+    return None
+
+
+def adquirir(operacao: str, tenant_id: Optional[int], espera: Optional[float] = None) -> Permissao:
+    """
+    Vaga para a operacao do tenant, esperando na fila ate `espera` segundos (padrao
+    `admissao_espera_max_segundos`; 0 recusa na hora se nao houver vaga).
+    """
+    permissao = _tentar(operacao, tenant_id)
+    if permissao is not None:
+        return permissao
+    espera = settings.admissao_espera_max_segundos if espera is None else espera
+    chave = _chave(operacao, tenant_id)
+    if espera <= 0 or not vagas().entrar_fila(chave, settings.admissao_fila_tenant):
+        raise _recusar(operacao, tenant_id, "fila_cheia")
+    limite = time.monotonic() + espera
+    try:
+        while time.monotonic() < limite:
+            time.sleep(_INTERVALO_ESPERA)
+            permissao = _tentar(operacao, tenant_id)
+            if permissao is not None:
+                return permissao
+    finally:
+        vagas().sair_fila(chave)
+    raise _recusar(operacao, tenant_id, "espera")
+
+
+async def _tentar_async(operacao: str, tenant_id: Optional[int]) -> Optional[Permissao]:
+    chave, token = _chave(operacao, tenant_id), uuid.uuid4().hex
+    if await vagas().tentar_adquirir_async(chave, settings.admissao_concorrencia_tenant, token):
+        return Permissao(chave, token)
+    return None
+
+
+async def adquirir_async(operacao: str, tenant_id: Optional[int]) -> Permissao:
+    """
+    Como `adquirir`, mas sem bloquear o event loop: nem a espera na fila nem as
+    chamadas ao backend ocupam thread.
+    """
+    permissao = await _tentar_async(operacao, tenant_id)
+    if permissao is not None:
+        return permissao
+    chave = _chave(operacao, tenant_id)
+    if settings.admissao_espera_max_segundos <= 0 or not await vagas().entrar_fila_async(chave, settings.admissao_fila_tenant):
+        raise _recusar(operacao, tenant_id, "fila_cheia")
+    limite = time.monotonic() + settings.admissao_espera_max_segundos
+    try:
+        while time.monotonic() < limite:
+            await asyncio.sleep(_INTERVALO_ESPERA)
+            permissao = await _tentar_async(operacao, tenant_id)
+            if permissao is not None:
+                return permissao
+    finally:
+        await vagas().sair_fila_async(chave)
+    raise _recusar(operacao, tenant_id, "espera")
+
+
+@contextmanager
+def reservar(operacao: str, tenant_id: Optional[int], espera: Optional[float] = None) -> Iterator[Permissao]:
+    permissao = adquirir(operacao, tenant_id, espera=espera)
+    try:
+        yield permissao
+    finally:
+        permissao.liberar()
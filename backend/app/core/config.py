@@ -11,7 +11,16 @@ class Settings(BaseSettings):
     app_name: str = "NexusClin"
     environment: Literal["dev", "staging", "prod"] = "dev"
     debug: bool = False
+    server_timing_enabled: bool = False
+    sql_n_mais_um_limite: int | None = None
     database_url: str = "postgresql+psycopg2://nexus:nexus@db:5432/nexus"
+    database_replica_url: str | None = None
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int | None = None
     secret_key: str = Field(
         default_factory=lambda: secrets.token_urlsafe(32)
     )  # Generated when not provided to avoid weak defaults
@@ -20,15 +29,35 @@ class Settings(BaseSettings):
     )
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 60
+    bcrypt_rounds: int = 12
+    bcrypt_max_workers: int = 4
+    bcrypt_fila_max: int = 64
+    admissao_backend: Literal["local", "redis"] = "local"
+    admissao_concorrencia_tenant: int = 2
+    admissao_fila_tenant: int = 4
+    admissao_espera_max_segundos: float = 10.0
+    admissao_retry_after_segundos: int = 5
+    admissao_lease_segundos: int = 1800
     s3_endpoint: str = "http://minio:9000"
     s3_access_key: str = "minio"
     s3_secret_key: str = "minio123"
     s3_bucket: str = "nexusclin"
+    anexo_tamanho_maximo_mb: int = 100
+    anexo_presign_expira_segundos: int = 900
+    export_compressao: Literal["none", "gzip"] = "gzip"
     redis_url: str = "redis://redis:6379/0"
+    celery_metrics_port: int | None = None
     sigtap_base_url: str = "https://ftp.datasus.gov.br/dissemin/publicos/SIGTAP/200810_/TabelasUnificadas"
     sigtap_admin_token: str = "dev-admin-token"
     sigtap_job_enabled: bool = True
     sigtap_job_interval_hours: int = 24
+    sigtap_cache_dir: str | None = "sigtap_cache"
+    sigtap_cache_max_idade_horas: int = 24
+    sigtap_download_timeout: float = 60.0
+    sigtap_backfill_workers: int = 4
+    sigtap_backfill_max_competencias: int = 120
+    sigtap_snapshot_arquivo: str | None = "sigtap_cache/sigtap_vigente.bin"
+    sigtap_snapshot_verificar_segundos: float = 2.0
     mfa_required: bool = False
     icp_brasil_enabled: bool = False
     seed_tenant_name: str | None = None
@@ -37,8 +66,17 @@ class Settings(BaseSettings):
     seed_run_on_startup: bool = False
     cmd_job_enabled: bool = True
     cmd_job_interval_minutes: int = 1440
+    startup_jobs_enabled: bool = True
+    startup_jobs_dedup_seconds: int = 3600
     ai_api_key: str | None = None
     ai_model_name: str | None = None
+    ai_base_url: str = "https://api.openai.com/v1"
+    ai_timeout_seconds: float = 30.0
+    ai_max_conexoes: int = 20
+    ai_max_concorrencia_tenant: int = 4
+    ai_cache_backend: Literal["none", "memoria", "redis"] = "memoria"
+    ai_cache_ttl_seconds: int = 3600
+    ai_cache_max_itens: int = 1024
 
     @field_validator("allowed_origins", mode="before")
     @classmethod
@@ -11,7 +11,20 @@ class JSONRequestFormatter(logging.Formatter):
             "logger": record.name,
             "message": record.getMessage(),
         }
-        for key in ("path", "method", "status_code", "duration_ms", "tenant_id", "user_id"):
+        for key in (
+            "path",
+            "method",
+            "status_code",
+            "duration_ms",
+            "tenant_id",
+            "user_id",
+            "db_queries",
+            "db_ms",
+            "task",
+            "origem",
+            "vezes",
+            "statement",
+        ):
             if hasattr(record, key):
                 payload[key] = getattr(record, key)
         return json.dumps(payload, ensure_ascii=True)
@@ -0,0 +1,137 @@
+"""
+Metricas de dominio (Prometheus) para exportacoes, auditoria, SIGTAP, CMD, Celery e senhas.
+
+Registradas no registry padrao do prometheus_client, o mesmo exposto em /metrics pelo
+Instrumentator. `tenant_id` so entra como label onde o numero de series fica limitado
+pela quantidade de tenants (sem competencia, paciente ou procedimento como label).
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge, Histogram
+
+_BUCKETS_RAPIDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BUCKETS_LENTOS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+EXPORT_GERACAO_SEGUNDOS = Histogram(
+    "nexusclin_export_geracao_segundos",
+    "Tempo de geracao de remessas BPA/APAC",
+    ["tipo", "tenant_id", "cache"],
+    buckets=_BUCKETS_RAPIDOS,
+)
+EXPORT_LINHAS = Counter(
+    "nexusclin_export_linhas_total",
+    "Procedimentos incluidos em remessas geradas",
+    ["tipo", "tenant_id"],
+)
+AUDITORIA_SEGUNDOS = Histogram(
+    "nexusclin_auditoria_segundos",
+    "Duracao da auditoria de competencia",
+    ["modo", "tenant_id"],
+    buckets=_BUCKETS_RAPIDOS,
+)
+AUDITORIA_PROCEDIMENTOS = Counter(
+    "nexusclin_auditoria_procedimentos_total",
+    "Procedimentos revalidados pela auditoria",
+    ["modo", "tenant_id"],
+)
+AUDITORIA_ERROS = Counter(
+    "nexusclin_auditoria_erros_total",
+    "Ocorrencias de erro por tipo no resultado de cada auditoria executada",
+    ["erro", "tenant_id"],
+)
+SIGTAP_FASE_SEGUNDOS = Histogram(
+    "nexusclin_sigtap_fase_segundos",
+    "Duracao das fases da sincronizacao SIGTAP",
+    ["fase"],
+    buckets=_BUCKETS_LENTOS,
+)
+SIGTAP_REGISTROS = Counter(
+    "nexusclin_sigtap_registros_total",
+    "Registros SIGTAP processados na importacao",
+    ["resultado"],
+)
+SIGTAP_PACOTES = Counter(
+    "nexusclin_sigtap_pacotes_total",
+    "Pacotes SIGTAP obtidos por origem (cache local, revalidado, download, espelho)",
+    ["origem"],
+)
+CMD_SOAP_SEGUNDOS = Histogram(
+    "nexusclin_cmd_soap_segundos",
+    "Latencia das chamadas SOAP ao CMD",
+    ["operacao", "resultado"],
+    buckets=_BUCKETS_RAPIDOS,
+)
+CELERY_TAREFA_SEGUNDOS = Histogram(
+    "nexusclin_celery_tarefa_segundos",
+    "Duracao das tarefas Celery",
+    ["tarefa", "estado"],
+    buckets=_BUCKETS_LENTOS,
+)
+
+DB_POOL_ESPERA_SEGUNDOS = Histogram(
+    "nexusclin_db_pool_espera_segundos",
+    "Tempo de espera para obter conexao do pool do banco",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "nexusclin_db_pool_timeouts_total",
+    "Checkouts do pool que estouraram db_pool_timeout",
+)
+DB_POOL_CONEXOES = Gauge(
+    "nexusclin_db_pool_conexoes",
+    "Conexoes do pool do banco por estado",
+    ["pool", "estado"],
+    multiprocess_mode="livesum",
+)
+
+SENHA_ESPERA_SEGUNDOS = Histogram(
+    "nexusclin_senha_espera_segundos",
+    "Tempo na fila do executor de bcrypt ate iniciar o calculo",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SENHA_BCRYPT_SEGUNDOS = Histogram(
+    "nexusclin_senha_bcrypt_segundos",
+    "Duracao do calculo de bcrypt por operacao",
+    ["operacao"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2),
+)
+SENHA_FILA = Gauge(
+    "nexusclin_senha_fila",
+    "Operacoes de senha aguardando ou em execucao no executor de bcrypt",
+    multiprocess_mode="livesum",
+)
+SENHA_REJEITADAS = Counter(
+    "nexusclin_senha_rejeitadas_total",
+    "Operacoes de senha recusadas com a fila do executor cheia",
+)
+SENHA_REHASH = Counter(
+    "nexusclin_senha_rehash_total",
+    "Hashes regravados no login por mudanca de custo/esquema",
+)
+AI_CACHE_CONSULTAS = Counter(
+    "nexusclin_ai_cache_consultas_total",
+    "Consultas ao cache de respostas do assistente AI",
+    ["resultado"],
+)
+ADMISSAO_REJEITADAS = Counter(
+    "nexusclin_admissao_rejeitadas_total",
+    "Operacoes pesadas recusadas por limite de concorrencia do tenant",
+    ["operacao", "motivo"],
+)
+
+
+@contextmanager
+def cronometrar(histograma: Histogram, **labels):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.labels(**labels).observe(time.perf_counter() - inicio)
+
+
+def contar_erros_auditoria(tenant_id: int, erros: Iterable[str]) -> None:
+    for erro in erros:
+        if erro:
+            AUDITORIA_ERROS.labels(erro=erro, tenant_id=str(tenant_id)).inc()
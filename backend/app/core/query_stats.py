@@ -0,0 +1,99 @@
+"""
+Contagem de consultas SQL por requisicao/tarefa e deteccao de N+1.
+
+Os hooks ficam na classe Engine, entao valem para `database.engine` e para engines
+criadas em testes. As estatisticas so sao coletadas dentro de `medir_consultas()`,
+que guarda o acumulador num ContextVar (propagado para o threadpool do FastAPI).
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.sql")
+
+
+class EstatisticasConsultas:
+    def __init__(self) -> None:
+        self.total = 0
+        self.tempo_ms = 0.0
+        self.por_statement: Counter = Counter()
+
+    def registrar(self, statement: str, duracao_ms: float) -> None:
+        self.total += 1
+        self.tempo_ms += duracao_ms
+        self.por_statement[statement] += 1
+
+    def repetidas(self, limite: int) -> List[Tuple[str, int]]:
+        """
+        Statements identicos (mesmo SQL, parametros diferentes) executados `limite` vezes ou mais.
+        """
+        return [(sql, n) for sql, n in self.por_statement.most_common() if n >= limite]
+
+
+_atual: ContextVar[Optional[EstatisticasConsultas]] = ContextVar("estatisticas_consultas", default=None)
+
+
+def atual() -> Optional[EstatisticasConsultas]:
+    return _atual.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _atual.get() is not None:
+        conn.info.setdefault("query_stats_inicio", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    estatisticas = _atual.get()
+    inicios = conn.info.get("query_stats_inicio")
+    if estatisticas is None or not inicios:
+        return
+    estatisticas.registrar(statement, (time.perf_counter() - inicios.pop()) * 1000)
+
+
+def _limite_n_mais_um() -> Optional[int]:
+    if settings.sql_n_mais_um_limite:
+        return settings.sql_n_mais_um_limite
+    return 10 if settings.environment == "dev" else None
+
+
+def verificar_n_mais_um(estatisticas: EstatisticasConsultas, origem: str) -> None:
+    limite = _limite_n_mais_um()
+    if not limite:
+        return
+    for statement, vezes in estatisticas.repetidas(limite):
+        logger.warning(
+            "possivel_n_mais_1",
+            extra={"origem": origem, "vezes": vezes, "statement": " ".join(statement.split())[:300]},
+        )
+
+
+@contextmanager
+def medir_consultas() -> Iterator[EstatisticasConsultas]:
+    estatisticas = EstatisticasConsultas()
+    token = _atual.set(estatisticas)
+    try:
+        yield estatisticas
+    finally:
+        _atual.reset(token)
+
+
+def iniciar() -> Tuple[EstatisticasConsultas, object]:
+    """
+    Variante sem `with` para hooks separados de inicio/fim (sinais do Celery).
+    """
+    estatisticas = EstatisticasConsultas()
+    return estatisticas, _atual.set(estatisticas)
+
+
+def encerrar(token) -> None:
+    _atual.reset(token)
@@ -1,20 +1,193 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
 
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core import metrics
+from app.core import query_stats  # noqa: F401  registra os hooks de contagem de consultas
 from app.core.config import settings
 
 Base = declarative_base()
 
-engine = create_engine(settings.database_url, echo=False, future=True)
+
+class QueuePoolMedido(QueuePool):
+    """
+    QueuePool que mede a espera por conexao (fila de checkout) e conta timeouts.
+
+    Com `nome_metrica` definido (modo multiprocesso do Prometheus) tambem publica o
+    estado do pool a cada checkout/checkin; fora dele o gauge e lido sob demanda.
+    """
+
+    nome_metrica: Optional[str] = None
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super()._do_get()
+        except PoolTimeoutError:
+            metrics.DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            metrics.DB_POOL_ESPERA_SEGUNDOS.observe(time.perf_counter() - inicio)
+        self._publicar_estado()
+        return conexao
+
+    def _return_conn(self, record) -> None:
+        super()._return_conn(record)
+        self._publicar_estado()
+
+    def recreate(self):
+        novo = super().recreate()
+        novo.nome_metrica = self.nome_metrica
+        return novo
+
+    def _publicar_estado(self) -> None:
+        if self.nome_metrica is None:
+            return
+        for estado, valor in _estado_pool(self).items():
+            metrics.DB_POOL_CONEXOES.labels(pool=self.nome_metrica, estado=estado).set(valor)
+
+
+class AsyncQueuePoolMedido(QueuePoolMedido, AsyncAdaptedQueuePool):
+    """
+    Mesma medicao para engines async (asyncpg), que exigem a fila adaptada ao asyncio.
+    """
+
+
+def _estado_pool(pool: QueuePool) -> dict:
+    return {"em_uso": pool.checkedout(), "ociosas": pool.checkedin(), "overflow": max(pool.overflow(), 0)}
+
+
+def _engine_kwargs(database_url: str) -> dict:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        return {"pool_pre_ping": settings.db_pool_pre_ping}
+    kwargs = {
+        "poolclass": QueuePoolMedido,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if settings.db_statement_timeout_ms and url.get_backend_name() == "postgresql":
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return kwargs
+
+
+def criar_engine(database_url: str | None = None) -> Engine:
+    database_url = database_url or settings.database_url
+    return create_engine(database_url, echo=False, future=True, **_engine_kwargs(database_url))
+
+
+def _expor_pool(engine: Engine, nome: str) -> None:
+    """
+    Publica o estado do pool em DB_POOL_CONEXOES{pool=nome}.
+
+    `set_function` so e lido pelo registry do proprio processo: com
+    PROMETHEUS_MULTIPROC_DIR (workers gunicorn/Celery) o MultiProcessCollector le apenas
+    os arquivos mmap, entao nesse modo o pool grava o gauge a cada checkout/checkin.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePoolMedido):
+        return
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        pool.nome_metrica = nome
+        pool._publicar_estado()
+        return
+    for estado in ("em_uso", "ociosas", "overflow"):
+        metrics.DB_POOL_CONEXOES.labels(pool=nome, estado=estado).set_function(
+            lambda estado=estado: _estado_pool(engine.pool)[estado]
+        )
+
+
+def reiniciar_pool_apos_fork() -> None:
+    """
+    Chamado no processo filho (Celery prefork): descarta as conexoes herdadas do pai
+    sem fecha-las, para que pai e filho nunca compartilhem o mesmo socket. Vale para
+    todas as engines ja criadas no pai: primario, replica e as async.
+    """
+    engines = [engine, replica_engine, *(engine_async.sync_engine for engine_async in _engines_async)]
+    for herdada in engines:
+        if herdada is not None:
+            herdada.dispose(close=False)
+
+
+_escrita_requisicao: ContextVar[Optional[dict]] = ContextVar("escrita_requisicao", default=None)
+
+
+def iniciar_requisicao():
+    """
+    Abre o escopo de read-your-writes da requisicao; devolve o token para `encerrar_requisicao`.
+    """
+    return _escrita_requisicao.set({"escreveu": False})
+
+
+def encerrar_requisicao(token) -> None:
+    _escrita_requisicao.reset(token)
+
+
+def _marcar_escrita(session: Session) -> None:
+    session.info["escreveu"] = True
+    estado = _escrita_requisicao.get()
+    if estado is not None:
+        estado["escreveu"] = True
+
+
+class RoutingSession(Session):
+    """
+    Sessao que le da replica quando `info["replica_bind"]` esta presente.
+
+    Depois de qualquer escrita na mesma sessao ou na mesma requisicao, todas as
+    consultas voltam ao primario, para que a requisicao enxergue o que acabou de gravar.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica_bind")
+        if replica is not None and not self.leu_escrita():
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+    def leu_escrita(self) -> bool:
+        estado = _escrita_requisicao.get()
+        return bool(self.info.get("escreveu") or (estado and estado["escreveu"]))
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _escrita_por_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        _marcar_escrita(session)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _escrita_por_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _marcar_escrita(orm_execute_state.session)
+
+
+engine = criar_engine()
+_expor_pool(engine, "primario")
+replica_engine = criar_engine(settings.database_replica_url) if settings.database_replica_url else None
+if replica_engine is not None:
+    _expor_pool(replica_engine, "replica")
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     expire_on_commit=False,
     bind=engine,
     future=True,
+    class_=RoutingSession,
 )
 # Import models after Base is defined so tables register on metadata
-from app import models  # noqa: F401
+from app import models  # noqa: F401,E402
+from app.services import auditoria_incremental  # noqa: F401,E402  registra o rastreamento de pendencias
 
 
 def get_db():
@@ -23,3 +196,84 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """
+    Sessao para rotas de leitura/relatorio: usa a replica quando configurada.
+    """
+    db = SessionLocal(info={"replica_bind": replica_engine} if replica_engine is not None else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_DRIVERS_ASYNC = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def url_async(database_url: str) -> str:
+    """
+    Mesmo banco de `database_url` com o driver async (asyncpg / aiosqlite).
+    """
+    url = make_url(database_url)
+    driver = _DRIVERS_ASYNC.get(url.get_backend_name())
+    if driver is None or url.drivername == driver:
+        return database_url
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+# Engines async ja criadas neste processo, para `reiniciar_pool_apos_fork`
+_engines_async: list = []
+
+
+def criar_engine_async(database_url: str | None = None, nome_pool: str = "async") -> AsyncEngine:
+    database_url = url_async(database_url or settings.database_url)
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        engine_async = create_async_engine(database_url, future=True)
+        _engines_async.append(engine_async)
+        return engine_async
+    kwargs = {
+        "poolclass": AsyncQueuePoolMedido,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if settings.db_statement_timeout_ms:
+        kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}}
+    engine_async = create_async_engine(database_url, future=True, **kwargs)
+    _expor_pool(engine_async.sync_engine, nome_pool)
+    _engines_async.append(engine_async)
+    return engine_async
+
+
+_async_sessionmakers: dict = {}
+
+
+def get_async_sessionmaker(leitura: bool = False) -> async_sessionmaker:
+    """
+    Engine async criada sob demanda: so processos que servem rotas de leitura async abrem o pool.
+    Com `leitura=True` e replica configurada, as consultas vao para a replica (RoutingSession).
+    """
+    if not _async_sessionmakers:
+        primario = criar_engine_async()
+        info = None
+        if settings.database_replica_url:
+            info = {"replica_bind": criar_engine_async(settings.database_replica_url, "async_replica").sync_engine}
+        opcoes = {"expire_on_commit": False, "class_": AsyncSession, "sync_session_class": RoutingSession}
+        _async_sessionmakers[False] = async_sessionmaker(primario, **opcoes)
+        _async_sessionmakers[True] = async_sessionmaker(primario, info=info, **opcoes)
+    return _async_sessionmakers[leitura]
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with get_async_sessionmaker(leitura=True)() as db:
+        yield db
@@ -1,13 +1,16 @@
-from typing import Callable, List
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_db_session
+from app.api.deps import get_async_db_session, get_db_session
 from app import models
 from app.auth import decode_token
+from app.core import admissao
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
@@ -29,6 +32,16 @@ def get_current_user(
     return user
 
 
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_db_session), payload: dict = Depends(_get_token_payload)
+) -> models.Usuario:
+    user_id = int(payload.get("sub", 0))
+    user = await db.get(models.Usuario, user_id)
+    if not user or not user.ativo:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario invalido")
+    return user
+
+
 def get_current_tenant_id(payload: dict = Depends(_get_token_payload)) -> int:
     tenant_id = payload.get("tenant_id")
     if tenant_id is None:
@@ -49,6 +62,17 @@ def require_roles(*roles: str) -> Callable:
     return _checker
 
 
+def require_roles_async(*roles: str) -> Callable:
+    async def _checker(
+        user: models.Usuario = Depends(get_current_user_async), user_roles: List[str] = Depends(get_current_roles)
+    ):
+        if any(r in user_roles for r in roles):
+            return user
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permissao insuficiente")
+
+    return _checker
+
+
 def apply_tenant_filter(stmt, model, tenant_id: int):
     if hasattr(model, "tenant_id"):
         return stmt.where(model.tenant_id == tenant_id)
@@ -58,3 +82,45 @@ def apply_tenant_filter(stmt, model, tenant_id: int):
 def ensure_same_tenant(entity_tenant_id: int, current_tenant_id: int):
     if entity_tenant_id != current_tenant_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso a outro tenant negado")
+
+
+@asynccontextmanager
+async def _vaga(operacao: str, tenant_id: Optional[int]):
+    try:
+        permissao = await admissao.adquirir_async(operacao, tenant_id)
+    except admissao.TenantSaturado as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    try:
+        yield permissao
+    finally:
+        await permissao.liberar_async()
+
+
+def limitar_por_tenant(operacao: str) -> Callable:
+    """
+    Vaga da operacao pesada para o tenant do token durante a requisicao; 429 com
+    Retry-After quando o tenant ja esta no limite.
+    """
+
+    async def _vaga_tenant(current_tenant_id: int = Depends(get_current_tenant_id)):
+        async with _vaga(operacao, current_tenant_id) as permissao:
+            yield permissao
+
+    return _vaga_tenant
+
+
+def limitar_global(operacao: str) -> Callable:
+    """
+    Como `limitar_por_tenant`, para operacoes sobre dados globais (tabela SIGTAP):
+    todos os tenants disputam as mesmas vagas.
+    """
+
+    async def _vaga_global():
+        async with _vaga(operacao, None) as permissao:
+            yield permissao
+
+    return _vaga_global
@@ -1,10 +1,12 @@
 from app.core.config import settings
-from app.services.sigtap_tasks import sync_sigtap_current_competencia
 
 
 def trigger_sync():
     if not settings.sigtap_job_enabled:
         return None
+    # Import tardio: o processo da API so carrega Celery/kombu quando de fato enfileira.
+    from app.services.sigtap_tasks import sync_sigtap_current_competencia
+
     # Delegates processing to Celery worker; avoid in-process loops.
     return sync_sigtap_current_competencia.delay()
 
@@ -0,0 +1,40 @@
+"""
+Disparo dos jobs iniciais (SIGTAP e CMD) fora do caminho de boot da API.
+
+Roda numa thread depois que o servidor ja aceita requisicoes e usa um lock no Redis
+(SET NX com TTL) para que apenas um worker uvicorn por janela enfileire os jobs.
+"""
+import logging
+
+from app.core.config import settings
+from app.jobs import cmd_job, sigtap_job
+
+logger = logging.getLogger("app.jobs")
+
+CHAVE_LOCK = "nexusclin:jobs_iniciais"
+
+
+def _adquirir_lock() -> bool:
+    import redis
+
+    cliente = redis.Redis.from_url(settings.redis_url, socket_connect_timeout=2, socket_timeout=2)
+    try:
+        return bool(cliente.set(CHAVE_LOCK, "1", nx=True, ex=settings.startup_jobs_dedup_seconds))
+    finally:
+        cliente.close()
+
+
+def disparar_jobs_iniciais() -> bool:
+    if not (settings.sigtap_job_enabled or settings.cmd_job_enabled):
+        return False
+    try:
+        if not _adquirir_lock():
+            logger.info("jobs_iniciais_ja_disparados")
+            return False
+        sigtap_job.schedule()
+        cmd_job.schedule()
+        return True
+    except Exception:
+        # Broker/Redis fora do ar nao pode derrubar nem atrasar a API; o beat cobre a proxima janela.
+        logger.warning("jobs_iniciais_falharam", exc_info=True)
+        return False
@@ -8,6 +8,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from app.auth import decode_token
+from app import database
+from app.core import query_stats
 from app.core.config import settings
 from app.core.logging_config import setup_logging
 from app.api.routes import core as core_routes
@@ -19,9 +21,10 @@ from app.api.routes import cmd as cmd_routes
 from app.api.routes import auditoria as auditoria_routes
 from app.api.routes import exports as exports_routes
 from app.api.routes import ai as ai_routes
-from app.jobs import sigtap_job
-from app.jobs import cmd_job
+from app.api.routes import anexos as anexos_routes
+from app.jobs import startup as jobs_startup
 from app.scripts import seed_initial_admin
+from app.services import ai_assistant
 
 setup_logging()
 logger = logging.getLogger("app.request")
@@ -34,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(core_routes.router, prefix="/api")
@@ -45,6 +49,7 @@ app.include_router(cmd_routes.router, prefix="/api")
 app.include_router(auditoria_routes.router, prefix="/api")
 app.include_router(exports_routes.router, prefix="/api")
 app.include_router(ai_routes.router, prefix="/api")
+app.include_router(anexos_routes.router, prefix="/api")
 
 Instrumentator().instrument(app).expose(app, include_in_schema=False)
 
@@ -68,34 +73,51 @@ async def log_requests(request: Request, call_next):
     start = time.perf_counter()
     tenant_id, user_id = _extract_auth_context(request)
     status_code = 500
-    try:
-        response = await call_next(request)
-        status_code = response.status_code
-        return response
-    finally:
-        duration_ms = (time.perf_counter() - start) * 1000
-        logger.info(
-            "request",
-            extra={
-                "path": request.url.path,
-                "method": request.method,
-                "status_code": status_code,
-                "duration_ms": round(duration_ms, 2),
-                "tenant_id": tenant_id,
-                "user_id": user_id,
-            },
-        )
+    escopo_escrita = database.iniciar_requisicao()
+    with query_stats.medir_consultas() as consultas:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            if settings.server_timing_enabled:
+                duration_ms = (time.perf_counter() - start) * 1000
+                response.headers["Server-Timing"] = (
+                    f'db;dur={consultas.tempo_ms:.1f};desc="{consultas.total} queries", app;dur={duration_ms:.1f}'
+                )
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            logger.info(
+                "request",
+                extra={
+                    "path": request.url.path,
+                    "method": request.method,
+                    "status_code": status_code,
+                    "duration_ms": round(duration_ms, 2),
+                    "tenant_id": tenant_id,
+                    "user_id": user_id,
+                    "db_queries": consultas.total,
+                    "db_ms": round(consultas.tempo_ms, 2),
+                },
+            )
+            query_stats.verificar_n_mais_um(consultas, f"{request.method} {request.url.path}")
+            database.encerrar_requisicao(escopo_escrita)
 
 
 @app.on_event("startup")
 async def startup_events():
-    # Roda sincronizacao mensal do SIGTAP em background
-    sigtap_job.schedule()
-    cmd_job.schedule()
+    # Jobs iniciais (SIGTAP/CMD) em thread separada e deduplicados entre workers:
+    # o boot nao espera pelo broker nem pela varredura de tenants do CMD.
+    if settings.startup_jobs_enabled:
+        app.state.jobs_iniciais = asyncio.get_running_loop().run_in_executor(None, jobs_startup.disparar_jobs_iniciais)
     if settings.seed_run_on_startup:
         await asyncio.to_thread(seed_initial_admin.run_seed)
 
 
+@app.on_event("shutdown")
+async def shutdown_events():
+    await ai_assistant.fechar_client()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
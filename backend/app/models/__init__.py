@@ -6,6 +6,7 @@ from app.models.entities import (
     Profissional,
     Paciente,
     Agenda,
+    AgendaModelo,
     Atendimento,
     EvolucaoProntuario,
     AnexoClinico,
@@ -14,8 +15,15 @@ from app.models.entities import (
     ExportacaoAPAC,
     CompetenciaAberta,
     TabelaSIGTAP,
+    SigtapImportacao,
+    SigtapProcedimentoCID,
+    SigtapProcedimentoCBO,
+    SigtapProcedimentoHabilitacao,
+    SigtapProcedimentoServico,
     TabelaAuxiliar,
     AuditLog,
+    AuditoriaPendencia,
+    AuditoriaSnapshot,
     CmdContato,
     CmdConfigTenant,
     Role,
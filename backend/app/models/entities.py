@@ -1,6 +1,6 @@
 from datetime import datetime, date
 from enum import Enum
-from sqlalchemy import Column, String, Integer, Date, DateTime, Boolean, ForeignKey, Text, JSON, Numeric, UniqueConstraint, Index
+from sqlalchemy import Column, String, Integer, Date, DateTime, Time, Boolean, ForeignKey, Text, JSON, Numeric, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -57,7 +57,10 @@ class TenantUserRole(Base):
     role = Column(String(50), nullable=False)
     ativo = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    __table_args__ = (UniqueConstraint("user_id", "tenant_id", "role", name="uq_user_tenant_role"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "tenant_id", "role", name="uq_user_tenant_role"),
+        Index("idx_tenantuserrole_tenant_user", "tenant_id", "user_id"),
+    )
 
 
 class Profissional(Base):
@@ -98,8 +101,35 @@ class Agenda(Base):
     profissional_id = Column(Integer, ForeignKey("profissionais.id"), nullable=False)
     paciente_id = Column(Integer, ForeignKey("pacientes.id"), nullable=True)
     data = Column(DateTime, nullable=False)
+    duracao_minutos = Column(Integer, nullable=False, default=30, server_default="30")
     tipo = Column(String(50), nullable=False)
     status = Column(String(50), nullable=False, default="livre")
+    __table_args__ = (
+        Index("idx_agendas_tenant_prof_data", "tenant_id", "profissional_id", "data"),
+        Index("idx_agendas_tenant_unidade_data", "tenant_id", "unidade_id", "data"),
+        Index("idx_agendas_tenant_status_data", "tenant_id", "status", "data"),
+    )
+
+
+class AgendaModelo(Base):
+    """
+    Faixa semanal de atendimento de um profissional (dia da semana, horario e tamanho
+    do horario), usada para gerar as agendas livres de um periodo.
+    """
+    __tablename__ = "agenda_modelos"
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    unidade_id = Column(Integer, ForeignKey("unidades.id"), nullable=False)
+    profissional_id = Column(Integer, ForeignKey("profissionais.id"), nullable=False)
+    dia_semana = Column(Integer, nullable=False)  # 0 = segunda, como date.weekday()
+    hora_inicio = Column(Time, nullable=False)
+    hora_fim = Column(Time, nullable=False)
+    duracao_minutos = Column(Integer, nullable=False, default=30)
+    tipo = Column(String(50), nullable=False, default="consulta")
+    ativo = Column(Boolean, nullable=False, default=True)
+    __table_args__ = (
+        Index("idx_agenda_modelos_tenant_prof", "tenant_id", "profissional_id"),
+    )
 
 
 class Atendimento(Base):
@@ -138,6 +168,12 @@ class AnexoClinico(Base):
     url = Column(String(255), nullable=False)
     hash = Column(String(64), nullable=True)
     criado_em = Column(DateTime, default=datetime.utcnow)
+    storage_key = Column(String(255), nullable=True)
+    nome_arquivo = Column(String(255), nullable=True)
+    content_type = Column(String(100), nullable=True)
+    tamanho_bytes = Column(Integer, nullable=True)
+    # pendente: URL de upload direto emitida, hash ainda nao conferido
+    status = Column(String(20), nullable=False, default="disponivel", server_default="disponivel")
 
 
 class ProcedimentoSUS(Base):
@@ -161,7 +197,11 @@ class ExportacaoBPA(Base):
     competencia = Column(String(6), nullable=False)
     unidade_id = Column(Integer, ForeignKey("unidades.id"), nullable=False)
     arquivo_path = Column(String(255), nullable=True)
-    checksum = Column(String(10), nullable=True)
+    checksum = Column(String(64), nullable=True)
+    entrada_hash = Column(String(64), nullable=True, index=True)
+    tamanho_bytes = Column(Integer, nullable=True)
+    tamanho_comprimido = Column(Integer, nullable=True)
+    storage_key = Column(String(255), nullable=True)
     status = Column(String(50), nullable=False, default="gerado")
     erros_json = Column(JSON, default={})
 
@@ -173,7 +213,11 @@ class ExportacaoAPAC(Base):
     competencia = Column(String(6), nullable=False)
     unidade_id = Column(Integer, ForeignKey("unidades.id"), nullable=False)
     arquivo_path = Column(String(255), nullable=True)
-    checksum = Column(String(10), nullable=True)
+    checksum = Column(String(64), nullable=True)
+    entrada_hash = Column(String(64), nullable=True, index=True)
+    tamanho_bytes = Column(Integer, nullable=True)
+    tamanho_comprimido = Column(Integer, nullable=True)
+    storage_key = Column(String(255), nullable=True)
     status = Column(String(50), nullable=False, default="gerado")
     erros_json = Column(JSON, default={})
 
@@ -207,6 +251,70 @@ class TabelaSIGTAP(Base):
     idade_max = Column(Integer, nullable=True)
     vigencia_inicio = Column(String(6), nullable=True)
     vigencia_fim = Column(String(6), nullable=True)
+    __table_args__ = (
+        Index("idx_sigtap_codigo_vigencia", "codigo", "vigencia_inicio"),
+    )
+
+
+class SigtapImportacao(Base):
+    """
+    Competencias ja aplicadas pelo importador incremental, com o resumo do delta.
+    Necessario porque uma competencia sem mudancas nao grava nenhuma linha em `tabelas_sigtap`.
+    """
+    __tablename__ = "sigtap_importacoes"
+    competencia = Column(String(6), primary_key=True)
+    importado_em = Column(DateTime, default=datetime.utcnow)
+    novos = Column(Integer, nullable=False, default=0)
+    alterados = Column(Integer, nullable=False, default=0)
+    inalterados = Column(Integer, nullable=False, default=0)
+    relatorio_json = Column(JSON, default={})
+
+
+class SigtapProcedimentoCID(Base):
+    """
+    CIDs aceitos por procedimento (rl_procedimento_cid), com janela de vigencia.
+    As quatro tabelas de relacao seguem o mesmo formato; ver `sigtap_compatibilidades`.
+    """
+    __tablename__ = "sigtap_procedimento_cid"
+    id = Column(Integer, primary_key=True)
+    procedimento = Column(String(10), nullable=False)
+    codigo = Column(String(4), nullable=False)
+    vigencia_inicio = Column(String(6), nullable=False)
+    vigencia_fim = Column(String(6), nullable=True)
+    __table_args__ = (Index("idx_sigtap_cid_proc_codigo", "procedimento", "codigo", "vigencia_inicio"),)
+
+
+class SigtapProcedimentoCBO(Base):
+    __tablename__ = "sigtap_procedimento_cbo"
+    id = Column(Integer, primary_key=True)
+    procedimento = Column(String(10), nullable=False)
+    codigo = Column(String(6), nullable=False)
+    vigencia_inicio = Column(String(6), nullable=False)
+    vigencia_fim = Column(String(6), nullable=True)
+    __table_args__ = (Index("idx_sigtap_cbo_proc_codigo", "procedimento", "codigo", "vigencia_inicio"),)
+
+
+class SigtapProcedimentoHabilitacao(Base):
+    __tablename__ = "sigtap_procedimento_habilitacao"
+    id = Column(Integer, primary_key=True)
+    procedimento = Column(String(10), nullable=False)
+    codigo = Column(String(4), nullable=False)
+    vigencia_inicio = Column(String(6), nullable=False)
+    vigencia_fim = Column(String(6), nullable=True)
+    __table_args__ = (Index("idx_sigtap_hab_proc_codigo", "procedimento", "codigo", "vigencia_inicio"),)
+
+
+class SigtapProcedimentoServico(Base):
+    """
+    Servico/classificacao aceitos por procedimento; `codigo` = CO_SERVICO + CO_CLASSIFICACAO.
+    """
+    __tablename__ = "sigtap_procedimento_servico"
+    id = Column(Integer, primary_key=True)
+    procedimento = Column(String(10), nullable=False)
+    codigo = Column(String(6), nullable=False)
+    vigencia_inicio = Column(String(6), nullable=False)
+    vigencia_fim = Column(String(6), nullable=True)
+    __table_args__ = (Index("idx_sigtap_serv_proc_codigo", "procedimento", "codigo", "vigencia_inicio"),)
 
 
 class TabelaAuxiliar(Base):
@@ -270,3 +378,28 @@ class AuditLog(Base):
     entidade_id = Column(String(50), nullable=True)
     meta_json = Column(JSON, default={})
     criado_em = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class AuditoriaPendencia(Base):
+    """Procedimento afetado por escrita desde o ultimo snapshot de auditoria."""
+
+    __tablename__ = "auditoria_pendencias"
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    procedimento_id = Column(Integer, nullable=False)
+    competencia = Column(String(6), nullable=False)
+    marcado_em = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("idx_auditpend_tenant_competencia", "tenant_id", "competencia"),
+        Index("uq_auditpend_tenant_proc_competencia", "tenant_id", "procedimento_id", "competencia", unique=True),
+    )
+
+
+class AuditoriaSnapshot(Base):
+    __tablename__ = "auditoria_snapshots"
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    competencia = Column(String(6), nullable=False)
+    resultado_json = Column(JSON, default={})
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (UniqueConstraint("tenant_id", "competencia", name="uq_auditsnap_tenant_competencia"),)
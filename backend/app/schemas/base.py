@@ -1,6 +1,6 @@
-from datetime import datetime, date
+from datetime import datetime, date, time
 from typing import Optional, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class TenantBase(BaseModel):
@@ -96,6 +96,7 @@ class AgendaBase(BaseModel):
     profissional_id: int
     paciente_id: int | None = None
     data: datetime
+    duracao_minutos: int = Field(30, ge=5, le=480)
     tipo: str
     status: str
 
@@ -111,6 +112,41 @@ class Agenda(AgendaBase):
         from_attributes = True
 
 
+class AgendaModeloBase(BaseModel):
+    unidade_id: int
+    profissional_id: int
+    dia_semana: int = Field(ge=0, le=6, description="0 = segunda ... 6 = domingo")
+    hora_inicio: time
+    hora_fim: time
+    duracao_minutos: int = Field(30, ge=5, le=480)
+    tipo: str = "consulta"
+    ativo: bool = True
+
+    @model_validator(mode="after")
+    def _faixa_valida(self):
+        if self.hora_fim <= self.hora_inicio:
+            raise ValueError("hora_fim deve ser posterior a hora_inicio")
+        return self
+
+
+class AgendaModeloCreate(AgendaModeloBase):
+    pass
+
+
+class AgendaModelo(AgendaModeloBase):
+    id: int
+    tenant_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class AgendaGeracao(BaseModel):
+    de: date
+    ate: date
+    profissional_ids: list[int] | None = None
+
+
 class AtendimentoBase(BaseModel):
     tenant_id: int
     unidade_id: int
@@ -153,6 +189,31 @@ class Evolucao(EvolucaoBase):
         from_attributes = True
 
 
+class AnexoClinico(BaseModel):
+    id: int
+    tenant_id: int
+    atendimento_id: int
+    tipo: str
+    url: str
+    hash: str | None = None
+    nome_arquivo: str | None = None
+    content_type: str | None = None
+    tamanho_bytes: int | None = None
+    status: str
+    criado_em: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AnexoUploadDireto(BaseModel):
+    tipo: str
+    sha256: str = Field(pattern="^[0-9a-fA-F]{64}$")
+    tamanho_bytes: int = Field(gt=0)
+    content_type: str = "application/octet-stream"
+    nome_arquivo: str | None = None
+
+
 class ProcedimentoBase(BaseModel):
     tenant_id: int
     atendimento_id: int
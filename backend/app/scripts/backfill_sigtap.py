@@ -0,0 +1,61 @@
+"""
+Carga de historico SIGTAP para um intervalo de competencias.
+
+    python -m app.scripts.backfill_sigtap --inicio 202301 --fim 202412
+    python -m app.scripts.backfill_sigtap --fim 202412 --meses 24 --workers 6
+
+Pacotes sao baixados e lidos em paralelo (pool de processos) e aplicados em ordem
+cronologica pelo importador incremental; uma linha de progresso por competencia.
+"""
+import argparse
+import sys
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.services import sigtap_backfill
+from app.services.sigtap_sync import TabelaSIGTAPRepository
+
+
+def _imprimir(resultado: dict) -> None:
+    prefixo = f"[{resultado['indice']:>3}/{resultado['total']}] {resultado['competencia']}"
+    if resultado["status"] == "importada":
+        delta = resultado["delta"]
+        print(f"{prefixo} importada: {delta['novos']} novos, {delta['alterados']} alterados, {delta['inalterados']} inalterados", flush=True)
+    elif resultado["status"] == "erro":
+        print(f"{prefixo} ERRO: {resultado['erro']}", flush=True)
+    else:
+        print(f"{prefixo} ja importada", flush=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inicio", help="Competencia inicial (AAAAMM)")
+    parser.add_argument("--fim", required=True, help="Competencia final (AAAAMM)")
+    parser.add_argument("--meses", type=int, help="Alternativa a --inicio: quantidade de competencias ate --fim")
+    parser.add_argument("--workers", type=int, default=settings.sigtap_backfill_workers)
+    parser.add_argument("--reimportar", action="store_true", help="Reaplica competencias ja importadas")
+    args = parser.parse_args()
+
+    if bool(args.inicio) == bool(args.meses):
+        parser.error("informe --inicio ou --meses")
+    settings.sigtap_backfill_workers = args.workers
+    try:
+        if args.meses:
+            competencias = sigtap_backfill.intervalo_anterior(args.fim, args.meses)
+        else:
+            competencias = sigtap_backfill.competencias_intervalo(args.inicio, args.fim)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    session = SessionLocal()
+    try:
+        resultados = sigtap_backfill.backfill(
+            TabelaSIGTAPRepository(session), competencias, reimportar=args.reimportar, progresso=_imprimir
+        )
+    finally:
+        session.close()
+    return 1 if any(r["status"] == "erro" for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
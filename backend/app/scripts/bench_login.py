@@ -0,0 +1,141 @@
+"""
+Benchmark do pico de login: vazao de /login e latencia de uma rota comum concorrente.
+
+    python -m app.scripts.bench_login --logins 400 --concorrencia 100
+    python -m app.scripts.bench_login --rounds 12 --threads 40
+
+Compara o login antigo (bcrypt inline numa rota sync, ocupando o threadpool) com o
+login atual (`authenticate_user_async`, bcrypt no executor limitado). Durante o pico,
+outra leva de requisicoes chama uma rota sync leve; o p95 dela mostra quanto o bcrypt
+atrasa o restante da API.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import anyio
+import httpx
+from fastapi import Depends, FastAPI
+from passlib.context import CryptContext
+from pydantic import BaseModel
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import auth, models
+from app.database import Base
+
+
+class _Login(BaseModel):
+    email: str
+    password: str
+    tenant_id: int
+
+
+def _seed(engine, usuarios: int, rounds: int) -> None:
+    Base.metadata.create_all(engine)
+    hash_senha = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("secret")
+    with Session(engine) as db:
+        db.add(models.Tenant(id=1, name="Bench"))
+        db.add_all(models.Usuario(id=i, email=f"u{i}@bench", nome=f"U{i}", hashed_password=hash_senha, ativo=True) for i in range(1, usuarios + 1))
+        db.add_all(models.TenantUserRole(user_id=i, tenant_id=1, role=models.Role.RECEPCAO.value, ativo=True) for i in range(1, usuarios + 1))
+        db.commit()
+
+
+def _montar_app(database_url: str) -> FastAPI:
+    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+    def get_db():
+        with SessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.post("/inline/login")
+    def login_inline(payload: _Login, db: Session = Depends(get_db)):
+        user = db.scalars(select(models.Usuario).where(models.Usuario.email == payload.email)).first()
+        if not user or not auth.pwd_context.verify(payload.password, user.hashed_password):
+            return {"ok": False}
+        return {"ok": True}
+
+    @app.post("/executor/login")
+    async def login_executor(payload: _Login, db: Session = Depends(get_db)):
+        await auth.authenticate_user_async(db, payload.email, payload.password, payload.tenant_id)
+        return {"ok": True}
+
+    @app.get("/ping")
+    def ping(db: Session = Depends(get_db)):
+        return {"tenant": db.get(models.Tenant, 1).name}
+
+    return app
+
+
+def _p95(valores: list) -> float:
+    return statistics.quantiles(valores, n=20)[-1] if len(valores) > 1 else valores[0]
+
+
+async def _rodar(app: FastAPI, modo: str, args) -> None:
+    transport = httpx.ASGITransport(app=app)
+    semaforo = asyncio.Semaphore(args.concorrencia)
+    latencias_ping: list = []
+    recusados = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def login(i: int):
+            nonlocal recusados
+            async with semaforo:
+                corpo = {"email": f"u{i % args.usuarios + 1}@bench", "password": "secret", "tenant_id": 1}
+                resp = await client.post(f"/{modo}/login", json=corpo)
+                if resp.status_code == 503:
+                    recusados += 1  # fila do bcrypt cheia (bcrypt_fila_max)
+                    return
+                resp.raise_for_status()
+
+        async def pings():
+            for _ in range(args.pings):
+                inicio = time.perf_counter()
+                (await client.get("/ping")).raise_for_status()
+                latencias_ping.append((time.perf_counter() - inicio) * 1000)
+                await asyncio.sleep(0.01)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(pings(), *(login(i) for i in range(args.logins)))
+        duracao = time.perf_counter() - inicio
+    print(
+        f"{modo:9s} logins/s={(args.logins - recusados) / duracao:8.1f} "
+        f"ping p50={statistics.median(latencias_ping):8.1f}ms p95={_p95(latencias_ping):8.1f}ms recusados={recusados}"
+    )
+
+
+async def main_async(args) -> None:
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    # Mesmo custo no seed e no contexto: o benchmark mede o login, nao o rehash
+    auth.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds)
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        _seed(create_engine(database_url), args.usuarios, args.rounds)
+        app = _montar_app(database_url)
+        print(
+            f"logins={args.logins} concorrencia={args.concorrencia} threads={args.threads} "
+            f"rounds={args.rounds} bcrypt_workers={auth._bcrypt_executor._max_workers}"
+        )
+        for modo in ("inline", "executor"):
+            await _rodar(app, modo, args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=100)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--pings", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=40)
+    anyio.run(main_async, parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
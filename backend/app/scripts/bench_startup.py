@@ -0,0 +1,75 @@
+"""
+Benchmark de inicializacao da API: tempo de `import app.main` e do boot (eventos de startup).
+
+    python -m app.scripts.bench_startup --execucoes 5
+    python -m app.scripts.bench_startup --top 15   # maiores imports cumulativos (-X importtime)
+
+Cada execucao roda num interpretador novo, para medir o import a frio.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_MEDICAO = r"""
+import json, sys, time
+antes = len(sys.modules)
+inicio = time.perf_counter()
+import app.main
+importado = time.perf_counter()
+modulos = len(sys.modules) - antes
+pesados = sorted(m for m in ("boto3", "botocore", "celery", "kombu", "redis") if m in sys.modules)
+from fastapi.testclient import TestClient
+with TestClient(app.main.app):
+    pronto = time.perf_counter()
+print(json.dumps({
+    "import_ms": (importado - inicio) * 1000,
+    "boot_ms": (pronto - importado) * 1000,
+    "modulos": modulos,
+    "pesados": pesados,
+}))
+"""
+
+
+def _executar(env: dict) -> dict:
+    saida = subprocess.run([sys.executable, "-c", _MEDICAO], capture_output=True, text=True, env=env, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def _top_imports(env: dict, top: int) -> list:
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, env=env, check=True)
+    linhas = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, modulo = linha.split("|")
+        linhas.append((int(cumulativo), modulo.strip()))
+    return sorted(linhas, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--execucoes", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///./bench_startup.db")
+    env.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")  # broker inexistente: o boot nao pode depender dele
+
+    medicoes = [_executar(env) for _ in range(args.execucoes)]
+    for chave in ("import_ms", "boot_ms"):
+        valores = [m[chave] for m in medicoes]
+        print(f"{chave:10s} mediana={statistics.median(valores):8.1f} min={min(valores):8.1f} max={max(valores):8.1f}")
+    print(f"modulos carregados no import: {medicoes[0]['modulos']}")
+    print(f"dependencias pesadas carregadas: {', '.join(medicoes[0]['pesados']) or 'nenhuma'}")
+    if args.top:
+        print("\nmaiores imports cumulativos (us):")
+        for micros, modulo in _top_imports(env, args.top):
+            print(f"{micros:10d}  {modulo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Servidor local que imita `/chat/completions` para testes e carga do assistente.
+
+    uvicorn app.scripts.fake_ai_server:app --port 8099
+    AI_BASE_URL=http://localhost:8099 AI_API_KEY=fake AI_MODEL_NAME=fake uvicorn app.main:app
+
+FAKE_AI_LATENCIA_MS controla o atraso entre trechos (padrao 50 ms).
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+RESPOSTA = "Sugestao de apoio: revise os sinais vitais e confirme o CID antes de registrar o procedimento."
+LATENCIA = int(os.getenv("FAKE_AI_LATENCIA_MS", "50")) / 1000
+
+app = FastAPI(title="fake-ai")
+
+
+def _trechos():
+    return [palavra + " " for palavra in RESPOSTA.split(" ")]
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    criado = int(time.time())
+    if not body.get("stream"):
+        await asyncio.sleep(LATENCIA * len(_trechos()))
+        return {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": criado,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": RESPOSTA}, "finish_reason": "stop"}],
+        }
+
+    async def eventos():
+        for trecho in _trechos():
+            await asyncio.sleep(LATENCIA)
+            chunk = {"id": "fake", "object": "chat.completion.chunk", "created": criado, "choices": [{"index": 0, "delta": {"content": trecho}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
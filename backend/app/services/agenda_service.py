@@ -0,0 +1,219 @@
+"""
+Disponibilidade de agenda: conflito de horario por profissional e busca de horarios livres.
+
+Uma agenda ocupa [data, data + duracao_minutos) do profissional, em qualquer unidade,
+enquanto nao estiver cancelada. Como a duracao e limitada a `DURACAO_MAXIMA_MINUTOS`,
+so podem cruzar um intervalo as agendas que comecam ate essa duracao antes dele: a
+consulta e uma faixa do indice (tenant_id, profissional_id, data), nunca a agenda
+inteira do tenant.
+
+Modelos semanais (`AgendaModelo`) geram as agendas livres de um periodo de uma vez:
+uma consulta carrega as agendas ja existentes de todos os profissionais no periodo,
+os horarios em conflito sao descartados em memoria e o restante vai num insert em lote.
+"""
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+DURACAO_MAXIMA_MINUTOS = 480
+STATUS_LIVRE = "livre"
+STATUS_INATIVOS = ("cancelado",)
+
+GERACAO_MAXIMA_DIAS = 92
+_LOTE = 1000
+
+_DURACAO_MAXIMA = timedelta(minutes=DURACAO_MAXIMA_MINUTOS)
+
+Intervalo = Tuple[datetime, datetime, Optional[int]]
+
+
+def termino(inicio: datetime, duracao_minutos: Optional[int]) -> datetime:
+    return inicio + timedelta(minutes=duracao_minutos or 30)
+
+
+class IndiceIntervalos:
+    """
+    Intervalos ocupados por profissional, ordenados pelo inicio. O conflito de um
+    intervalo novo e uma busca binaria pela faixa de inicios que pode cruza-lo.
+    """
+
+    def __init__(self) -> None:
+        self._por_profissional: Dict[int, List[Intervalo]] = {}
+
+    def adicionar(self, profissional_id: int, inicio: datetime, fim: datetime, agenda_id: Optional[int] = None) -> None:
+        insort(self._por_profissional.setdefault(profissional_id, []), (inicio, fim, agenda_id), key=lambda i: i[0])
+
+    def conflitos(self, profissional_id: int, inicio: datetime, fim: datetime) -> List[Optional[int]]:
+        intervalos = self._por_profissional.get(profissional_id, [])
+        primeiro = bisect_left(intervalos, inicio - _DURACAO_MAXIMA, key=lambda i: i[0])
+        ultimo = bisect_left(intervalos, fim, key=lambda i: i[0])
+        return [agenda_id for _, fim_ocupado, agenda_id in intervalos[primeiro:ultimo] if fim_ocupado > inicio]
+
+    @classmethod
+    def carregar(
+        cls,
+        db: Session,
+        tenant_id: int,
+        profissional_ids: Iterable[int],
+        inicio: datetime,
+        fim: datetime,
+        ignorar_id: Optional[int] = None,
+    ) -> "IndiceIntervalos":
+        """
+        Agendas ativas dos profissionais que podem cruzar [inicio, fim), numa consulta.
+        """
+        stmt = select(
+            models.Agenda.id, models.Agenda.profissional_id, models.Agenda.data, models.Agenda.duracao_minutos
+        ).where(
+            models.Agenda.tenant_id == tenant_id,
+            models.Agenda.profissional_id.in_(set(profissional_ids)),
+            models.Agenda.data > inicio - _DURACAO_MAXIMA,
+            models.Agenda.data < fim,
+            models.Agenda.status.notin_(STATUS_INATIVOS),
+        )
+        if ignorar_id is not None:
+            stmt = stmt.where(models.Agenda.id != ignorar_id)
+        indice = cls()
+        for agenda_id, profissional_id, data, duracao in db.execute(stmt):
+            indice.adicionar(profissional_id, data, termino(data, duracao), agenda_id)
+        return indice
+
+
+def bloquear_profissionais(db: Session, profissional_ids: Iterable[int]) -> None:
+    # Serializa checagem + insercao por profissional (no-op no SQLite)
+    db.execute(
+        select(models.Profissional.id)
+        .where(models.Profissional.id.in_(sorted(set(profissional_ids))))
+        .order_by(models.Profissional.id)
+        .with_for_update()
+    ).all()
+
+
+def verificar_conflitos(
+    db: Session,
+    tenant_id: int,
+    profissional_id: int,
+    inicio: datetime,
+    duracao_minutos: Optional[int],
+    ignorar_id: Optional[int] = None,
+) -> List[int]:
+    """
+    Ids das agendas ativas do profissional que se sobrepoem ao horario. Bloqueia o
+    profissional ate o fim da transacao para que outra requisicao nao ocupe o mesmo horario.
+    """
+    fim = termino(inicio, duracao_minutos)
+    bloquear_profissionais(db, [profissional_id])
+    indice = IndiceIntervalos.carregar(db, tenant_id, [profissional_id], inicio, fim, ignorar_id=ignorar_id)
+    return sorted(indice.conflitos(profissional_id, inicio, fim))
+
+
+def consulta_livres(
+    tenant_id: int,
+    a_partir_de: datetime,
+    limite: int,
+    profissional_id: Optional[int] = None,
+    unidade_id: Optional[int] = None,
+    cbo: Optional[str] = None,
+):
+    """
+    Proximos horarios livres, pelo indice (tenant_id, status, data): le `limite` linhas.
+    A especialidade e o CBO do profissional.
+
+    So enxerga agendas ja materializadas com status livre (`gerar_agendas` a partir dos
+    modelos, ou cadastradas a mao): lacunas na grade de um profissional sem agenda gerada
+    para o periodo nao aparecem aqui.
+    """
+    stmt = (
+        select(models.Agenda)
+        .where(
+            models.Agenda.tenant_id == tenant_id,
+            models.Agenda.status == STATUS_LIVRE,
+            models.Agenda.paciente_id.is_(None),
+            models.Agenda.data >= a_partir_de,
+        )
+        .order_by(models.Agenda.data, models.Agenda.id)
+        .limit(limite)
+    )
+    if profissional_id is not None:
+        stmt = stmt.where(models.Agenda.profissional_id == profissional_id)
+    if unidade_id is not None:
+        stmt = stmt.where(models.Agenda.unidade_id == unidade_id)
+    if cbo:
+        stmt = stmt.join(models.Profissional, models.Profissional.id == models.Agenda.profissional_id).where(
+            models.Profissional.cbo == cbo
+        )
+    return stmt
+
+
+def _horarios(modelo, dia: date) -> Iterable[Tuple[datetime, datetime]]:
+    inicio = datetime.combine(dia, modelo.hora_inicio)
+    limite = datetime.combine(dia, modelo.hora_fim)
+    passo = timedelta(minutes=modelo.duracao_minutos)
+    while inicio + passo <= limite:
+        yield inicio, inicio + passo
+        inicio += passo
+
+
+def gerar_agendas(
+    db: Session,
+    tenant_id: int,
+    de: date,
+    ate: date,
+    profissional_ids: Optional[Iterable[int]] = None,
+) -> dict:
+    """
+    Materializa os modelos ativos do tenant em agendas livres de `de` a `ate`
+    (inclusive), sem commit. Horario que cruza agenda ativa existente, ou outro
+    horario gerado, e ignorado.
+    """
+    if ate < de:
+        raise ValueError("Data final anterior a inicial")
+    if (ate - de).days + 1 > GERACAO_MAXIMA_DIAS:
+        raise ValueError(f"Periodo maior que {GERACAO_MAXIMA_DIAS} dias")
+
+    stmt = select(models.AgendaModelo).where(models.AgendaModelo.tenant_id == tenant_id, models.AgendaModelo.ativo.is_(True))
+    if profissional_ids is not None:
+        stmt = stmt.where(models.AgendaModelo.profissional_id.in_(set(profissional_ids)))
+    por_dia_semana: Dict[int, List[models.AgendaModelo]] = {}
+    for modelo in db.scalars(stmt.order_by(models.AgendaModelo.profissional_id, models.AgendaModelo.hora_inicio)):
+        por_dia_semana.setdefault(modelo.dia_semana, []).append(modelo)
+    profissionais = {m.profissional_id for modelos in por_dia_semana.values() for m in modelos}
+    if not profissionais:
+        return {"criadas": 0, "conflitos": 0, "profissionais": 0}
+
+    inicio_periodo = datetime.combine(de, datetime.min.time())
+    fim_periodo = datetime.combine(ate + timedelta(days=1), datetime.min.time())
+    bloquear_profissionais(db, profissionais)
+    indice = IndiceIntervalos.carregar(db, tenant_id, profissionais, inicio_periodo, fim_periodo)
+
+    novas: List[dict] = []
+    conflitos = 0
+    dia = de
+    while dia <= ate:
+        for modelo in por_dia_semana.get(dia.weekday(), []):
+            for inicio, fim in _horarios(modelo, dia):
+                if indice.conflitos(modelo.profissional_id, inicio, fim):
+                    conflitos += 1
+                    continue
+                indice.adicionar(modelo.profissional_id, inicio, fim)
+                novas.append(
+                    {
+                        "tenant_id": tenant_id,
+                        "unidade_id": modelo.unidade_id,
+                        "profissional_id": modelo.profissional_id,
+                        "data": inicio,
+                        "duracao_minutos": modelo.duracao_minutos,
+                        "tipo": modelo.tipo,
+                        "status": STATUS_LIVRE,
+                    }
+                )
+        dia += timedelta(days=1)
+
+    for inicio in range(0, len(novas), _LOTE):
+        db.execute(insert(models.Agenda), novas[inicio:inicio + _LOTE])
+    return {"criadas": len(novas), "conflitos": conflitos, "profissionais": len(profissionais)}
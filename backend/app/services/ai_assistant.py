@@ -1,40 +1,118 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
 import httpx
 
 from app.core.config import settings
 
+SYSTEM_PROMPT = (
+    "Você é um assistente clínico de apoio. "
+    "Suas respostas são sugestões e não substituem o julgamento profissional. "
+    "Nunca invente dados que não estejam no contexto fornecido; se faltar informação, peça mais detalhes."
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_semaforos: Dict[int, asyncio.Semaphore] = {}
+
+
+class LimiteConcorrenciaExcedido(Exception):
+    pass
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartilhado pelo processo: reaproveita conexoes (keep-alive) com o provedor.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=settings.ai_base_url.rstrip("/"),
+            timeout=httpx.Timeout(settings.ai_timeout_seconds, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.ai_max_conexoes,
+                max_keepalive_connections=settings.ai_max_conexoes,
+            ),
+        )
+    return _client
+
+
+async def fechar_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@asynccontextmanager
+async def limite_tenant(tenant_id: int):
+    """
+    Limita chamadas simultaneas ao modelo por tenant; excedentes falham na hora em vez de enfileirar.
+    """
+    semaforo = _semaforos.setdefault(tenant_id, asyncio.Semaphore(settings.ai_max_concorrencia_tenant))
+    if semaforo.locked():
+        raise LimiteConcorrenciaExcedido(tenant_id)
+    async with semaforo:
+        yield
+
 
 class AiAssistantService:
-    def __init__(self) -> None:
+    def __init__(self, client: Optional[httpx.AsyncClient] = None) -> None:
         if not settings.ai_api_key or not settings.ai_model_name:
             raise RuntimeError("AI API key ou modelo não configurado")
         self.api_key = settings.ai_api_key
         self.model = settings.ai_model_name
+        self.client = client or get_client()
 
-    def gerar_resposta(self, contexto: dict, mensagem_usuario: str) -> str:
-        """
-        Envia contexto e mensagem do profissional para o modelo de chat e retorna a resposta de apoio clínico.
-        """
-        system_prompt = (
-            "Você é um assistente clínico de apoio. "
-            "Suas respostas são sugestões e não substituem o julgamento profissional. "
-            "Nunca invente dados que não estejam no contexto fornecido; se faltar informação, peça mais detalhes."
-        )
+    def _payload(self, contexto: dict, mensagem_usuario: str, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": f"Contexto paciente: {contexto}"},
                 {"role": "user", "content": mensagem_usuario},
             ],
             "temperature": 0.2,
         }
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        response = httpx.post(
-            "https://api.openai.com/v1/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=30,
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def gerar_resposta(self, contexto: dict, mensagem_usuario: str) -> str:
+        """
+        Envia contexto e mensagem do profissional para o modelo de chat e retorna a resposta de apoio clínico.
+        """
+        response = await self.client.post(
+            "/chat/completions",
+            json=self._payload(contexto, mensagem_usuario),
+            headers=self._headers(),
         )
         response.raise_for_status()
         data = response.json()
         return data["choices"][0]["message"]["content"]
+
+    async def gerar_resposta_stream(self, contexto: dict, mensagem_usuario: str) -> AsyncIterator[str]:
+        """
+        Mesma chamada com `stream=true`: devolve os trechos da resposta conforme o provedor os emite.
+        """
+        async with self.client.stream(
+            "POST",
+            "/chat/completions",
+            json=self._payload(contexto, mensagem_usuario, stream=True),
+            headers=self._headers(),
+        ) as response:
+            response.raise_for_status()
+            async for linha in response.aiter_lines():
+                if not linha.startswith("data:"):
+                    continue
+                dado = linha[len("data:"):].strip()
+                if dado == "[DONE]":
+                    break
+                escolhas = json.loads(dado).get("choices") or []
+                trecho = escolhas[0].get("delta", {}).get("content") if escolhas else None
+                if trecho:
+                    yield trecho
@@ -0,0 +1,129 @@
+"""
+Cache de respostas do assistente AI.
+
+A chave e o SHA-256 do contexto normalizado + mensagem + modelo, sempre prefixada
+pelo tenant, de modo que uma resposta nunca e servida a outro tenant. A identidade
+de quem pergunta (`usuario` no contexto) fica fora da chave: a resposta depende do
+paciente e da pergunta, e usuarios do mesmo tenant compartilham o cache. O backend em
+memoria aplica TTL e LRU; o backend Redis usa SETEX e delega a evicao ao Redis.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger("app.ai_cache")
+
+# Campos do contexto que identificam quem pergunta, nao o que e perguntado
+_FORA_DA_CHAVE = ("usuario",)
+
+
+def _normalizar(valor: Any) -> Any:
+    if isinstance(valor, str):
+        return " ".join(valor.split())
+    if isinstance(valor, dict):
+        return {str(k): _normalizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    return valor
+
+
+def chave_resposta(tenant_id: int, modelo: str, contexto: dict, mensagem: str) -> str:
+    payload = json.dumps(
+        {
+            "modelo": modelo,
+            "contexto": _normalizar({k: v for k, v in contexto.items() if k not in _FORA_DA_CHAVE}),
+            "mensagem": _normalizar(mensagem).casefold(),
+        },
+        sort_keys=True,
+        default=str,
+        separators=(",", ":"),
+    )
+    return f"ai:resposta:{tenant_id}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class CacheMemoria:
+    def __init__(self, ttl_seconds: int, max_itens: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_itens = max_itens
+        self._itens: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def obter(self, chave: str) -> Optional[str]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, resposta = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return resposta
+
+    async def guardar(self, chave: str, resposta: str) -> None:
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl_seconds, resposta)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+
+class CacheRedis:
+    def __init__(self, url: str, ttl_seconds: int) -> None:
+        from redis import asyncio as redis_asyncio
+
+        self.ttl_seconds = ttl_seconds
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def obter(self, chave: str) -> Optional[str]:
+        try:
+            return await self._redis.get(chave)
+        except Exception:
+            logger.warning("ai_cache_redis_indisponivel", exc_info=True)
+            return None
+
+    async def guardar(self, chave: str, resposta: str) -> None:
+        try:
+            await self._redis.set(chave, resposta, ex=self.ttl_seconds)
+        except Exception:
+            logger.warning("ai_cache_redis_indisponivel", exc_info=True)
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Cache configurado em `ai_cache_backend`, ou None quando desativado.
+    """
+    global _cache
+    if settings.ai_cache_backend == "none":
+        return None
+    if _cache is None:
+        if settings.ai_cache_backend == "redis":
+            _cache = CacheRedis(settings.redis_url, settings.ai_cache_ttl_seconds)
+        else:
+            _cache = CacheMemoria(settings.ai_cache_ttl_seconds, settings.ai_cache_max_itens)
+    return _cache
+
+
+async def obter(chave: str) -> Optional[str]:
+    cache = get_cache()
+    if cache is None:
+        return None
+    resposta = await cache.obter(chave)
+    metrics.AI_CACHE_CONSULTAS.labels(resultado="hit" if resposta is not None else "miss").inc()
+    return resposta
+
+
+async def guardar(chave: str, resposta: str) -> None:
+    cache = get_cache()
+    if cache is not None and resposta:
+        await cache.guardar(chave, resposta)
@@ -0,0 +1,94 @@
+"""
+Upload de anexos clinicos (exames, laudos) para o MinIO.
+
+Upload pela API: o corpo da requisicao e lido em blocos e repassado a um multipart
+upload do MinIO; o SHA-256 e calculado a medida que os blocos chegam. Em memoria fica
+no maximo uma parte (`PARTE_BYTES`), nunca o arquivo inteiro.
+
+Upload direto: a API emite uma URL pre-assinada de PUT e grava o anexo como
+`pendente` com o hash declarado pelo cliente. Na confirmacao o objeto e relido do
+MinIO em blocos e o hash recalculado no servidor; se nao bater, o objeto e apagado.
+"""
+import hashlib
+import uuid
+from typing import AsyncIterator, NamedTuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services import minio_service
+
+# Minimo do S3 para partes que nao sao a ultima e 5 MiB
+PARTE_BYTES = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+STATUS_PENDENTE = "pendente"
+STATUS_DISPONIVEL = "disponivel"
+STATUS_REJEITADO = "rejeitado"
+
+
+class TamanhoExcedido(Exception):
+    pass
+
+
+class ObjetoRecebido(NamedTuple):
+    key: str
+    sha256: str
+    tamanho_bytes: int
+
+
+def anexo_key(tenant_id: int, atendimento_id: int) -> str:
+    # O hash so e conhecido no fim do stream: a chave nao pode ser enderecada por conteudo
+    return f"anexos/{tenant_id}/{atendimento_id}/{uuid.uuid4().hex}"
+
+
+def url_objeto(key: str) -> str:
+    return f"s3://{settings.s3_bucket}/{key}"
+
+
+def tamanho_maximo() -> int:
+    return settings.anexo_tamanho_maximo_mb * 1024 * 1024
+
+
+async def receber_stream(blocos: AsyncIterator[bytes], key: str, content_type: str) -> ObjetoRecebido:
+    """
+    Envia o stream ao MinIO em partes e devolve o SHA-256 e o tamanho do que foi gravado.
+    Qualquer falha (inclusive `TamanhoExcedido` e desconexao do cliente) aborta o upload.
+    """
+    limite = tamanho_maximo()
+    digest = hashlib.sha256()
+    tamanho = 0
+    buffer = bytearray()
+    partes = []
+    upload_id = await run_in_threadpool(minio_service.iniciar_multipart, key, content_type)
+    try:
+        async for bloco in blocos:
+            tamanho += len(bloco)
+            if tamanho > limite:
+                raise TamanhoExcedido(f"Anexo maior que {settings.anexo_tamanho_maximo_mb} MB")
+            digest.update(bloco)
+            buffer += bloco
+            if len(buffer) >= PARTE_BYTES:
+                parte = await run_in_threadpool(minio_service.enviar_parte, key, upload_id, len(partes) + 1, bytes(buffer))
+                partes.append(parte)
+                buffer.clear()
+        if buffer or not partes:
+            # Ultima parte (pode ser menor que o minimo; arquivo vazio tambem precisa de uma)
+            partes.append(await run_in_threadpool(minio_service.enviar_parte, key, upload_id, len(partes) + 1, bytes(buffer)))
+        await run_in_threadpool(minio_service.concluir_multipart, key, upload_id, partes)
+    except Exception:
+        await run_in_threadpool(minio_service.abortar_multipart, key, upload_id)
+        raise
+    return ObjetoRecebido(key, digest.hexdigest(), tamanho)
+
+
+def calcular_hash_objeto(key: str) -> ObjetoRecebido:
+    """
+    SHA-256 e tamanho do objeto ja gravado, relido em blocos.
+    """
+    digest = hashlib.sha256()
+    tamanho = 0
+    for bloco in minio_service.ler_objeto(key, CHUNK_SIZE):
+        digest.update(bloco)
+        tamanho += len(bloco)
+    return ObjetoRecebido(key, digest.hexdigest(), tamanho)
@@ -0,0 +1,229 @@
+"""
+Rastreamento de procedimentos alterados para auditoria incremental da competencia.
+
+Toda escrita em ProcedimentoSUS, Atendimento, Paciente ou Profissional marca os
+procedimentos afetados em `auditoria_pendencias`. A auditoria incremental revalida
+apenas esse conjunto e o funde ao snapshot persistido em `auditoria_snapshots`.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import DateTime, delete, event, insert, inspect, literal, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+
+_LOTE_CONSUMO = 500
+
+
+def _foi_alterado(session: Session, obj) -> bool:
+    return obj in session.deleted or session.is_modified(obj, include_collections=False)
+
+
+def _competencias_anteriores(obj) -> Iterable[str]:
+    history = inspect(obj).attrs.competencia_aaaamm.history
+    return [c for c in (history.deleted or ()) if c]
+
+
+def _valores_anteriores(obj, atributo: str) -> Iterable[str]:
+    history = getattr(inspect(obj).attrs, atributo).history
+    return [v for v in (history.deleted or ()) if v]
+
+
+def _competencias_abertas_afetadas(obj) -> Set[tuple]:
+    cnes = {obj.unidade_cnes, *_valores_anteriores(obj, "unidade_cnes")}
+    competencias = {obj.competencia, *_valores_anteriores(obj, "competencia")}
+    return {(c, comp) for c in cnes for comp in competencias}
+
+
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_COLUNAS_PENDENCIA = ["tenant_id", "procedimento_id", "competencia", "marcado_em"]
+
+
+def _avancar_marcacao(stmt):
+    """
+    Numa pendencia ja existente para (tenant, procedimento, competencia) so avanca
+    `marcado_em`: uma linha por procedimento, e a remarcacao feita durante uma
+    auditoria nao bate com o par que ela consome.
+    """
+    return stmt.on_conflict_do_update(
+        index_elements=["tenant_id", "procedimento_id", "competencia"],
+        set_={"marcado_em": stmt.excluded.marcado_em},
+    )
+
+
+def _gravar_pendencias(conn, linhas: List[dict]) -> None:
+    construtor = _UPSERTS.get(conn.dialect.name)
+    if construtor is not None:
+        conn.execute(_avancar_marcacao(construtor(models.AuditoriaPendencia)), linhas)
+        return
+    # Sem upsert nativo: atualiza a pendencia existente e insere so as que faltam
+    pendencia = models.AuditoriaPendencia
+    for linha in linhas:
+        atualizadas = conn.execute(
+            update(pendencia)
+            .where(
+                pendencia.tenant_id == linha["tenant_id"],
+                pendencia.procedimento_id == linha["procedimento_id"],
+                pendencia.competencia == linha["competencia"],
+            )
+            .values(marcado_em=linha["marcado_em"])
+        ).rowcount
+        if not atualizadas:
+            conn.execute(insert(pendencia), [linha])
+
+
+def _gravar_pendencias_de(conn, consulta) -> None:
+    construtor = _UPSERTS.get(conn.dialect.name)
+    if construtor is not None:
+        conn.execute(_avancar_marcacao(construtor(models.AuditoriaPendencia).from_select(_COLUNAS_PENDENCIA, consulta)))
+        return
+    linhas = [dict(zip(_COLUNAS_PENDENCIA, linha)) for linha in conn.execute(consulta)]
+    if linhas:
+        _gravar_pendencias(conn, linhas)
+
+
+def _select_por_atendimento(filtro, marcado_em: datetime):
+    return (
+        select(
+            models.ProcedimentoSUS.tenant_id,
+            models.ProcedimentoSUS.id,
+            models.ProcedimentoSUS.competencia_aaaamm,
+            literal(marcado_em, DateTime),
+        )
+        .join(models.Atendimento, models.Atendimento.id == models.ProcedimentoSUS.atendimento_id)
+        .where(filtro)
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _marcar_pendencias(session: Session, flush_context) -> None:
+    objetos = list(session.new) + list(session.dirty) + list(session.deleted)
+    if not objetos:
+        return
+
+    agora = datetime.utcnow()
+    linhas: Dict[tuple, dict] = {}
+    atendimento_ids: Set[int] = set()
+    paciente_ids: Set[int] = set()
+    profissional_ids: Set[int] = set()
+    invalidar_competencias: Set[tuple] = set()
+    invalidar_tudo = False
+
+    for obj in objetos:
+        if isinstance(obj, models.ProcedimentoSUS):
+            if obj not in session.new and not _foi_alterado(session, obj):
+                continue
+            competencias = {obj.competencia_aaaamm, *_competencias_anteriores(obj)}
+            for competencia in competencias:
+                linhas[(obj.tenant_id, obj.id, competencia)] = {
+                    "tenant_id": obj.tenant_id,
+                    "procedimento_id": obj.id,
+                    "competencia": competencia,
+                    "marcado_em": agora,
+                }
+        elif isinstance(obj, models.Atendimento):
+            if obj not in session.new and _foi_alterado(session, obj):
+                atendimento_ids.add(obj.id)
+        elif isinstance(obj, models.Paciente):
+            if obj not in session.new and _foi_alterado(session, obj):
+                paciente_ids.add(obj.id)
+        elif isinstance(obj, models.Profissional):
+            if obj not in session.new and _foi_alterado(session, obj):
+                profissional_ids.add(obj.id)
+        elif isinstance(obj, models.CompetenciaAberta):
+            invalidar_competencias.update(_competencias_abertas_afetadas(obj))
+        elif isinstance(obj, models.TabelaSIGTAP):
+            invalidar_tudo = True
+
+    conn = session.connection()
+    if linhas:
+        _gravar_pendencias(conn, list(linhas.values()))
+
+    filtros = []
+    if atendimento_ids:
+        filtros.append(models.Atendimento.id.in_(atendimento_ids))
+    if paciente_ids:
+        filtros.append(models.Atendimento.paciente_id.in_(paciente_ids))
+    if profissional_ids:
+        filtros.append(models.Atendimento.profissional_id.in_(profissional_ids))
+    for filtro in filtros:
+        _gravar_pendencias_de(conn, _select_por_atendimento(filtro, agora))
+
+    # Mudancas em SIGTAP ou na abertura de competencia afetam todos os procedimentos:
+    # descarta o snapshot para forcar uma auditoria completa.
+    if invalidar_tudo:
+        conn.execute(delete(models.AuditoriaSnapshot))
+    else:
+        # Abertura de competencia vale por CNES: so os tenants com unidade naquele CNES
+        for cnes, competencia in invalidar_competencias:
+            tenants = select(models.Unidade.tenant_id).where(models.Unidade.cnes == cnes)
+            conn.execute(
+                delete(models.AuditoriaSnapshot).where(
+                    models.AuditoriaSnapshot.competencia == competencia,
+                    models.AuditoriaSnapshot.tenant_id.in_(tenants),
+                )
+            )
+
+
+def pendencias(db: Session, tenant_id: int, competencia: str) -> Dict[int, datetime]:
+    """
+    Pendencias da competencia lidas no inicio da auditoria: procedimento -> `marcado_em`.
+    Sao exatamente estes pares que `salvar_snapshot` consome.
+    """
+    stmt = select(models.AuditoriaPendencia.procedimento_id, models.AuditoriaPendencia.marcado_em).where(
+        models.AuditoriaPendencia.tenant_id == tenant_id,
+        models.AuditoriaPendencia.competencia == competencia,
+    )
+    return {procedimento_id: marcado_em for procedimento_id, marcado_em in db.execute(stmt)}
+
+
+def carregar_snapshot(db: Session, tenant_id: int, competencia: str) -> Optional[Dict[int, List[str]]]:
+    snapshot = db.scalars(
+        select(models.AuditoriaSnapshot).where(
+            models.AuditoriaSnapshot.tenant_id == tenant_id,
+            models.AuditoriaSnapshot.competencia == competencia,
+        )
+    ).first()
+    if snapshot is None:
+        return None
+    return {int(proc_id): erros for proc_id, erros in (snapshot.resultado_json or {}).items()}
+
+
+def salvar_snapshot(
+    db: Session,
+    tenant_id: int,
+    competencia: str,
+    erros_por_procedimento: Dict[int, List[str]],
+    consumidas: Dict[int, datetime],
+) -> None:
+    """
+    Persiste o snapshot e consome as pendencias incorporadas a ele: apenas os pares
+    (procedimento, marcado_em) lidos pela auditoria. Uma marcacao gravada depois da
+    leitura, mesmo com `marcado_em` anterior, ou uma remarcacao que avancou `marcado_em`,
+    sobrevive para a proxima auditoria.
+    """
+    snapshot = db.scalars(
+        select(models.AuditoriaSnapshot).where(
+            models.AuditoriaSnapshot.tenant_id == tenant_id,
+            models.AuditoriaSnapshot.competencia == competencia,
+        )
+    ).first()
+    if snapshot is None:
+        snapshot = models.AuditoriaSnapshot(tenant_id=tenant_id, competencia=competencia)
+    snapshot.resultado_json = {str(proc_id): erros for proc_id, erros in erros_por_procedimento.items()}
+    snapshot.atualizado_em = datetime.utcnow()
+    db.add(snapshot)
+    pares = list(consumidas.items())
+    for inicio in range(0, len(pares), _LOTE_CONSUMO):
+        db.execute(
+            delete(models.AuditoriaPendencia).where(
+                models.AuditoriaPendencia.tenant_id == tenant_id,
+                models.AuditoriaPendencia.competencia == competencia,
+                tuple_(models.AuditoriaPendencia.procedimento_id, models.AuditoriaPendencia.marcado_em).in_(
+                    pares[inicio:inicio + _LOTE_CONSUMO]
+                ),
+            )
+        )
+    db.commit()
@@ -0,0 +1,130 @@
+"""
+Resumo de erros de validacao de uma competencia, agregado no banco.
+
+Os tipos de erro vivem em `validacoes_json["erros"]` (lista de strings). No Postgres
+a lista e desaninhada com `jsonb_array_elements_text` e no SQLite com `json_each`;
+o GROUP BY roda no banco e so as linhas de exemplo voltam para o Python. Outros
+dialetos usam um fallback que percorre apenas a coluna JSON em lotes (`yield_per`).
+"""
+from collections import Counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, cast, func, literal, or_, select, true
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+ERRO_SEM_LISTA = "validacao_falhou_sem_erros"
+LIMITE_EXEMPLOS = 5
+_LOTE_FALLBACK = 1000
+
+Proc = models.ProcedimentoSUS
+
+
+def mensagens_erro(validacoes: Optional[dict]) -> List[str]:
+    resultado = validacoes or {}
+    erros = resultado.get("erros") or []
+    if resultado.get("ok") is False and not erros:
+        # Guarda estado inconsistente, mas sem lista de erros.
+        erros = [ERRO_SEM_LISTA]
+    return list(erros)
+
+
+def _expressoes(dialeto: str):
+    """
+    (elementos da lista de erros, procedimento com erro, falha sem lista de erros) para o dialeto.
+    """
+    falhou = Proc.validacoes_json["ok"].as_boolean().is_(False)
+    if dialeto == "postgresql":
+        erros = cast(Proc.validacoes_json, JSONB)["erros"]
+        lista = case((func.jsonb_typeof(erros) == "array", erros), else_=cast(literal("[]"), JSONB))
+        elementos = func.jsonb_array_elements_text(lista).table_valued("value")
+        quantidade = func.jsonb_array_length(lista)
+    else:
+        elementos = func.json_each(Proc.validacoes_json, "$.erros").table_valued("value")
+        quantidade = func.coalesce(func.json_array_length(Proc.validacoes_json, "$.erros"), 0)
+    return elementos, or_(quantidade > 0, falhou), and_(quantidade == 0, falhou)
+
+
+async def _exemplos(db: AsyncSession, filtro) -> List[dict]:
+    stmt = (
+        select(Proc.id, Proc.sigtap_codigo, Proc.validacoes_json, models.Paciente.nome)
+        .outerjoin(models.Atendimento, models.Atendimento.id == Proc.atendimento_id)
+        .outerjoin(models.Paciente, models.Paciente.id == models.Atendimento.paciente_id)
+        .where(filtro)
+        .order_by(Proc.id)
+        .limit(LIMITE_EXEMPLOS)
+    )
+    return [
+        {"id": pid, "paciente": nome, "procedimento": codigo, "mensagens": mensagens_erro(validacoes)}
+        for pid, codigo, validacoes, nome in (await db.execute(stmt)).all()
+    ]
+
+
+def _agrupar(contagem: Dict[str, int]) -> List[dict]:
+    ordenado = sorted(contagem.items(), key=lambda item: (-item[1], item[0]))
+    return [{"tipo": tipo, "quantidade": quantidade} for tipo, quantidade in ordenado if quantidade]
+
+
+async def _resumo_sql(db: AsyncSession, dialeto: str, base) -> dict:
+    elementos, com_erros, sem_lista = _expressoes(dialeto)
+    total, total_com_erros, total_sem_lista = (
+        await db.execute(
+            select(
+                func.count(),
+                func.count().filter(com_erros),
+                func.count().filter(sem_lista),
+            ).where(base)
+        )
+    ).one()
+
+    agrupados = await db.execute(
+        select(elementos.c.value, func.count())
+        .select_from(Proc)
+        .join(elementos, true())
+        .where(base)
+        .group_by(elementos.c.value)
+    )
+    contagem: Dict[str, int] = {str(tipo): quantidade for tipo, quantidade in agrupados.all()}
+    if total_sem_lista:
+        contagem[ERRO_SEM_LISTA] = contagem.get(ERRO_SEM_LISTA, 0) + total_sem_lista
+
+    return {
+        "total_procedimentos": total,
+        "total_com_erros": total_com_erros,
+        "erros_agrupados": _agrupar(contagem),
+        "exemplos_com_erros": await _exemplos(db, and_(base, com_erros)),
+    }
+
+
+async def _resumo_fallback(db: AsyncSession, base) -> dict:
+    total = 0
+    total_com_erros = 0
+    contagem: Counter = Counter()
+    ids_exemplo: List[int] = []
+    linhas = await db.stream(
+        select(Proc.id, Proc.validacoes_json).where(base).order_by(Proc.id).execution_options(yield_per=_LOTE_FALLBACK)
+    )
+    async for pid, validacoes in linhas:
+        total += 1
+        erros = mensagens_erro(validacoes)
+        if erros:
+            total_com_erros += 1
+            contagem.update(erros)
+            if len(ids_exemplo) < LIMITE_EXEMPLOS:
+                ids_exemplo.append(pid)
+    return {
+        "total_procedimentos": total,
+        "total_com_erros": total_com_erros,
+        "erros_agrupados": _agrupar(contagem),
+        "exemplos_com_erros": await _exemplos(db, Proc.id.in_(ids_exemplo)) if ids_exemplo else [],
+    }
+
+
+async def resumir_competencia(db: AsyncSession, tenant_id: int, competencia: str) -> dict:
+    base = and_(Proc.tenant_id == tenant_id, Proc.competencia_aaaamm == competencia)
+    dialeto = db.get_bind().dialect.name
+    if dialeto in ("postgresql", "sqlite"):
+        return await _resumo_sql(db, dialeto, base)
+    return await _resumo_fallback(db, base)
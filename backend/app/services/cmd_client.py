@@ -1,7 +1,11 @@
+import time
+
 import httpx
 from typing import Tuple, Dict, Any, List
 from xml.etree import ElementTree as ET
 
+from app.core import metrics
+
 
 NS_SOAP = "http://schemas.xmlsoap.org/soap/envelope/"
 NS_WSSE = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd"
@@ -70,6 +74,19 @@ class CmdSoapClient:
         except ET.ParseError:
             return response.status_code, "PARSE_ERROR", response.text
 
+    def _chamar(self, operacao: str, envelope: str) -> Tuple[int, str, Any]:
+        inicio = time.perf_counter()
+        resultado = "falha"
+        try:
+            status, codigo, dados = self._parse_response(self._post(envelope))
+            if codigo in ("FAULT", "PARSE_ERROR"):
+                resultado = codigo.lower()
+            else:
+                resultado = "ok" if status < 400 else "erro_http"
+            return status, codigo, dados
+        finally:
+            metrics.CMD_SOAP_SEGUNDOS.labels(operacao=operacao, resultado=resultado).observe(time.perf_counter() - inicio)
+
     def _base_headers(self) -> List[ET.Element]:
         return [
             build_ws_security_header(self.usuario_servico, self.senha_servico),
@@ -80,15 +97,13 @@ class CmdSoapClient:
         body = ET.Element("incluirContatoAssistencial")
         body.append(dados_xml)
         envelope = build_envelope(body, self._base_headers())
-        resp = self._post(envelope)
-        return self._parse_response(resp)
+        return self._chamar("incluir", envelope)
 
     def alterar_contato(self, dados_xml: ET.Element) -> Tuple[int, str, Any]:
         body = ET.Element("alterarContatoAssistencial")
         body.append(dados_xml)
         envelope = build_envelope(body, self._base_headers())
-        resp = self._post(envelope)
-        return self._parse_response(resp)
+        return self._chamar("alterar", envelope)
 
     def cancelar_contato(self, uuid_cmd: str, motivo: str) -> Tuple[int, str, Any]:
         body = ET.Element("cancelarContatoAssistencial")
@@ -96,8 +111,7 @@ class CmdSoapClient:
         ET.SubElement(req, "uuidContatoAssistencial").text = uuid_cmd
         ET.SubElement(req, "motivoCancelamento").text = motivo
         envelope = build_envelope(body, self._base_headers())
-        resp = self._post(envelope)
-        return self._parse_response(resp)
+        return self._chamar("cancelar", envelope)
 
     def pesquisar_contato(self, competencia: str, cnes: str, cns: str) -> Tuple[int, str, Any]:
         body = ET.Element("pesquisarContatoAssistencial")
@@ -106,13 +120,11 @@ class CmdSoapClient:
         ET.SubElement(req, "cnes").text = cnes
         ET.SubElement(req, "cns").text = cns
         envelope = build_envelope(body, self._base_headers())
-        resp = self._post(envelope)
-        return self._parse_response(resp)
+        return self._chamar("pesquisar", envelope)
 
     def detalhar_contato(self, uuid_cmd: str) -> Tuple[int, str, Any]:
         body = ET.Element("detalharContatoAssistencial")
         req = ET.SubElement(body, "RequestDetalharContatoAssistencial")
         ET.SubElement(req, "uuidContatoAssistencial").text = uuid_cmd
         envelope = build_envelope(body, self._base_headers())
-        resp = self._post(envelope)
-        return self._parse_response(resp)
+        return self._chamar("detalhar", envelope)
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from app.celery_app import celery_app
+from app.core import admissao
 from app.core.config import settings
 from app.database import SessionLocal
 from app.services.cmd_service import CmdService
@@ -16,8 +17,20 @@ def _process_tenant(tenant_id: int):
         session.close()
 
 
-@celery_app.task(name="cmd.processar_tenant")
-def processar_cmd_tenant(tenant_id: int):
+@celery_app.task(name="cmd.processar_tenant", bind=True, max_retries=None)
+def processar_cmd_tenant(self, tenant_id: int):
     if not settings.cmd_job_enabled:
         return None
-    return _process_tenant(tenant_id)
+    try:
+        with admissao.reservar("cmd", tenant_id, espera=0):
+            return _process_tenant(tenant_id)
+    except admissao.TenantSaturado as exc:
+        # Volta para o fim da fila: os outros tenants andam enquanto este esta no limite
+        raise self.retry(countdown=exc.retry_after)
+
+
+@celery_app.task(name="cmd.disparar_tenants_ativos")
+def disparar_tenants_ativos():
+    from app.jobs import cmd_job
+
+    return [r.id for r in cmd_job.trigger_for_active_tenants() or []]
@@ -0,0 +1,196 @@
+"""
+Contexto pre-carregado de uma competencia para auditoria e exportacao em passada unica.
+
+Carrega procedimentos, atendimentos, pacientes, profissionais, unidades, tabelas SIGTAP
+vigentes e competencias abertas com um numero fixo de consultas, em vez de uma rodada
+de `db.get` por procedimento.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import sigtap_compatibilidades, sigtap_rules, sigtap_snapshot
+
+
+class ItemCompetencia(NamedTuple):
+    proc: models.ProcedimentoSUS
+    atendimento: Optional[models.Atendimento]
+    paciente: Optional[models.Paciente]
+    profissional: Optional[models.Profissional]
+    unidade: Optional[models.Unidade]
+    tabela: Optional[models.TabelaSIGTAP]
+
+    @property
+    def completo(self) -> bool:
+        return all((self.atendimento, self.paciente, self.profissional, self.unidade))
+
+    @property
+    def data_atendimento(self):
+        data = self.atendimento.data
+        return data.date() if isinstance(data, datetime) else data
+
+
+def _por_id(db: Session, model, ids: Iterable[int]) -> Dict[int, object]:
+    ids = set(i for i in ids if i is not None)
+    if not ids:
+        return {}
+    return {obj.id: obj for obj in db.scalars(select(model).where(model.id.in_(ids))).all()}
+
+
+def _tabelas_vigentes(db: Session, codigos: Set[str], competencia: str) -> Dict[str, models.TabelaSIGTAP]:
+    """
+    Mesmo criterio de `sigtap_rules.get_tabela_para_competencia`, para todos os codigos de uma vez.
+    """
+    if not codigos:
+        return {}
+    snapshot = sigtap_snapshot.leitor(db)
+    if snapshot is not None:
+        vigentes = ((codigo, snapshot.buscar(codigo, competencia)) for codigo in codigos)
+        return {codigo: tabela for codigo, tabela in vigentes if tabela is not None}
+    stmt = (
+        select(models.TabelaSIGTAP)
+        .where(models.TabelaSIGTAP.codigo.in_(codigos))
+        .where(or_(models.TabelaSIGTAP.vigencia_inicio.is_(None), models.TabelaSIGTAP.vigencia_inicio <= competencia))
+        .where(or_(models.TabelaSIGTAP.vigencia_fim.is_(None), models.TabelaSIGTAP.vigencia_fim >= competencia))
+        .order_by(models.TabelaSIGTAP.vigencia_inicio.desc(), models.TabelaSIGTAP.id.desc())
+    )
+    tabelas: Dict[str, models.TabelaSIGTAP] = {}
+    for tabela in db.scalars(stmt).all():
+        tabelas.setdefault(tabela.codigo, tabela)
+    return tabelas
+
+
+class ContextoCompetencia:
+    def __init__(
+        self,
+        competencia: str,
+        itens: List[ItemCompetencia],
+        codigos_existentes: Set[str],
+        cnes_abertos: Set[str],
+        compatibilidades: Optional[sigtap_compatibilidades.Compatibilidades] = None,
+    ):
+        self.competencia = competencia
+        self.itens = itens
+        self.codigos_existentes = codigos_existentes
+        self.cnes_abertos = cnes_abertos
+        self.compatibilidades = compatibilidades or sigtap_compatibilidades.Compatibilidades(competencia)
+
+    @classmethod
+    def carregar(
+        cls,
+        db: Session,
+        tenant_id: int,
+        competencia: str,
+        procedimento_ids: Optional[Iterable[int]] = None,
+    ) -> "ContextoCompetencia":
+        stmt = select(models.ProcedimentoSUS).where(
+            models.ProcedimentoSUS.competencia_aaaamm == competencia,
+            models.ProcedimentoSUS.tenant_id == tenant_id,
+        )
+        if procedimento_ids is not None:
+            procedimento_ids = set(procedimento_ids)
+            if not procedimento_ids:
+                return cls(competencia, [], set(), set())
+            stmt = stmt.where(models.ProcedimentoSUS.id.in_(procedimento_ids))
+        procedimentos = db.scalars(stmt.order_by(models.ProcedimentoSUS.id)).all()
+
+        atendimentos = _por_id(db, models.Atendimento, (p.atendimento_id for p in procedimentos))
+        pacientes = _por_id(db, models.Paciente, (a.paciente_id for a in atendimentos.values()))
+        profissionais = _por_id(db, models.Profissional, (a.profissional_id for a in atendimentos.values()))
+        unidades = _por_id(db, models.Unidade, (a.unidade_id for a in atendimentos.values()))
+
+        codigos = {p.sigtap_codigo for p in procedimentos}
+        tabelas = _tabelas_vigentes(db, codigos, competencia)
+        faltantes = codigos - set(tabelas)
+        codigos_existentes = set(tabelas)
+        snapshot = sigtap_snapshot.leitor(db)
+        if faltantes and snapshot is not None:
+            codigos_existentes |= {codigo for codigo in faltantes if snapshot.existe(codigo)}
+        elif faltantes:
+            codigos_existentes |= set(
+                db.scalars(select(models.TabelaSIGTAP.codigo).where(models.TabelaSIGTAP.codigo.in_(faltantes))).all()
+            )
+
+        cnes = {u.cnes for u in unidades.values()}
+        cnes_abertos = set()
+        if cnes:
+            cnes_abertos = set(
+                db.scalars(
+                    select(models.CompetenciaAberta.unidade_cnes).where(
+                        models.CompetenciaAberta.unidade_cnes.in_(cnes),
+                        models.CompetenciaAberta.competencia == competencia,
+                        models.CompetenciaAberta.aberta.is_(True),
+                    )
+                ).all()
+            )
+
+        itens = []
+        for proc in procedimentos:
+            atendimento = atendimentos.get(proc.atendimento_id)
+            itens.append(
+                ItemCompetencia(
+                    proc=proc,
+                    atendimento=atendimento,
+                    paciente=pacientes.get(atendimento.paciente_id) if atendimento else None,
+                    profissional=profissionais.get(atendimento.profissional_id) if atendimento else None,
+                    unidade=unidades.get(atendimento.unidade_id) if atendimento else None,
+                    tabela=tabelas.get(proc.sigtap_codigo),
+                )
+            )
+        compatibilidades = sigtap_compatibilidades.carregar(db, competencia)
+        return cls(competencia, itens, codigos_existentes, cnes_abertos, compatibilidades)
+
+    def auditar(self, item: ItemCompetencia) -> List[str]:
+        if not item.completo:
+            return ["contexto_atendimento_incompleto"]
+        erros = sigtap_rules.validate_procedimento(
+            None,
+            item.paciente,
+            item.proc,
+            item.unidade,
+            item.profissional,
+            item.data_atendimento,
+            tabela_proc=item.tabela,
+            codigo_existe=item.proc.sigtap_codigo in self.codigos_existentes,
+            compatibilidades=self.compatibilidades,
+        )
+        if item.unidade.cnes not in self.cnes_abertos:
+            erros.append("competencia_fechada")
+        return erros
+
+    def filtrar(self, unidade_id: int | None = None, profissional_id: int | None = None) -> List[ItemCompetencia]:
+        return [
+            item
+            for item in self.itens
+            if item.completo
+            and not (unidade_id and item.atendimento.unidade_id != unidade_id)
+            and not (profissional_id and item.atendimento.profissional_id != profissional_id)
+        ]
+
+
+def linha_bpa(item: ItemCompetencia) -> Dict[str, object]:
+    proc, atendimento, paciente, profissional, unidade, tabela = item
+    doc = sigtap_rules.decide_documento_bpa(paciente, tabela)
+    valor_procedimento = 0
+    if proc.valores and proc.valores.get("valor") is not None:
+        valor_procedimento = proc.valores.get("valor")
+    elif tabela and tabela.valor is not None:
+        valor_procedimento = float(tabela.valor)
+    return {
+        "cnes": unidade.cnes,
+        "competencia": proc.competencia_aaaamm,
+        "cns_prof": profissional.cns,
+        "cbo": proc.profissional_cbo,
+        "data_atendimento": atendimento.data.strftime("%Y%m%d"),
+        "procedimento": proc.sigtap_codigo,
+        "cns_paciente": paciente.cns if doc == "CNS" else "",
+        "cpf_paciente": paciente.cpf if doc == "CPF" else "",
+        "sexo": paciente.sexo,
+        "cid": proc.cid10,
+        "idade": sigtap_rules.calcular_idade(paciente.data_nascimento, atendimento.data.date()),
+        "quantidade": proc.quantidade,
+        "valor": valor_procedimento,
+    }
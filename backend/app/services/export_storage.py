@@ -0,0 +1,168 @@
+"""
+Armazenamento enderecado por conteudo das remessas BPA/APAC.
+
+O arquivo local e a chave no MinIO derivam do SHA-256 do arquivo gerado, de modo
+que reprocessamentos com o mesmo conteudo reaproveitam o artefato ja gravado.
+"""
+import gzip
+import hashlib
+import json
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from app.core.config import settings
+from app.services import minio_service
+
+EXPORTS_DIR = Path("exports")
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+
+def digest_entrada(tipo: str, competencia: str, entrada: Any) -> str:
+    """
+    Digest canonico das entradas da exportacao (linhas coletadas + parametros do arquivo).
+    """
+    payload = json.dumps(
+        {"tipo": tipo, "competencia": competencia, "entrada": entrada},
+        sort_keys=True,
+        default=str,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def digest_arquivo(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ArquivoPersistido(NamedTuple):
+    arquivo_hash: str
+    url: str
+    tamanho_bytes: int
+    tamanho_comprimido: Optional[int]
+    storage_key: Optional[str]  # chave efetivamente gravada no MinIO; None se o upload falhou
+
+
+def compressao_ativa() -> bool:
+    return settings.export_compressao == "gzip"
+
+
+def storage_key(tipo: str, tenant_id: int, arquivo_hash: str, comprimido: bool) -> str:
+    key = f"exports/{tipo}/{tenant_id}/{arquivo_hash}.rem"
+    return f"{key}.gz" if comprimido else key
+
+
+def caminho_local(tipo: str, tenant_id: int, arquivo_hash: str) -> Path:
+    return EXPORTS_DIR / tipo / str(tenant_id) / f"{arquivo_hash}.rem"
+
+
+def caminho_gzip(path: Path) -> Path:
+    return path.with_name(path.name + ".gz")
+
+
+def url_artefato(tipo: str, tenant_id: int, arquivo_hash: str, key: Optional[str]) -> str:
+    """
+    URL assinada da chave gravada na exportacao, ou o caminho local quando o objeto
+    nao foi enviado ou o MinIO nao responde. A chave vem da linha da exportacao, nao
+    da configuracao atual de compressao, que pode ter mudado desde o upload.
+    """
+    presigned = minio_service.presign_get(key) if key else None
+    return presigned or str(caminho_local(tipo, tenant_id, arquivo_hash))
+
+
+def _gravar_atomico(path: Path, escrever) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        escrever(tmp)
+    Path(tmp.name).replace(path)
+
+
+def _gravar_gzip(destino: Path, data: bytes) -> None:
+    def escrever(fh):
+        # mtime fixo: o .gz de um mesmo conteudo e sempre identico byte a byte
+        with gzip.GzipFile(filename="", mode="wb", fileobj=fh, compresslevel=GZIP_LEVEL, mtime=0) as gz:
+            for inicio in range(0, len(data), CHUNK_SIZE):
+                gz.write(data[inicio:inicio + CHUNK_SIZE])
+
+    _gravar_atomico(destino, escrever)
+
+
+def persistir(tipo: str, tenant_id: int, data: bytes) -> ArquivoPersistido:
+    """
+    Grava o arquivo em disco e no MinIO apenas se o conteudo ainda nao existir.
+
+    Com `export_compressao=gzip` o .gz e produzido junto com o arquivo bruto e apenas
+    ele e enviado ao MinIO (Content-Encoding: gzip); o .rem local segue servindo
+    downloads com Range.
+    """
+    arquivo_hash = digest_arquivo(data)
+    path = caminho_local(tipo, tenant_id, arquivo_hash)
+    if not path.is_file():
+        _gravar_atomico(path, lambda fh: fh.write(data))
+
+    tamanho_comprimido = None
+    upload_path, content_encoding = path, None
+    if compressao_ativa():
+        gz_path = caminho_gzip(path)
+        if not gz_path.is_file():
+            _gravar_gzip(gz_path, data)
+        tamanho_comprimido = gz_path.stat().st_size
+        upload_path, content_encoding = gz_path, "gzip"
+
+    key = storage_key(tipo, tenant_id, arquivo_hash, content_encoding == "gzip")
+    if minio_service.object_exists(key):
+        uploaded_key = key
+    else:
+        uploaded_key = minio_service.upload_file(key, upload_path, content_encoding=content_encoding)
+    presigned = minio_service.presign_get(uploaded_key) if uploaded_key else None
+    return ArquivoPersistido(arquivo_hash, presigned or str(path), len(data), tamanho_comprimido, uploaded_key)
+
+
+def restaurar(tipo: str, tenant_id: int, arquivo_hash: str, key: Optional[str]) -> Optional[Path]:
+    """
+    Traz do MinIO o .rem de uma exportacao ja gerada cujo arquivo local sumiu (restart,
+    redeploy, outra replica). O objeto .gz e descomprimido em stream; o conteudo so
+    e aceito se o SHA-256 bater com o da exportacao. None se nao houver objeto.
+    """
+    if not key or not minio_service.object_exists(key):
+        return None
+    path = caminho_local(tipo, tenant_id, arquivo_hash)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if key.endswith(".gz") else None
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        try:
+            for bloco in minio_service.ler_objeto(key, CHUNK_SIZE):
+                dados = descompressor.decompress(bloco) if descompressor else bloco
+                digest.update(dados)
+                tmp.write(dados)
+            if descompressor:
+                resto = descompressor.flush()
+                digest.update(resto)
+                tmp.write(resto)
+        except (zlib.error, *minio_service.erros_s3()):
+            Path(tmp.name).unlink()
+            return None
+    if digest.hexdigest() != arquivo_hash:
+        Path(tmp.name).unlink()
+        return None
+    Path(tmp.name).replace(path)
+    return path
+
+
+def empacotar_zip(path: Path, nome_interno: str) -> Path:
+    """
+    ZIP com a remessa como unica entrada, no formato aceito pelos importadores SIA/APAC.
+    Gerado uma vez ao lado do .rem e reaproveitado nos downloads seguintes.
+    """
+    zip_path = path.with_name(f"{path.stem}_{nome_interno}.zip")
+    if not zip_path.is_file():
+        def escrever(fh):
+            with zipfile.ZipFile(fh, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=GZIP_LEVEL) as zf:
+                zf.write(path, arcname=nome_interno)
+
+        _gravar_atomico(zip_path, escrever)
+    return zip_path
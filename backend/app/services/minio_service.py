@@ -1,13 +1,17 @@
 import io
-from typing import Optional
-
-import boto3
-from botocore.exceptions import BotoCoreError, NoCredentialsError, ClientError
+from functools import lru_cache
+from typing import Iterator, List, Optional
 
 from app.core.config import settings
 
+# boto3/botocore sao importados sob demanda: custam ~200 ms no import de app.main
+# e so sao necessarios quando uma remessa e enviada ou assinada.
+
 
+@lru_cache(maxsize=1)
 def _client():
+    import boto3
+
     return boto3.client(
         "s3",
         endpoint_url=settings.s3_endpoint,
@@ -16,12 +20,37 @@ def _client():
     )
 
 
+@lru_cache(maxsize=1)
+def erros_s3() -> tuple:
+    from boto3.exceptions import S3UploadFailedError
+    from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+
+    return (BotoCoreError, NoCredentialsError, ClientError, S3UploadFailedError)
+
+
 def upload_bytes(key: str, data: bytes, content_type: str = "text/plain") -> Optional[str]:
     try:
         client = _client()
         client.put_object(Bucket=settings.s3_bucket, Key=key, Body=io.BytesIO(data), ContentType=content_type)
         return key
-    except (BotoCoreError, NoCredentialsError, ClientError):
+    except erros_s3():
+        return None
+
+
+def upload_file(
+    key: str, path, content_type: str = "text/plain", content_encoding: Optional[str] = None
+) -> Optional[str]:
+    """
+    Envia o arquivo em partes a partir do disco (multipart gerenciado pelo boto3).
+    """
+    extra_args = {"ContentType": content_type}
+    if content_encoding:
+        extra_args["ContentEncoding"] = content_encoding
+    try:
+        client = _client()
+        client.upload_file(str(path), settings.s3_bucket, key, ExtraArgs=extra_args)
+        return key
+    except erros_s3():
         return None
 
 
@@ -33,5 +62,78 @@ def presign_get(key: str, expires: int = 3600) -> Optional[str]:
             Params={"Bucket": settings.s3_bucket, "Key": key},
             ExpiresIn=expires,
         )
-    except (BotoCoreError, NoCredentialsError, ClientError):
+    except erros_s3():
+        return None
+
+
+def object_exists(key: str) -> bool:
+    try:
+        client = _client()
+        client.head_object(Bucket=settings.s3_bucket, Key=key)
+        return True
+    except erros_s3():
+        return False
+
+
+# Multipart explicito, para quem envia um stream sem tamanho conhecido. Estas funcoes
+# propagam `erros_s3()`: quem chama precisa abortar o upload em caso de falha.
+
+
+def iniciar_multipart(key: str, content_type: str) -> str:
+    resp = _client().create_multipart_upload(Bucket=settings.s3_bucket, Key=key, ContentType=content_type)
+    return resp["UploadId"]
+
+
+def enviar_parte(key: str, upload_id: str, numero: int, dados: bytes) -> dict:
+    resp = _client().upload_part(Bucket=settings.s3_bucket, Key=key, UploadId=upload_id, PartNumber=numero, Body=dados)
+    return {"PartNumber": numero, "ETag": resp["ETag"]}
+
+
+def concluir_multipart(key: str, upload_id: str, partes: List[dict]) -> None:
+    _client().complete_multipart_upload(
+        Bucket=settings.s3_bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": partes}
+    )
+
+
+def abortar_multipart(key: str, upload_id: str) -> None:
+    try:
+        _client().abort_multipart_upload(Bucket=settings.s3_bucket, Key=key, UploadId=upload_id)
+    except erros_s3():
+        pass
+
+
+def presign_put(key: str, content_type: str, expires: int = 900) -> Optional[str]:
+    try:
+        client = _client()
+        return client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": settings.s3_bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires,
+        )
+    except erros_s3():
         return None
+
+
+def ler_objeto(key: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """
+    Conteudo do objeto em blocos, sem carrega-lo inteiro. Propaga `erros_s3()`.
+    """
+    corpo = _client().get_object(Bucket=settings.s3_bucket, Key=key)["Body"]
+    try:
+        yield from corpo.iter_chunks(chunk_size)
+    finally:
+        corpo.close()
+
+
+def tamanho_objeto(key: str) -> int:
+    """
+    Tamanho do objeto pelo HEAD, sem baixar o corpo. Propaga `erros_s3()`.
+    """
+    return _client().head_object(Bucket=settings.s3_bucket, Key=key)["ContentLength"]
+
+
+def remover_objeto(key: str) -> None:
+    try:
+        _client().delete_object(Bucket=settings.s3_bucket, Key=key)
+    except erros_s3():
+        pass
@@ -0,0 +1,118 @@
+"""
+Carga de varias competencias SIGTAP de uma vez (onboarding com historico).
+
+Download e parse dos pacotes rodam em paralelo num pool de processos; a aplicacao no
+banco e sequencial e em ordem cronologica, pelo mesmo importador incremental do
+`sync`, para que as vigencias fechem na ordem certa. Enquanto uma competencia e
+aplicada as seguintes continuam sendo baixadas. O snapshot binario e publicado uma
+vez, ao final.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.sigtap_delta import mes_anterior
+from app.services.sigtap_sync import SIGTAPSyncService, TabelaSIGTAPRepository, validar_competencia
+
+logger = logging.getLogger(__name__)
+
+
+def proxima_competencia(competencia: str) -> str:
+    ano, mes = int(competencia[:4]), int(competencia[4:6])
+    if mes == 12:
+        return f"{ano + 1}01"
+    return f"{ano}{mes + 1:02d}"
+
+
+def competencias_intervalo(inicio: str, fim: str) -> List[str]:
+    """
+    Competencias de `inicio` a `fim`, inclusive, em ordem cronologica.
+    """
+    inicio, fim = validar_competencia(inicio), validar_competencia(fim)
+    if inicio > fim:
+        raise ValueError("Competencia inicial posterior a final")
+    competencias = [inicio]
+    while competencias[-1] != fim:
+        competencias.append(proxima_competencia(competencias[-1]))
+    if len(competencias) > settings.sigtap_backfill_max_competencias:
+        raise ValueError(f"Intervalo maior que {settings.sigtap_backfill_max_competencias} competencias")
+    return competencias
+
+
+def _preparar_pacote(competencia: str, base_url: Optional[str], fetcher: Optional[Callable[[str], bytes]]) -> List[Dict]:
+    # Executado no processo filho: sem sessao de banco, so download + parse
+    return SIGTAPSyncService(None, base_url=base_url, fetcher=fetcher).preparar(competencia)
+
+
+def _executor_padrao(trabalhos: int) -> Executor:
+    workers = max(1, min(settings.sigtap_backfill_workers, trabalhos))
+    if multiprocessing.current_process().daemon:
+        # Processo filho do Celery (prefork) nao pode ter filhos: baixa em threads
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def backfill(
+    repository: TabelaSIGTAPRepository,
+    competencias: List[str],
+    *,
+    reimportar: bool = False,
+    base_url: Optional[str] = None,
+    fetcher: Optional[Callable[[str], bytes]] = None,
+    executor: Optional[Executor] = None,
+    progresso: Optional[Callable[[dict], None]] = None,
+) -> List[dict]:
+    """
+    Importa as competencias em ordem cronologica e devolve um resultado por competencia
+    (`importada`, `ja_importada` ou `erro`). A falha de uma competencia nao interrompe
+    as demais; `progresso` recebe cada resultado assim que ele fica pronto.
+    """
+    competencias = sorted(set(competencias))
+    service = SIGTAPSyncService(repository, base_url=base_url, fetcher=fetcher)
+    pendentes = [c for c in competencias if reimportar or not repository.competencia_importada(c)]
+
+    proprio = executor is None and bool(pendentes)
+    if proprio:
+        executor = _executor_padrao(len(pendentes))
+    futuros: Dict[str, Future] = {
+        c: executor.submit(_preparar_pacote, c, service.base_url, fetcher) for c in pendentes
+    }
+
+    resultados: List[dict] = []
+    try:
+        for indice, competencia in enumerate(competencias, start=1):
+            resultado = {"competencia": competencia, "indice": indice, "total": len(competencias)}
+            if competencia not in futuros:
+                resultado["status"] = "ja_importada"
+            else:
+                try:
+                    registros = futuros[competencia].result()
+                    resultado.update(
+                        status="importada", **service.importar(competencia, registros, publicar_snapshot=False)
+                    )
+                except Exception as exc:
+                    logger.warning("sigtap_backfill_falhou", extra={"competencia": competencia, "erro": str(exc)})
+                    repository.session.rollback()
+                    resultado.update(status="erro", erro=str(exc))
+            resultados.append(resultado)
+            if progresso:
+                progresso(resultado)
+    finally:
+        if proprio:
+            executor.shutdown(wait=False, cancel_futures=True)
+    if any(r["status"] == "importada" for r in resultados):
+        # Um snapshot so no fim, nao um por competencia
+        repository.publicar_snapshot()
+    return resultados
+
+
+def intervalo_anterior(competencia: str, meses: int) -> List[str]:
+    """
+    As `meses` competencias que terminam em `competencia` (atalho para onboarding).
+    """
+    inicio = competencia
+    for _ in range(meses - 1):
+        inicio = mes_anterior(inicio)
+    return competencias_intervalo(inicio, competencia)
@@ -0,0 +1,213 @@
+"""
+Cache local e espelho dos pacotes SIGTAP (ZIP da Tabela Unificada).
+
+Os pacotes ficam em `sigtap_cache_dir` enderecados pelo SHA-256 (`objetos/<sha>.zip`);
+`indice/<competencia>.json` aponta a competencia para o objeto e guarda ETag e
+Last-Modified da origem. Dentro de `sigtap_cache_max_idade_horas` o pacote e lido do
+disco sem rede; depois disso e revalidado com GET condicional (304 reaproveita o
+arquivo). Se a origem nao responder, o pacote em cache e usado mesmo vencido.
+
+`sigtap_base_url` tambem pode apontar para um diretorio local (caminho ou file://)
+com os mesmos nomes de arquivo do DATASUS: nesse caso a leitura e direta do espelho.
+"""
+import hashlib
+import io
+import json
+import logging
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Caminhos relativos de `sigtap_cache_dir` sao resolvidos a partir da raiz do backend,
+# nao do diretorio de trabalho de quem importa (API, worker, script).
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def diretorio_cache() -> Optional[Path]:
+    if not settings.sigtap_cache_dir:
+        return None
+    caminho = Path(settings.sigtap_cache_dir)
+    return caminho if caminho.is_absolute() else BACKEND_DIR / caminho
+
+
+def caminho_espelho(url: str) -> Optional[Path]:
+    """
+    Caminho local quando a URL candidata aponta para um espelho em disco.
+    """
+    if url.startswith("file://"):
+        return Path(url[len("file://"):])
+    if "://" not in url:
+        return Path(url)
+    return None
+
+
+def _gravar_atomico(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        tmp.write(data)
+    Path(tmp.name).replace(path)
+
+
+class CachePacotes:
+    def __init__(self, diretorio: str, max_idade_horas: int = 24):
+        self.diretorio = Path(diretorio)
+        self.max_idade_segundos = max_idade_horas * 3600
+
+    def _indice(self, competencia: str) -> Path:
+        return self.diretorio / "indice" / f"{competencia}.json"
+
+    def _objeto(self, sha256: str) -> Path:
+        return self.diretorio / "objetos" / f"{sha256}.zip"
+
+    def ler_entrada(self, competencia: str) -> Optional[dict]:
+        try:
+            return json.loads(self._indice(competencia).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def ler_objeto(self, entrada: dict) -> Optional[bytes]:
+        """
+        Conteudo do objeto, ou None se faltar ou nao bater com o checksum do indice.
+        """
+        try:
+            data = self._objeto(entrada["sha256"]).read_bytes()
+        except (OSError, KeyError):
+            return None
+        if hashlib.sha256(data).hexdigest() != entrada["sha256"]:
+            logger.warning("sigtap_cache_corrompido", extra={"sha256": entrada["sha256"]})
+            return None
+        return data
+
+    def gravar(self, competencia: str, data: bytes, url: str, headers: httpx.Headers) -> dict:
+        sha256 = hashlib.sha256(data).hexdigest()
+        objeto = self._objeto(sha256)
+        if not objeto.exists():
+            _gravar_atomico(objeto, data)
+        entrada = {
+            "competencia": competencia,
+            "sha256": sha256,
+            "tamanho": len(data),
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "validado_em": time.time(),
+        }
+        _gravar_atomico(self._indice(competencia), json.dumps(entrada).encode())
+        return entrada
+
+    def marcar_validado(self, competencia: str, entrada: dict) -> None:
+        entrada = {**entrada, "validado_em": time.time()}
+        _gravar_atomico(self._indice(competencia), json.dumps(entrada).encode())
+
+    def fresco(self, entrada: dict) -> bool:
+        return time.time() - entrada.get("validado_em", 0) < self.max_idade_segundos
+
+
+def _ler_espelho(competencia: str, urls: List[str]) -> Optional[bytes]:
+    """
+    Le o primeiro candidato local existente. Sem candidato local encontrado, so segue
+    para a rede se houver URLs remotas na lista; espelho puro sem o arquivo e erro.
+    """
+    caminhos = [c for c in (caminho_espelho(url) for url in urls) if c is not None]
+    for caminho in caminhos:
+        if caminho.is_file():
+            metrics.SIGTAP_PACOTES.labels(origem="espelho").inc()
+            return caminho.read_bytes()
+    if caminhos and len(caminhos) == len(urls):
+        raise RuntimeError(f"Pacote SIGTAP {competencia} nao encontrado no espelho: {', '.join(map(str, caminhos))}")
+    return None
+
+
+def _eh_zip(dados: bytes) -> bool:
+    # Pagina de erro HTML com status 200 nao pode entrar no cache
+    try:
+        with zipfile.ZipFile(io.BytesIO(dados)) as zf:
+            return bool(zf.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def _revalidar(cache: CachePacotes, competencia: str, entrada: dict, dados: bytes, client: httpx.Client) -> bytes:
+    cabecalhos = {}
+    if entrada.get("etag"):
+        cabecalhos["If-None-Match"] = entrada["etag"]
+    if entrada.get("last_modified"):
+        cabecalhos["If-Modified-Since"] = entrada["last_modified"]
+    try:
+        resp = client.get(entrada["url"], headers=cabecalhos, timeout=settings.sigtap_download_timeout)
+        if resp.status_code == 304:
+            cache.marcar_validado(competencia, entrada)
+            metrics.SIGTAP_PACOTES.labels(origem="revalidado").inc()
+            return dados
+        resp.raise_for_status()
+    except httpx.HTTPError as exc:
+        # Origem fora do ar: pacote em cache vencido e melhor que nenhum
+        logger.warning("sigtap_revalidacao_falhou", extra={"competencia": competencia, "erro": str(exc)})
+        metrics.SIGTAP_PACOTES.labels(origem="cache").inc()
+        return dados
+    if not _eh_zip(resp.content):
+        logger.warning("sigtap_revalidacao_falhou", extra={"competencia": competencia, "erro": "resposta nao e um ZIP"})
+        metrics.SIGTAP_PACOTES.labels(origem="cache").inc()
+        return dados
+    cache.gravar(competencia, resp.content, entrada["url"], resp.headers)
+    metrics.SIGTAP_PACOTES.labels(origem="download").inc()
+    return resp.content
+
+
+def obter_pacote(
+    competencia: str,
+    urls: List[str],
+    client: Optional[httpx.Client] = None,
+    cache: Optional[CachePacotes] = None,
+) -> bytes:
+    """
+    Bytes do ZIP da competencia: espelho local, cache em disco ou download das URLs candidatas.
+    """
+    espelho = _ler_espelho(competencia, urls)
+    if espelho is not None:
+        return espelho
+
+    remotas = [url for url in urls if caminho_espelho(url) is None]
+    diretorio = diretorio_cache()
+    if cache is None and diretorio is not None:
+        cache = CachePacotes(str(diretorio), settings.sigtap_cache_max_idade_horas)
+    if client is None:
+        with httpx.Client(follow_redirects=True) as client:
+            return _obter(competencia, remotas, client, cache)
+    return _obter(competencia, remotas, client, cache)
+
+
+def _obter(competencia: str, urls: List[str], client: httpx.Client, cache: Optional[CachePacotes]) -> bytes:
+    entrada = cache.ler_entrada(competencia) if cache else None
+    dados = cache.ler_objeto(entrada) if entrada else None
+    if dados is not None:
+        if cache.fresco(entrada):
+            metrics.SIGTAP_PACOTES.labels(origem="cache").inc()
+            return dados
+        return _revalidar(cache, competencia, entrada, dados, client)
+
+    errors: List[str] = []
+    for url in urls:
+        try:
+            resp = client.get(url, timeout=settings.sigtap_download_timeout)
+            resp.raise_for_status()
+        except Exception as exc:
+            errors.append(f"{url}: {exc}")
+            continue
+        if not _eh_zip(resp.content):
+            errors.append(f"{url}: resposta nao e um ZIP")
+            continue
+        if cache:
+            cache.gravar(competencia, resp.content, url, resp.headers)
+        metrics.SIGTAP_PACOTES.labels(origem="download").inc()
+        return resp.content
+    raise RuntimeError(f"Nao foi possivel baixar SIGTAP {competencia}. Tentativas: {' | '.join(errors)}")
@@ -0,0 +1,212 @@
+"""
+Relacoes de compatibilidade da Tabela Unificada: procedimento x CID, x CBO (ocupacao),
+x habilitacao e x servico/classificacao.
+
+Importacao: cada relacao e guardada com janela de vigencia, como `tabelas_sigtap`.
+A competencia importada abre os pares novos e fecha no mes anterior os pares vigentes
+que sairam do pacote; pares repetidos nao geram escrita. Relacao ausente do ZIP nao
+e tocada (pacote parcial nao encerra vigencias).
+
+Consulta: `carregar(db, competencia)` monta, uma vez por competencia e processo, um
+conjunto de inteiros por relacao com a chave `procedimento << 20 | indice do codigo`,
+mais o conjunto de procedimentos que tem alguma linha naquela relacao. "CID X e
+aceito no procedimento Y" vira um `in` num set. Procedimento sem linha na relacao nao
+tem restricao. A estrutura e reaproveitada enquanto `sigtap_importacoes` nao mudar.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.sigtap_delta import mes_anterior
+
+MODELOS = {
+    "cid": models.SigtapProcedimentoCID,
+    "cbo": models.SigtapProcedimentoCBO,
+    "habilitacao": models.SigtapProcedimentoHabilitacao,
+    "servico": models.SigtapProcedimentoServico,
+}
+
+_BITS_CODIGO = 20
+_CACHE_COMPETENCIAS = 4
+_LOTE = 1000
+
+Pares = Set[Tuple[str, str]]
+
+
+def normalizar_cid(cid: Optional[str]) -> str:
+    return (cid or "").replace(".", "").strip().upper()
+
+
+def _chave_procedimento(codigo: str) -> Optional[int]:
+    try:
+        return int(codigo)
+    except (TypeError, ValueError):
+        return None
+
+
+def aplicar_relacoes(session: Session, relacoes: Dict[str, Optional[Pares]], competencia: str) -> Dict[str, dict]:
+    """
+    Aplica os pares (procedimento, codigo) de cada relacao lida do pacote, sem commit.
+    Pacotes anteriores a ultima vigencia gravada de uma relacao sao ignorados nela:
+    a historia das relacoes so avanca.
+    """
+    resumo: Dict[str, dict] = {}
+    for tipo, pares in relacoes.items():
+        if pares is None:
+            continue
+        model = MODELOS[tipo]
+        ultima = session.execute(select(func.max(model.vigencia_inicio))).scalar_one()
+        if ultima is not None and competencia < ultima:
+            resumo[tipo] = {"ignorada": True, "ultima_vigencia": ultima}
+            continue
+
+        vigentes = {
+            (procedimento, codigo): (linha_id, inicio)
+            for linha_id, procedimento, codigo, inicio in session.execute(
+                select(model.id, model.procedimento, model.codigo, model.vigencia_inicio).where(model.vigencia_fim.is_(None))
+            )
+        }
+        novos = [
+            {"procedimento": p, "codigo": c, "vigencia_inicio": competencia, "vigencia_fim": None}
+            for p, c in pares - vigentes.keys()
+        ]
+        saiu = [vigentes[par] for par in vigentes.keys() - pares]
+        # Reimportacao da mesma competencia: par que sumiu nunca esteve vigente antes dela
+        apagar = [linha_id for linha_id, inicio in saiu if inicio >= competencia]
+        fechar = [linha_id for linha_id, inicio in saiu if inicio < competencia]
+
+        for inicio in range(0, len(novos), _LOTE):
+            session.execute(insert(model), novos[inicio:inicio + _LOTE])
+        for inicio in range(0, len(fechar), _LOTE):
+            session.execute(
+                update(model)
+                .where(model.id.in_(fechar[inicio:inicio + _LOTE]))
+                .values(vigencia_fim=mes_anterior(competencia))
+            )
+        for inicio in range(0, len(apagar), _LOTE):
+            session.execute(delete(model).where(model.id.in_(apagar[inicio:inicio + _LOTE])))
+        resumo[tipo] = {"abertos": len(novos), "encerrados": len(fechar) + len(apagar), "vigentes": len(pares)}
+
+    if any(r.get("abertos") or r.get("encerrados") for r in resumo.values()):
+        # Insert/update em lote nao passa pelo rastreamento do flush: invalida aqui
+        session.execute(delete(models.AuditoriaSnapshot))
+    return resumo
+
+
+class Compatibilidades:
+    """
+    Relacoes vigentes numa competencia, em estrutura compacta para consulta O(1).
+    """
+
+    __slots__ = ("competencia", "_indices", "_restritos", "_pares")
+
+    def __init__(self, competencia: str) -> None:
+        self.competencia = competencia
+        self._indices: Dict[str, Dict[str, int]] = {tipo: {} for tipo in MODELOS}
+        self._restritos: Dict[str, Set[int]] = {tipo: set() for tipo in MODELOS}
+        self._pares: Dict[str, Set[int]] = {tipo: set() for tipo in MODELOS}
+
+    def adicionar(self, tipo: str, procedimento: str, codigo: str) -> None:
+        chave_proc = _chave_procedimento(procedimento)
+        if chave_proc is None:
+            return
+        indices = self._indices[tipo]
+        indice = indices.setdefault(codigo, len(indices))
+        self._restritos[tipo].add(chave_proc)
+        self._pares[tipo].add(chave_proc << _BITS_CODIGO | indice)
+
+    def restrito(self, tipo: str, procedimento: str) -> bool:
+        return _chave_procedimento(procedimento) in self._restritos[tipo]
+
+    def permite(self, tipo: str, procedimento: str, codigo: Optional[str]) -> bool:
+        chave_proc = _chave_procedimento(procedimento)
+        if chave_proc not in self._restritos[tipo]:
+            return True
+        indice = self._indices[tipo].get(codigo or "")
+        return indice is not None and (chave_proc << _BITS_CODIGO | indice) in self._pares[tipo]
+
+    def permite_algum(self, tipo: str, procedimento: str, codigos: Iterable[str]) -> bool:
+        if not self.restrito(tipo, procedimento):
+            return True
+        return any(self.permite(tipo, procedimento, codigo) for codigo in codigos)
+
+
+def _consulta_vigentes(competencia: str):
+    partes = [
+        select(literal(tipo).label("tipo"), model.procedimento, model.codigo).where(
+            model.vigencia_inicio <= competencia,
+            or_(model.vigencia_fim.is_(None), model.vigencia_fim >= competencia),
+        )
+        for tipo, model in MODELOS.items()
+    ]
+    return union_all(*partes)
+
+
+def montar(db: Session, competencia: str) -> Compatibilidades:
+    compat = Compatibilidades(competencia)
+    linhas = db.execute(_consulta_vigentes(competencia).execution_options(yield_per=10_000))
+    for tipo, procedimento, codigo in linhas:
+        compat.adicionar(tipo, procedimento, codigo)
+    return compat
+
+
+_cache: "OrderedDict[str, Tuple[tuple, Compatibilidades]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _versao_importacoes(db: Session) -> tuple:
+    return tuple(
+        db.execute(select(func.count(), func.max(models.SigtapImportacao.importado_em))).one()
+    )
+
+
+def carregar(db: Session, competencia: str) -> Compatibilidades:
+    """
+    Compatibilidades da competencia, do cache do processo enquanto nenhuma importacao
+    nova for registrada (uma consulta leve por chamada; a carga so na primeira).
+    """
+    versao = _versao_importacoes(db)
+    with _cache_lock:
+        entrada = _cache.get(competencia)
+        if entrada is not None and entrada[0] == versao:
+            _cache.move_to_end(competencia)
+            return entrada[1]
+    compat = montar(db, competencia)
+    with _cache_lock:
+        _cache[competencia] = (versao, compat)
+        _cache.move_to_end(competencia)
+        while len(_cache) > _CACHE_COMPETENCIAS:
+            _cache.popitem(last=False)
+    return compat
+
+
+def limpar_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def validar(compat: Compatibilidades, proc_model, unidade, profissional) -> List[str]:
+    """
+    Erros de compatibilidade do procedimento. Habilitacao e servico so sao conferidos
+    quando a unidade informa as suas em `competencia_params` (dados do CNES).
+    """
+    erros: List[str] = []
+    codigo = proc_model.sigtap_codigo
+    cid = normalizar_cid(getattr(proc_model, "cid10", None))
+    if cid and not compat.permite("cid", codigo, cid):
+        erros.append("cid_incompativel")
+    cbo = getattr(proc_model, "profissional_cbo", None) or getattr(profissional, "cbo", None)
+    if cbo and not compat.permite("cbo", codigo, cbo):
+        erros.append("cbo_incompativel")
+    params = getattr(unidade, "competencia_params", None) or {}
+    habilitacoes = params.get("habilitacoes")
+    if habilitacoes is not None and not compat.permite_algum("habilitacao", codigo, habilitacoes):
+        erros.append("habilitacao_ausente")
+    servicos = params.get("servicos")
+    if servicos is not None and not compat.permite_algum("servico", codigo, servicos):
+        erros.append("servico_classificacao_ausente")
+    return erros
@@ -0,0 +1,238 @@
+"""
+Importacao incremental do SIGTAP: grava so o que mudou entre competencias.
+
+Cada pacote mensal repete quase todos os procedimentos. Para cada registro recebido,
+o importador compara com a linha vigente do mesmo codigo e:
+
+- mantem a linha quando valor e regras sao iguais (nada e gravado);
+- corrige a linha no lugar quando o pacote reimporta a mesma `vigencia_inicio`;
+- senao fecha a `vigencia_fim` da linha anterior no mes anterior e insere a nova.
+
+Pacotes mais antigos que o historico (backfill) entram antes da linha seguinte: a
+nova linha termina no mes anterior ao inicio dela e, se for igual a ela, a linha
+seguinte apenas passa a comecar mais cedo.
+
+Assim `tabelas_sigtap` ganha uma linha por mudanca real, nao uma por competencia.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Colunas comparadas para decidir se o procedimento mudou
+CAMPOS_CONTEUDO = (
+    "descricao",
+    "valor",
+    "regras",
+    "exige_cid",
+    "exige_apac",
+    "doc_paciente",
+    "sexo_permitido",
+    "idade_min",
+    "idade_max",
+)
+
+
+class Alteracao(NamedTuple):
+    codigo: str
+    campos: List[str]
+
+
+class RelatorioDelta:
+    def __init__(self, competencia: str) -> None:
+        self.competencia = competencia
+        self.novos: List[str] = []
+        self.alterados: List[Alteracao] = []
+        self.inalterados = 0
+        self.ausentes: List[str] = []
+        self.relacoes: Dict[str, dict] = {}
+
+    @property
+    def gravados(self) -> int:
+        return len(self.novos) + len(self.alterados)
+
+    def como_dict(self, limite_lista: int = 200) -> Dict[str, object]:
+        return {
+            "competencia": self.competencia,
+            "novos": len(self.novos),
+            "alterados": len(self.alterados),
+            "inalterados": self.inalterados,
+            "ausentes": len(self.ausentes),
+            "alteracoes": [{"codigo": a.codigo, "campos": a.campos} for a in self.alterados[:limite_lista]],
+            "relacoes": self.relacoes,
+        }
+
+
+def mes_anterior(competencia: str) -> str:
+    ano, mes = int(competencia[:4]), int(competencia[4:6])
+    if mes == 1:
+        return f"{ano - 1}12"
+    return f"{ano}{mes - 1:02d}"
+
+
+def _normalizar(campo: str, valor):
+    if campo == "valor" and valor is not None:
+        return Decimal(str(valor)).quantize(Decimal("0.01"))
+    if campo == "regras":
+        return {k: v for k, v in (valor or {}).items() if v not in (None, "")}
+    return valor
+
+
+def campos_alterados(linha: models.TabelaSIGTAP, item: dict) -> List[str]:
+    return [
+        campo
+        for campo in CAMPOS_CONTEUDO
+        if _normalizar(campo, getattr(linha, campo)) != _normalizar(campo, item.get(campo))
+    ]
+
+
+def _vigente_em(linhas: List[models.TabelaSIGTAP], inicio: str) -> Optional[models.TabelaSIGTAP]:
+    """
+    Linha de maior `vigencia_inicio` que comeca ate `inicio` (linhas ordenadas por inicio).
+    """
+    escolhida = None
+    for linha in linhas:
+        if (linha.vigencia_inicio or "") <= inicio:
+            escolhida = linha
+    return escolhida
+
+
+def _seguinte(linhas: List[models.TabelaSIGTAP], inicio: str) -> Optional[models.TabelaSIGTAP]:
+    for linha in linhas:
+        if (linha.vigencia_inicio or "") > inicio:
+            return linha
+    return None
+
+
+def _aberta_em(linha: models.TabelaSIGTAP, inicio: str) -> bool:
+    return linha.vigencia_fim is None or linha.vigencia_fim >= inicio
+
+
+def _inserir(
+    session: Session, linhas: List[models.TabelaSIGTAP], item: dict, inicio: str
+) -> Optional[models.TabelaSIGTAP]:
+    """
+    Insere a linha que comeca em `inicio`, limitada pela linha seguinte do historico.
+    Igual a seguinte, nao insere: antecipa o inicio dela e devolve None.
+    """
+    seguinte = _seguinte(linhas, inicio)
+    if seguinte is not None and not campos_alterados(seguinte, item):
+        seguinte.vigencia_inicio = inicio
+        return None
+    linha = _nova_linha(item, inicio)
+    if seguinte is not None:
+        limite = mes_anterior(seguinte.vigencia_inicio)
+        if linha.vigencia_fim is None or linha.vigencia_fim > limite:
+            linha.vigencia_fim = limite
+    session.add(linha)
+    linhas.append(linha)
+    linhas.sort(key=lambda l: l.vigencia_inicio or "")
+    return linha
+
+
+def _nova_linha(item: dict, inicio: str) -> models.TabelaSIGTAP:
+    return models.TabelaSIGTAP(
+        codigo=item["codigo"],
+        descricao=item["descricao"],
+        valor=item.get("valor"),
+        regras=item.get("regras", {}),
+        vigencia=item.get("vigencia"),
+        exige_cid=item.get("exige_cid", False),
+        exige_apac=item.get("exige_apac", False),
+        doc_paciente=item.get("doc_paciente", "AMBOS_PERMITIDOS"),
+        sexo_permitido=item.get("sexo_permitido", "A"),
+        idade_min=item.get("idade_min"),
+        idade_max=item.get("idade_max"),
+        vigencia_inicio=inicio,
+        vigencia_fim=item.get("vigencia_fim"),
+    )
+
+
+def carregar_historico(session: Session) -> Dict[str, List[models.TabelaSIGTAP]]:
+    """
+    Todas as linhas por codigo, em ordem de vigencia. Com o importador incremental a
+    tabela tem uma linha por mudanca real, entao cabe numa consulta so.
+    """
+    historico: Dict[str, List[models.TabelaSIGTAP]] = defaultdict(list)
+    stmt = select(models.TabelaSIGTAP).order_by(
+        models.TabelaSIGTAP.codigo, models.TabelaSIGTAP.vigencia_inicio, models.TabelaSIGTAP.id
+    )
+    for linha in session.scalars(stmt):
+        historico[linha.codigo].append(linha)
+    return historico
+
+
+def aplicar_delta(
+    session: Session, registros: Iterable[dict], competencia: str, relacoes: Optional[Dict[str, dict]] = None
+) -> RelatorioDelta:
+    """
+    Aplica os registros de um pacote sobre o historico, registra a competencia em
+    `sigtap_importacoes` (com o resumo das `relacoes` ja aplicadas) e faz um unico commit.
+    Procedimentos vigentes que nao vieram no pacote so entram no relatorio (`ausentes`):
+    pacotes parciais nao devem encerrar vigencias.
+    """
+    relatorio = RelatorioDelta(competencia)
+    relatorio.relacoes = relacoes or {}
+    historico = carregar_historico(session)
+    recebidos = set()
+
+    for item in registros:
+        codigo = item["codigo"]
+        inicio = item.get("vigencia_inicio") or item.get("vigencia") or competencia
+        recebidos.add(codigo)
+        linhas = historico[codigo]
+        anterior = _vigente_em(linhas, inicio)
+
+        if anterior is None:
+            if _inserir(session, linhas, item, inicio) is not None:
+                relatorio.novos.append(codigo)
+            else:
+                relatorio.alterados.append(Alteracao(codigo, ["vigencia_inicio"]))
+            continue
+
+        campos = campos_alterados(anterior, item)
+        fim = item.get("vigencia_fim")
+        if not campos and _aberta_em(anterior, inicio):
+            # So a data de fim mudou; linhas ja encerradas por uma vigencia posterior ficam como estao
+            if fim != anterior.vigencia_fim and anterior is linhas[-1]:
+                anterior.vigencia_fim = fim
+                relatorio.alterados.append(Alteracao(codigo, ["vigencia_fim"]))
+            else:
+                relatorio.inalterados += 1
+            continue
+
+        if anterior.vigencia_inicio == inicio:
+            # Reimportacao da mesma vigencia com correcoes: atualiza a linha existente
+            if fim != anterior.vigencia_fim:
+                campos.append("vigencia_fim")
+            for campo in CAMPOS_CONTEUDO + ("vigencia_fim", "vigencia"):
+                setattr(anterior, campo, item.get(campo))
+        else:
+            if _aberta_em(anterior, inicio):
+                anterior.vigencia_fim = mes_anterior(inicio)
+            _inserir(session, linhas, item, inicio)
+            if not campos:
+                campos = ["vigencia_inicio"]  # reabertura de procedimento encerrado
+        relatorio.alterados.append(Alteracao(codigo, campos))
+
+    for codigo, linhas in historico.items():
+        if codigo not in recebidos and linhas and _aberta_em(linhas[-1], competencia):
+            relatorio.ausentes.append(codigo)
+
+    session.merge(
+        models.SigtapImportacao(
+            competencia=competencia,
+            importado_em=datetime.utcnow(),
+            novos=len(relatorio.novos),
+            alterados=len(relatorio.alterados),
+            inalterados=relatorio.inalterados,
+            relatorio_json=relatorio.como_dict(),
+        )
+    )
+    session.commit()
+    return relatorio
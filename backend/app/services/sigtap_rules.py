@@ -8,6 +8,7 @@ from sqlalchemy import or_, select
 from sqlalchemy.orm import Session
 
 from app import models
+from app.services import sigtap_compatibilidades, sigtap_snapshot
 from app.services.validators import validate_cns, validate_cnes, validate_sigtap_codigo
 
 
@@ -22,8 +23,12 @@ def calcular_idade(data_nascimento: date, data_referencia: date) -> int:
 
 def get_tabela_para_competencia(db: Session, codigo: str, competencia: str) -> Optional[models.TabelaSIGTAP]:
     """
-    Retorna a tabela vigente para o procedimento e competencia informados.
+    Retorna a tabela vigente para o procedimento e competencia informados. Le do
+    snapshot publicado pela ultima importacao quando houver; senao, do banco.
     """
+    snapshot = sigtap_snapshot.leitor(db)
+    if snapshot is not None:
+        return snapshot.buscar(codigo, competencia)
     stmt = (
         select(models.TabelaSIGTAP)
         .where(models.TabelaSIGTAP.codigo == codigo)
@@ -35,6 +40,9 @@ def get_tabela_para_competencia(db: Session, codigo: str, competencia: str) -> O
 
 
 def existe_procedimento(db: Session, codigo: str) -> bool:
+    snapshot = sigtap_snapshot.leitor(db)
+    if snapshot is not None:
+        return snapshot.existe(codigo)
     stmt = select(models.TabelaSIGTAP).where(models.TabelaSIGTAP.codigo == codigo)
     return db.scalars(stmt).first() is not None
 
@@ -47,14 +55,24 @@ def validate_procedimento(
     profissional,
     data_atendimento: date,
     tabela_proc: Optional[models.TabelaSIGTAP] = None,
+    codigo_existe: Optional[bool] = None,
+    compatibilidades: Optional[sigtap_compatibilidades.Compatibilidades] = None,
 ) -> List[str]:
     """
     Retorna lista de erros de validacao do procedimento para a competencia/data informada.
+
+    Quem ja resolveu a tabela vigente em lote informa `codigo_existe` (e as
+    `compatibilidades` da competencia); nesse caso `tabela_proc` e considerada
+    definitiva e nenhuma consulta e feita em `db`.
     """
     erros: List[str] = []
-    tabela_proc = tabela_proc or get_tabela_para_competencia(db, proc_model.sigtap_codigo, proc_model.competencia_aaaamm)
+    if codigo_existe is None:
+        tabela_proc = tabela_proc or get_tabela_para_competencia(db, proc_model.sigtap_codigo, proc_model.competencia_aaaamm)
+        if compatibilidades is None:
+            compatibilidades = sigtap_compatibilidades.carregar(db, proc_model.competencia_aaaamm)
     if not tabela_proc:
-        codigo_existe = existe_procedimento(db, proc_model.sigtap_codigo)
+        if codigo_existe is None:
+            codigo_existe = existe_procedimento(db, proc_model.sigtap_codigo)
         erros.append("procedimento_fora_vigencia" if codigo_existe else "procedimento_nao_encontrado_sigtap")
     else:
         if tabela_proc.exige_cid and not getattr(proc_model, "cid10", None):
@@ -68,6 +86,8 @@ def validate_procedimento(
             erros.append("sexo_incompativel")
         if tabela_proc.exige_apac:
             erros.append("procedimento_exige_apac")
+        if compatibilidades is not None:
+            erros.extend(sigtap_compatibilidades.validar(compatibilidades, proc_model, unidade, profissional))
 
     doc_rule = tabela_proc.doc_paciente if tabela_proc else "AMBOS_PERMITIDOS"
     if doc_rule == "CNS" and not paciente.cns:
@@ -0,0 +1,328 @@
+"""
+Snapshot binario da Tabela SIGTAP compartilhado entre processos (API, workers).
+
+Depois de cada importacao as linhas de `tabelas_sigtap` sao gravadas num arquivo
+somente-leitura de registros de tamanho fixo, ordenados por (codigo, vigencia_inicio).
+Cada processo mapeia o arquivo em memoria (`mmap`): as paginas ficam no page cache do
+sistema e sao compartilhadas, sem copia por processo nem consulta ao banco. A busca e
+binaria pelo codigo e a janela de vigencia e resolvida como em
+`sigtap_rules.get_tabela_para_competencia`.
+
+O arquivo e gerado num temporario e trocado com `os.replace`; leitores ja abertos
+continuam no mapeamento antigo e percebem a troca pelo inode/mtime, conferido no
+maximo a cada `sigtap_snapshot_verificar_segundos`.
+
+O arquivo e local ao container: a API e o worker nao compartilham o diretorio, e
+uma importacao feita em um deles nao atualiza o snapshot do outro. Por isso o
+cabecalho guarda a marca de `sigtap_importacoes` (quantidade e ultimo `importado_em`)
+de quando foi gerado, e o leitor a compara com a do banco no mesmo intervalo de
+verificacao: se diferirem, o snapshot esta desatualizado e as consultas voltam ao banco.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+from app.services.sigtap_cache import BACKEND_DIR
+
+logger = logging.getLogger(__name__)
+
+MAGICO = b"SGTP"
+FORMATO = 2
+
+# magico, formato, tamanho do registro, quantidade, versao (ns), importacoes,
+# ultimo importado_em (us), ultima competencia
+_CABECALHO = struct.Struct("<4sHHIqIq6s2x")
+# codigo, vigencia, vigencia_inicio, vigencia_fim, valor (centavos), idade_min, idade_max,
+# flags, sexo_permitido, doc_paciente, descricao
+_REGISTRO = struct.Struct("<10s6s6s6sqiiBc20s255s")
+
+_FLAG_EXIGE_CID = 1
+_FLAG_EXIGE_APAC = 2
+_AUSENTE = -1
+_EPOCA = datetime(1970, 1, 1)
+
+Marca = Tuple[int, int]
+
+
+class ProcedimentoSnapshot(NamedTuple):
+    """
+    Linha de `tabelas_sigtap` lida do snapshot; mesmos nomes de atributo do modelo.
+    """
+    codigo: str
+    descricao: str
+    valor: Optional[Decimal]
+    vigencia: Optional[str]
+    vigencia_inicio: Optional[str]
+    vigencia_fim: Optional[str]
+    exige_cid: bool
+    exige_apac: bool
+    doc_paciente: str
+    sexo_permitido: str
+    idade_min: Optional[int]
+    idade_max: Optional[int]
+
+
+def caminho_snapshot() -> Optional[Path]:
+    if not settings.sigtap_snapshot_arquivo:
+        return None
+    caminho = Path(settings.sigtap_snapshot_arquivo)
+    return caminho if caminho.is_absolute() else BACKEND_DIR / caminho
+
+
+def marca_importacoes(session: Session) -> Marca:
+    """
+    Quantidade de importacoes registradas e o ultimo `importado_em` (em us): muda a
+    cada importacao, inclusive reimportacao da mesma competencia.
+    """
+    quantidade, ultima = session.execute(
+        select(func.count(), func.max(models.SigtapImportacao.importado_em))
+    ).one()
+    if ultima is None:
+        return int(quantidade), _AUSENTE
+    delta = ultima.replace(tzinfo=None) - _EPOCA
+    return int(quantidade), (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _texto(valor: Optional[str], tamanho: int) -> bytes:
+    return (valor or "").encode("utf-8")[:tamanho]
+
+
+def _descricao(valor: Optional[str]) -> bytes:
+    dados = _texto(valor, 255)
+    # Nao corta um caractere multibyte ao meio
+    return dados.decode("utf-8", "ignore").encode("utf-8")
+
+
+def _opcional(valor: bytes) -> Optional[str]:
+    return valor.rstrip(b"\x00").decode("utf-8") or None
+
+
+def _inteiro(valor: Optional[int]) -> int:
+    return _AUSENTE if valor is None else int(valor)
+
+
+def _empacotar(linha: models.TabelaSIGTAP) -> bytes:
+    flags = (_FLAG_EXIGE_CID if linha.exige_cid else 0) | (_FLAG_EXIGE_APAC if linha.exige_apac else 0)
+    valor = _AUSENTE if linha.valor is None else int((Decimal(linha.valor) * 100).to_integral_value())
+    return _REGISTRO.pack(
+        _texto(linha.codigo, 10),
+        _texto(linha.vigencia, 6),
+        _texto(linha.vigencia_inicio, 6),
+        _texto(linha.vigencia_fim, 6),
+        valor,
+        _inteiro(linha.idade_min),
+        _inteiro(linha.idade_max),
+        flags,
+        _texto(linha.sexo_permitido or "A", 1),
+        _texto(linha.doc_paciente or "AMBOS_PERMITIDOS", 20),
+        _descricao(linha.descricao),
+    )
+
+
+def _desempacotar(dados: bytes) -> ProcedimentoSnapshot:
+    codigo, vigencia, inicio, fim, valor, idade_min, idade_max, flags, sexo, doc, descricao = _REGISTRO.unpack(dados)
+    return ProcedimentoSnapshot(
+        codigo=codigo.rstrip(b"\x00").decode("utf-8"),
+        descricao=descricao.rstrip(b"\x00").decode("utf-8"),
+        valor=None if valor == _AUSENTE else Decimal(valor).scaleb(-2),
+        vigencia=_opcional(vigencia),
+        vigencia_inicio=_opcional(inicio),
+        vigencia_fim=_opcional(fim),
+        exige_cid=bool(flags & _FLAG_EXIGE_CID),
+        exige_apac=bool(flags & _FLAG_EXIGE_APAC),
+        doc_paciente=doc.rstrip(b"\x00").decode("utf-8"),
+        sexo_permitido=sexo.decode("utf-8"),
+        idade_min=None if idade_min == _AUSENTE else idade_min,
+        idade_max=None if idade_max == _AUSENTE else idade_max,
+    )
+
+
+class LeitorSnapshot:
+    """
+    Leitura do snapshot mapeado em memoria. Instancias sao imutaveis e seguras entre threads.
+    """
+
+    def __init__(self, caminho: Path) -> None:
+        with open(caminho, "rb") as arquivo:
+            self._stat = os.fstat(arquivo.fileno())
+            self._mmap = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, formato, tamanho, quantidade, versao, importacoes, importado_em, competencia = _CABECALHO.unpack_from(
+            self._mmap, 0
+        )
+        esperado = _CABECALHO.size + quantidade * _REGISTRO.size
+        if magico != MAGICO or formato != FORMATO or tamanho != _REGISTRO.size or len(self._mmap) != esperado:
+            self._mmap.close()
+            raise ValueError(f"Snapshot SIGTAP invalido: {caminho}")
+        self.caminho = caminho
+        self.quantidade = quantidade
+        self.versao = versao
+        self.marca: Marca = (importacoes, importado_em)
+        self.competencia = _opcional(competencia)
+
+    @property
+    def identidade(self) -> Tuple[int, int, int]:
+        return self._stat.st_ino, self._stat.st_mtime_ns, self._stat.st_size
+
+    def __len__(self) -> int:
+        return self.quantidade
+
+    def _codigo(self, indice: int) -> bytes:
+        inicio = _CABECALHO.size + indice * _REGISTRO.size
+        return self._mmap[inicio:inicio + 10]
+
+    def _registro(self, indice: int) -> ProcedimentoSnapshot:
+        inicio = _CABECALHO.size + indice * _REGISTRO.size
+        return _desempacotar(self._mmap[inicio:inicio + _REGISTRO.size])
+
+    def _primeiro(self, chave: bytes) -> int:
+        baixo, alto = 0, self.quantidade
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self._codigo(meio) < chave:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def linhas(self, codigo: str) -> Iterable[ProcedimentoSnapshot]:
+        """
+        Todas as linhas do codigo, em ordem de vigencia_inicio.
+        """
+        chave = _texto(codigo, 10).ljust(10, b"\x00")
+        indice = self._primeiro(chave)
+        while indice < self.quantidade and self._codigo(indice) == chave:
+            yield self._registro(indice)
+            indice += 1
+
+    def buscar(self, codigo: str, competencia: str) -> Optional[ProcedimentoSnapshot]:
+        """
+        Linha vigente na competencia: a de maior vigencia_inicio cuja janela a contem.
+        """
+        vigente = None
+        for linha in self.linhas(codigo):
+            if linha.vigencia_inicio is not None and linha.vigencia_inicio > competencia:
+                break
+            if linha.vigencia_fim is None or linha.vigencia_fim >= competencia:
+                vigente = linha
+        return vigente
+
+    def existe(self, codigo: str) -> bool:
+        chave = _texto(codigo, 10).ljust(10, b"\x00")
+        indice = self._primeiro(chave)
+        return indice < self.quantidade and self._codigo(indice) == chave
+
+    def fechar(self) -> None:
+        self._mmap.close()
+
+
+def gerar(session: Session, caminho: Optional[Path] = None) -> Optional[Path]:
+    """
+    Grava o snapshot das linhas atuais de `tabelas_sigtap` e troca o arquivo de forma atomica.
+    """
+    caminho = caminho or caminho_snapshot()
+    if caminho is None:
+        return None
+    # Marca antes das linhas: se outra importacao entrar no meio, o snapshot sai com a
+    # marca antiga e os leitores ficam no banco ate a proxima publicacao
+    marca = marca_importacoes(session)
+    linhas = session.scalars(select(models.TabelaSIGTAP)).all()
+    # Mesma ordem do desempate de get_tabela_para_competencia: vigencia_inicio, depois id
+    linhas = sorted(linhas, key=lambda l: (l.codigo, l.vigencia_inicio or "", l.id))
+    competencia = session.execute(select(models.SigtapImportacao.competencia).order_by(
+        models.SigtapImportacao.competencia.desc()
+    )).scalars().first()
+
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=caminho.parent, suffix=".tmp", delete=False) as tmp:
+        try:
+            tmp.write(
+                _CABECALHO.pack(
+                    MAGICO, FORMATO, _REGISTRO.size, len(linhas), time.time_ns(), *marca, _texto(competencia, 6)
+                )
+            )
+            for linha in linhas:
+                tmp.write(_empacotar(linha))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, caminho)
+    _descartar(caminho)
+    logger.info("sigtap_snapshot_gerado", extra={"registros": len(linhas), "arquivo": str(caminho)})
+    return caminho
+
+
+def invalidar(caminho: Optional[Path] = None) -> None:
+    """
+    Remove o snapshot publicado: leitores deste e de outros processos voltam ao banco.
+    Usado quando a tabela mudou e o snapshot novo nao pode ser gerado.
+    """
+    caminho = caminho or caminho_snapshot()
+    if caminho is None:
+        return
+    caminho.unlink(missing_ok=True)
+    _descartar(caminho)
+
+
+# caminho -> (leitor, verificado_em, em dia com o banco)
+_leitores: Dict[Path, Tuple[Optional[LeitorSnapshot], float, bool]] = {}
+_leitores_lock = threading.Lock()
+
+
+def _descartar(caminho: Path) -> None:
+    # O mapeamento antigo nao e fechado: pode haver leitura em andamento em outra thread
+    with _leitores_lock:
+        _leitores.pop(caminho, None)
+
+
+def _identidade(caminho: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = caminho.stat()
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def leitor(db: Session) -> Optional[LeitorSnapshot]:
+    """
+    Leitor do snapshot configurado, ou None se nao houver arquivo valido e em dia com
+    `sigtap_importacoes` (quem chama cai para o banco). Reabre quando outro processo
+    troca o arquivo; arquivo e marca sao conferidos a cada `sigtap_snapshot_verificar_segundos`.
+    """
+    caminho = caminho_snapshot()
+    if caminho is None:
+        return None
+    agora = time.monotonic()
+    with _leitores_lock:
+        atual, verificado_em, em_dia = _leitores.get(caminho, (None, None, False))
+    if verificado_em is not None and agora - verificado_em < settings.sigtap_snapshot_verificar_segundos:
+        return atual if em_dia else None
+
+    identidade = _identidade(caminho)
+    if atual is None or identidade != atual.identidade:
+        atual = None
+        if identidade is not None:
+            try:
+                atual = LeitorSnapshot(caminho)
+            except (OSError, ValueError, struct.error) as exc:
+                logger.warning("sigtap_snapshot_invalido", extra={"arquivo": str(caminho), "erro": str(exc)})
+    em_dia = atual is not None and atual.marca == marca_importacoes(db)
+    if atual is not None and not em_dia:
+        logger.info("sigtap_snapshot_desatualizado", extra={"arquivo": str(caminho), "competencia": atual.competencia})
+    with _leitores_lock:
+        _leitores[caminho] = (atual, agora, em_dia)
+    return atual if em_dia else None
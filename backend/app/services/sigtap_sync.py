@@ -1,17 +1,35 @@
 import csv
 import io
+import logging
 import zipfile
 from datetime import datetime
-from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
-import httpx
 from sqlalchemy import and_, func, or_, select
 
 from app import models
+from app.core import metrics
 from app.core.config import settings
+from app.services import sigtap_cache, sigtap_compatibilidades, sigtap_snapshot
+from app.services.sigtap_delta import RelatorioDelta, aplicar_delta
+
+logger = logging.getLogger(__name__)
 
 CSV_DELIMITER = ";"
 
+# Arquivos de relacao do pacote: tipo -> (nomes possiveis, colunas que formam o codigo)
+ARQUIVOS_RELACAO = {
+    "cid": (("rl_procedimento_cid",), ("CO_CID",)),
+    "cbo": (("rl_procedimento_ocupacao", "rl_procedimento_cbo"), ("CO_OCUPACAO",)),
+    "habilitacao": (("rl_procedimento_habilitacao",), ("CO_HABILITACAO",)),
+    "servico": (("rl_procedimento_servico",), ("CO_SERVICO", "CO_CLASSIFICACAO")),
+}
+
+
+class PacoteSIGTAP(NamedTuple):
+    registros: List[Dict]
+    relacoes: Dict[str, Optional[Set[Tuple[str, str]]]]  # None: relacao ausente do pacote
+
 
 def _normalize_bool(value: Optional[str]) -> bool:
     if value is None:
@@ -58,14 +76,32 @@ def _iter_csv_rows(file_bytes: bytes) -> Iterable[Dict[str, str]]:
         yield {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
 
 
-def _find_first_matching(zf: zipfile.ZipFile, keywords: Tuple[str, ...]) -> Optional[str]:
+def _find_first_matching(zf: zipfile.ZipFile, keywords: Tuple[str, ...], excluir: Tuple[str, ...] = ()) -> Optional[str]:
     for name in zf.namelist():
         lower = name.lower()
+        base = lower.rsplit("/", 1)[-1]
+        if any(base.startswith(prefixo) for prefixo in excluir):
+            continue
         if lower.endswith(".csv") and any(key in lower for key in keywords):
             return name
     return None
 
 
+def _parse_relacao(rows: Iterable[Dict[str, str]], tipo: str, colunas: Tuple[str, ...]) -> Set[Tuple[str, str]]:
+    pares: Set[Tuple[str, str]] = set()
+    for row in rows:
+        procedimento = (row.get("CO_PROCEDIMENTO") or "").zfill(10)
+        partes = [(row.get(coluna) or "").strip() for coluna in colunas]
+        if not procedimento.strip("0") or not all(partes):
+            continue
+        if tipo == "cid":
+            codigo = sigtap_compatibilidades.normalizar_cid(partes[0])
+        else:
+            codigo = "".join(parte.zfill(3) for parte in partes) if tipo == "servico" else partes[0]
+        pares.add((procedimento, codigo))
+    return pares
+
+
 def _parse_procedimento_rows(proc_rows: Iterable[Dict[str, str]], regra_por_codigo: Dict[str, Dict[str, str]], competencia: str) -> List[Dict]:
     registros: List[Dict] = []
     for row in proc_rows:
@@ -125,16 +161,36 @@ def _montar_regra_map(regra_rows: Iterable[Dict[str, str]]) -> Dict[str, Dict[st
     return regras
 
 
+def validar_competencia(competencia: str) -> str:
+    competencia = competencia.strip()
+    if len(competencia) != 6 or not competencia.isdigit() or not 1 <= int(competencia[4:]) <= 12:
+        raise ValueError("Competencia deve estar no formato AAAAMM")
+    return competencia
+
+
 class TabelaSIGTAPRepository:
     def __init__(self, session):
         self.session = session
 
     def competencia_importada(self, competencia: str) -> bool:
+        if self.session.get(models.SigtapImportacao, competencia) is not None:
+            return True
+        # Competencias importadas antes do importador incremental nao tem registro proprio
         stmt = select(func.count()).select_from(models.TabelaSIGTAP).where(
             or_(models.TabelaSIGTAP.vigencia == competencia, models.TabelaSIGTAP.vigencia_inicio == competencia)
         )
         return self.session.execute(stmt).scalar_one() > 0
 
+    def aplicar(
+        self,
+        registros: List[Dict],
+        competencia: str,
+        relacoes: Optional[Dict[str, Optional[Set[Tuple[str, str]]]]] = None,
+    ) -> RelatorioDelta:
+        # Relacoes primeiro, sem commit: o commit unico fica com `aplicar_delta`
+        resumo = sigtap_compatibilidades.aplicar_relacoes(self.session, relacoes or {}, competencia)
+        return aplicar_delta(self.session, registros, competencia, relacoes=resumo)
+
     def salvar(self, item: dict) -> bool:
         vigencia_inicio = item.get("vigencia_inicio") or item.get("vigencia")
         exists_stmt = select(models.TabelaSIGTAP).where(
@@ -166,8 +222,11 @@ class TabelaSIGTAPRepository:
         return True
 
     def ultima_competencia(self) -> Optional[str]:
-        stmt = select(func.max(models.TabelaSIGTAP.vigencia))
-        return self.session.execute(stmt).scalar_one()
+        candidatas = [
+            self.session.execute(select(func.max(models.TabelaSIGTAP.vigencia))).scalar_one(),
+            self.session.execute(select(func.max(models.SigtapImportacao.competencia))).scalar_one(),
+        ]
+        return max((c for c in candidatas if c), default=None)
 
     def total_registros(self) -> int:
         stmt = select(func.count()).select_from(models.TabelaSIGTAP)
@@ -177,6 +236,17 @@ class TabelaSIGTAPRepository:
         stmt = select(func.count()).select_from(models.TabelaSIGTAP).where(models.TabelaSIGTAP.codigo == codigo)
         return self.session.execute(stmt).scalar_one() > 0
 
+    def publicar_snapshot(self) -> None:
+        # Tabela ja commitada: sem snapshot novo, o antigo nao pode continuar valendo
+        try:
+            sigtap_snapshot.gerar(self.session)
+        except Exception:
+            logger.exception("sigtap_snapshot_falhou")
+            try:
+                sigtap_snapshot.invalidar()
+            except OSError:
+                logger.exception("sigtap_snapshot_invalidacao_falhou")
+
 
 class SIGTAPSyncService:
     def __init__(
@@ -203,20 +273,12 @@ class SIGTAPSyncService:
     def _download_zip(self, competencia: str) -> bytes:
         if self.fetcher:
             return self.fetcher(competencia)
-
-        errors: List[str] = []
-        for url in self._build_urls(competencia):
-            try:
-                resp = httpx.get(url, timeout=60)
-                resp.raise_for_status()
-                return resp.content
-            except Exception as exc:
-                errors.append(f"{url}: {exc}")
-        raise RuntimeError(f"Nao foi possivel baixar SIGTAP {competencia}. Tentativas: {' | '.join(errors)}")
+        return sigtap_cache.obter_pacote(competencia, self._build_urls(competencia))
 
     def _parse_zip(self, zip_bytes: bytes, competencia: str) -> List[Dict]:
         with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
-            proc_name = _find_first_matching(zf, ("proced", "tb_procedimento"))
+            # rl_procedimento_* sao as relacoes, nao a tabela de procedimentos
+            proc_name = _find_first_matching(zf, ("proced", "tb_procedimento"), excluir=("rl_",))
             if not proc_name:
                 raise RuntimeError("Pacote SIGTAP sem tabela de procedimentos")
             regra_name = _find_first_matching(zf, ("regra", "restricao", "condicao"))
@@ -226,26 +288,41 @@ class SIGTAPSyncService:
             regra_map = _montar_regra_map(regra_rows)
             return _parse_procedimento_rows(proc_rows, regra_map, competencia)
 
-    def sync(self, competencia: str) -> Dict[str, object]:
-        competencia = competencia.strip()
-        if len(competencia) != 6 or not competencia.isdigit():
-            raise ValueError("Competencia deve estar no formato AAAAMM")
-
-        zip_bytes = self._download_zip(competencia)
-        registros = self._parse_zip(zip_bytes, competencia)
-
-        inseridos = 0
-        ja_existiam = 0
-        for item in registros:
-            if self.repository.salvar(item):
-                inseridos += 1
-            else:
-                ja_existiam += 1
+    def _parse_relacoes(self, zip_bytes: bytes) -> Dict[str, Optional[Set[Tuple[str, str]]]]:
+        relacoes: Dict[str, Optional[Set[Tuple[str, str]]]] = {}
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+            for tipo, (nomes, colunas) in ARQUIVOS_RELACAO.items():
+                nome = _find_first_matching(zf, nomes)
+                relacoes[tipo] = _parse_relacao(_iter_csv_rows(zf.read(nome)), tipo, colunas) if nome else None
+        return relacoes
+
+    def preparar(self, competencia: str) -> PacoteSIGTAP:
+        """
+        Download e parse do pacote; nao toca no banco (pode rodar em outro processo).
+        """
+        with metrics.cronometrar(metrics.SIGTAP_FASE_SEGUNDOS, fase="download"):
+            zip_bytes = self._download_zip(competencia)
+        with metrics.cronometrar(metrics.SIGTAP_FASE_SEGUNDOS, fase="parse"):
+            return PacoteSIGTAP(self._parse_zip(zip_bytes, competencia), self._parse_relacoes(zip_bytes))
+
+    def importar(self, competencia: str, pacote: PacoteSIGTAP, publicar_snapshot: bool = True) -> Dict[str, object]:
+        with metrics.cronometrar(metrics.SIGTAP_FASE_SEGUNDOS, fase="insert"):
+            relatorio = self.repository.aplicar(pacote.registros, competencia, pacote.relacoes)
+        if publicar_snapshot:
+            self.repository.publicar_snapshot()
+        metrics.SIGTAP_REGISTROS.labels(resultado="novo").inc(len(relatorio.novos))
+        metrics.SIGTAP_REGISTROS.labels(resultado="alterado").inc(len(relatorio.alterados))
+        metrics.SIGTAP_REGISTROS.labels(resultado="inalterado").inc(relatorio.inalterados)
 
         return {
             "competencia": competencia,
-            "importados": inseridos,
-            "ja_existiam": ja_existiam,
+            "importados": relatorio.gravados,
+            "ja_existiam": relatorio.inalterados,
+            "delta": relatorio.como_dict(),
             "total_registros": self.repository.total_registros(),
             "quando": datetime.utcnow().isoformat(),
         }
+
+    def sync(self, competencia: str) -> Dict[str, object]:
+        competencia = validar_competencia(competencia)
+        return self.importar(competencia, self.preparar(competencia))
@@ -1,9 +1,11 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from app.celery_app import celery_app
+from app.core import admissao
 from app.core.config import settings
 from app.database import SessionLocal
+from app.services import sigtap_backfill
 from app.services.sigtap_sync import SIGTAPSyncService, TabelaSIGTAPRepository
 
 
@@ -20,8 +22,40 @@ def _sync_current_competencia() -> Optional[dict]:
         session.close()
 
 
-@celery_app.task(name="sigtap.sync_current_competencia")
-def sync_sigtap_current_competencia():
+@celery_app.task(name="sigtap.sync_current_competencia", bind=True, max_retries=None, acks_late=True)
+def sync_sigtap_current_competencia(self):
     if not settings.sigtap_job_enabled:
         return None
-    return _sync_current_competencia()
+    # Mesma chave global do backfill e da rota: uma carga da tabela por vez
+    try:
+        with admissao.reservar("sigtap", None, espera=0):
+            return _sync_current_competencia()
+    except admissao.TenantSaturado as exc:
+        raise self.retry(countdown=exc.retry_after)
+
+
+@celery_app.task(name="sigtap.backfill", bind=True, max_retries=None, acks_late=True)
+def backfill_sigtap(self, competencias: List[str], reimportar: bool = False):
+    """
+    Carga de varias competencias; o progresso fica no estado PROGRESS da tarefa.
+    A tabela SIGTAP e global: as cargas disputam as vagas da chave global, nao as do tenant.
+    """
+    try:
+        permissao = admissao.adquirir("sigtap", None, espera=0)
+    except admissao.TenantSaturado as exc:
+        raise self.retry(countdown=exc.retry_after)
+    session = SessionLocal()
+    concluidas: List[dict] = []
+
+    def progresso(resultado: dict) -> None:
+        concluidas.append({k: resultado.get(k) for k in ("competencia", "status", "importados", "erro")})
+        self.update_state(state="PROGRESS", meta={"total": resultado["total"], "concluidas": concluidas})
+
+    try:
+        resultados = sigtap_backfill.backfill(
+            TabelaSIGTAPRepository(session), competencias, reimportar=reimportar, progresso=progresso
+        )
+        return {"total": len(resultados), "concluidas": concluidas}
+    finally:
+        session.close()
+        permissao.liberar()
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+
+import pytest
+
+from app.core import query_stats
+from app.core.config import settings
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Uso: `with query_budget(5): ...` falha se o bloco executar mais de 5 consultas.
+    """
+
+    @contextmanager
+    def _budget(maximo: int):
+        with query_stats.medir_consultas() as consultas:
+            yield consultas
+        statements = "\n".join(f"{n}x {sql}" for sql, n in consultas.por_statement.most_common(5))
+        assert consultas.total <= maximo, f"{consultas.total} consultas (limite {maximo}):\n{statements}"
+
+    return _budget
+
+
+@pytest.fixture(autouse=True)
+def sigtap_snapshot_isolado(tmp_path, monkeypatch):
+    """
+    Cada teste tem seu proprio snapshot SIGTAP: o arquivo gerado por um sync nao vaza
+    para o banco em memoria de outro teste.
+    """
+    monkeypatch.setattr(settings, "sigtap_snapshot_arquivo", str(tmp_path / "sigtap_vigente.bin"))
@@ -0,0 +1,128 @@
+import pytest
+from celery.exceptions import Retry
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth import create_access_token
+from app.core import admissao
+from app.main import app as api
+from app.dependencies import get_current_tenant_id, limitar_por_tenant
+
+
+@pytest.fixture(autouse=True)
+def limites(monkeypatch):
+    monkeypatch.setattr(admissao.settings, "admissao_backend", "local")
+    monkeypatch.setattr(admissao.settings, "admissao_concorrencia_tenant", 1)
+    monkeypatch.setattr(admissao.settings, "admissao_fila_tenant", 1)
+    monkeypatch.setattr(admissao.settings, "admissao_espera_max_segundos", 0.2)
+    monkeypatch.setattr(admissao.settings, "admissao_retry_after_segundos", 7)
+    admissao.redefinir()
+    yield
+    admissao.redefinir()
+
+
+def test_vaga_por_tenant_com_fila_limitada():
+    ocupada = admissao.adquirir("exportacao", 1)
+    # Outro tenant e outra operacao nao disputam a mesma vaga
+    admissao.adquirir("exportacao", 2).liberar()
+    admissao.adquirir("auditoria", 1).liberar()
+
+    with pytest.raises(admissao.TenantSaturado) as exc:
+        admissao.adquirir("exportacao", 1)
+    assert exc.value.retry_after == 7
+
+    # Fila ocupada por alguem esperando: o proximo e recusado sem esperar
+    assert admissao.vagas().entrar_fila("exportacao:1", 1)
+    with pytest.raises(admissao.TenantSaturado):
+        admissao.adquirir("exportacao", 1, espera=5)
+    admissao.vagas().sair_fila("exportacao:1")
+
+    ocupada.liberar()
+    with admissao.reservar("exportacao", 1, espera=0):
+        pass
+
+
+def test_rota_pesada_responde_429_com_retry_after():
+    app = FastAPI()
+
+    @app.get("/pesada", dependencies=[Depends(limitar_por_tenant("exportacao"))])
+    def pesada():
+        return {"ok": True}
+
+    tenant = {"id": 1}
+    app.dependency_overrides[get_current_tenant_id] = lambda: tenant["id"]
+    client = TestClient(app)
+
+    assert client.get("/pesada").status_code == 200  # vaga devolvida ao fim da requisicao
+    ocupada = admissao.adquirir("exportacao", 1)
+    resp = client.get("/pesada")
+    assert resp.status_code == 429 and resp.headers["retry-after"] == "7"
+    tenant["id"] = 2
+    assert client.get("/pesada").status_code == 200
+    ocupada.liberar()
+
+
+def test_rotas_de_exportacao_e_auditoria_passam_pela_admissao():
+    token = create_access_token(1, 1, ["FATURAMENTO"])
+    cabecalhos = {"Authorization": f"Bearer {token}"}
+    ocupadas = [admissao.adquirir("auditoria", 1), admissao.adquirir("exportacao", 1)]
+    client = TestClient(api)
+    for rota in ("/api/auditoria/competencia/202501", "/api/audit/competencia/202501", "/api/exports/bpa?competencia=202501"):
+        resp = client.get(rota, headers=cabecalhos)
+        assert resp.status_code == 429, rota
+    for permissao in ocupadas:
+        permissao.liberar()
+
+
+def test_tarefa_cmd_de_tenant_saturado_volta_para_a_fila(monkeypatch):
+    from app.services import cmd_tasks
+
+    monkeypatch.setattr(cmd_tasks.settings, "cmd_job_enabled", True)
+    executados = []
+    monkeypatch.setattr(cmd_tasks, "_process_tenant", executados.append)
+
+    ocupada = admissao.adquirir("cmd", 1)
+    with pytest.raises(Retry):
+        cmd_tasks.processar_cmd_tenant.run(1)
+    cmd_tasks.processar_cmd_tenant.run(2)
+    assert executados == [2]
+    ocupada.liberar()
+
+
+def test_admissao_async_nao_usa_chamadas_bloqueantes_do_backend(monkeypatch):
+    import asyncio
+
+    class _SoAsync(admissao.VagasLocais):
+        def tentar_adquirir(self, *args):
+            raise AssertionError("chamada bloqueante no event loop")
+
+        async def tentar_adquirir_async(self, chave, limite, token):
+            return admissao.VagasLocais.tentar_adquirir(self, chave, limite, token)
+
+    monkeypatch.setattr(admissao, "_vagas", _SoAsync())
+
+    async def fluxo():
+        permissao = await admissao.adquirir_async("exportacao", 1)
+        with pytest.raises(admissao.TenantSaturado):
+            await admissao.adquirir_async("exportacao", 1)
+        await permissao.liberar_async()
+        await (await admissao.adquirir_async("exportacao", 1)).liberar_async()
+
+    asyncio.run(fluxo())
+
+
+def test_carga_sigtap_disputa_a_vaga_global_entre_tenants(monkeypatch):
+    from app.services import sigtap_tasks
+
+    ocupada = admissao.adquirir("sigtap", None)
+    client = TestClient(api)
+    for tenant_id in (1, 2):
+        token = create_access_token(1, tenant_id, ["ADMIN_TENANT"])
+        resp = client.post("/api/sigtap/sync?competencia=202501", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 429, tenant_id
+
+    monkeypatch.setattr(sigtap_tasks.settings, "sigtap_job_enabled", True)
+    monkeypatch.setattr(sigtap_tasks, "_sync_current_competencia", lambda: pytest.fail("carga concorrente"))
+    with pytest.raises(Retry):
+        sigtap_tasks.sync_sigtap_current_competencia.run()
+    ocupada.liberar()
@@ -0,0 +1,118 @@
+from datetime import date, datetime, time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.api.routes.core import AgendaUpdate, create_agenda, gerar_agendas, update_agenda
+from app.database import Base
+from app.schemas.base import AgendaCreate, AgendaGeracao
+from app.services import agenda_service
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    db.add(models.Tenant(id=1, name="Tenant"))
+    db.add(models.Unidade(id=1, tenant_id=1, nome="CER", cnes="1234567", cnpj="12345678000199", uf="DF", ibge_cod="5300108", destino="M", competencia_params={}))
+    for prof_id, cbo in ((1, "225120"), (2, "223605"), (3, "223605")):
+        db.add(models.Profissional(id=prof_id, tenant_id=1, unidade_id=1, nome=f"Prof {prof_id}", cpf="12345678901", cns="898001160660001", cbo=cbo))
+    db.add(models.Usuario(id=1, email="recepcao@x", nome="Recepcao", hashed_password="x"))
+    db.commit()
+    return db
+
+
+def _agendar(db, profissional_id, data, duracao=30, status="livre"):
+    payload = AgendaCreate(
+        tenant_id=1, unidade_id=1, profissional_id=profissional_id, data=data, duracao_minutos=duracao, tipo="consulta", status=status
+    )
+    return create_agenda(payload, db=db, current_user=db.get(models.Usuario, 1), current_tenant_id=1)
+
+
+def test_conflito_no_create_e_no_update_considera_duracao():
+    db = _session()
+    primeira = _agendar(db, 1, datetime(2025, 3, 10, 9, 0), duracao=60)
+    _agendar(db, 1, datetime(2025, 3, 10, 10, 0))  # encosta no fim: nao conflita
+    _agendar(db, 2, datetime(2025, 3, 10, 9, 30))  # outro profissional
+
+    with pytest.raises(HTTPException) as exc:
+        _agendar(db, 1, datetime(2025, 3, 10, 9, 45))
+    assert exc.value.status_code == 409 and str(primeira.id) in exc.value.detail
+
+    cancelada = _agendar(db, 1, datetime(2025, 3, 10, 11, 0), status="cancelado")
+    _agendar(db, 1, datetime(2025, 3, 10, 11, 0))
+    with pytest.raises(HTTPException) as exc:
+        update_agenda(cancelada.id, AgendaUpdate(status="agendado"), db=db, current_user=db.get(models.Usuario, 1), current_tenant_id=1)
+    assert exc.value.status_code == 409
+    db.rollback()
+
+    # Mudar a propria agenda de horario nao conflita com ela mesma
+    movida = update_agenda(
+        primeira.id, AgendaUpdate(data=datetime(2025, 3, 10, 8, 30)), db=db, current_user=db.get(models.Usuario, 1), current_tenant_id=1
+    )
+    assert movida.data == datetime(2025, 3, 10, 8, 30)
+
+
+def test_indice_de_intervalos_busca_so_a_faixa_que_pode_cruzar():
+    indice = agenda_service.IndiceIntervalos()
+    indice.adicionar(1, datetime(2025, 3, 10, 8, 0), datetime(2025, 3, 10, 16, 0), 10)
+    indice.adicionar(1, datetime(2025, 3, 10, 17, 0), datetime(2025, 3, 10, 17, 30), 11)
+    indice.adicionar(2, datetime(2025, 3, 10, 12, 0), datetime(2025, 3, 10, 12, 30), 12)
+
+    assert indice.conflitos(1, datetime(2025, 3, 10, 15, 30), datetime(2025, 3, 10, 17, 15)) == [10, 11]
+    assert indice.conflitos(1, datetime(2025, 3, 10, 16, 0), datetime(2025, 3, 10, 17, 0)) == []
+    assert indice.conflitos(3, datetime(2025, 3, 10, 12, 0), datetime(2025, 3, 10, 13, 0)) == []
+
+
+def test_proximos_livres_por_especialidade():
+    db = _session()
+    _agendar(db, 2, datetime(2025, 3, 10, 9, 0))
+    _agendar(db, 3, datetime(2025, 3, 10, 8, 0))
+    _agendar(db, 3, datetime(2025, 3, 10, 8, 30), status="agendado")
+    _agendar(db, 1, datetime(2025, 3, 10, 7, 0))
+    _agendar(db, 2, datetime(2025, 3, 9, 9, 0))
+    _agendar(db, 2, datetime(2025, 3, 11, 9, 0))
+
+    stmt = agenda_service.consulta_livres(1, datetime(2025, 3, 10), 2, cbo="223605")
+    livres = db.scalars(stmt).all()
+    assert [(a.profissional_id, a.data.hour, a.data.day) for a in livres] == [(3, 8, 10), (2, 9, 10)]
+
+    por_profissional = db.scalars(agenda_service.consulta_livres(1, datetime(2025, 3, 10), 5, profissional_id=2)).all()
+    assert [a.data.day for a in por_profissional] == [10, 11]
+
+
+def test_geracao_por_modelo_em_lote_ignora_conflitos_e_audita_uma_vez():
+    db = _session()
+    db.add_all(
+        [
+            # Segundas 08:00-10:00 em horarios de 30 min; a faixa 09:40-10:00 nao comporta um horario
+            models.AgendaModelo(tenant_id=1, unidade_id=1, profissional_id=2, dia_semana=0, hora_inicio=time(8, 0), hora_fim=time(10, 0), duracao_minutos=30),
+            models.AgendaModelo(tenant_id=1, unidade_id=1, profissional_id=2, dia_semana=0, hora_inicio=time(9, 40), hora_fim=time(10, 0), duracao_minutos=30),
+            models.AgendaModelo(tenant_id=1, unidade_id=1, profissional_id=3, dia_semana=2, hora_inicio=time(14, 0), hora_fim=time(15, 0), duracao_minutos=20),
+            models.AgendaModelo(tenant_id=1, unidade_id=1, profissional_id=3, dia_semana=2, hora_inicio=time(7, 0), hora_fim=time(8, 0), ativo=False),
+        ]
+    )
+    db.commit()
+    _agendar(db, 2, datetime(2025, 3, 10, 8, 45), status="agendado")
+    auditoria_antes = db.scalar(select(func.count()).select_from(models.AuditLog))
+    usuario = db.get(models.Usuario, 1)
+
+    # 10/03/2025 e segunda; o periodo cobre duas segundas e duas quartas
+    resultado = gerar_agendas(AgendaGeracao(de=date(2025, 3, 10), ate=date(2025, 3, 19)), db=db, current_user=usuario, current_tenant_id=1)
+
+    assert resultado == {"criadas": 4 + 2 + 3 + 3, "conflitos": 2, "profissionais": 2}
+    segunda = db.scalars(
+        select(models.Agenda.data).where(models.Agenda.profissional_id == 2, models.Agenda.status == "livre", models.Agenda.data < datetime(2025, 3, 11))
+    ).all()
+    assert sorted(d.time() for d in segunda) == [time(8, 0), time(9, 30)]
+    assert db.scalar(select(func.count()).select_from(models.AuditLog)) == auditoria_antes + 1
+
+    repetida = gerar_agendas(AgendaGeracao(de=date(2025, 3, 10), ate=date(2025, 3, 19)), db=db, current_user=usuario, current_tenant_id=1)
+    assert repetida["criadas"] == 0 and repetida["conflitos"] == 14
+
+    with pytest.raises(HTTPException) as exc:
+        gerar_agendas(AgendaGeracao(de=date(2025, 1, 1), ate=date(2025, 6, 30)), db=db, current_user=usuario, current_tenant_id=1)
+    assert exc.value.status_code == 422
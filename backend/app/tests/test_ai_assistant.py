@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.scripts import fake_ai_server
+from app.services import ai_assistant, ai_cache
+from app.services.ai_assistant import AiAssistantService, LimiteConcorrenciaExcedido, limite_tenant
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "ai_api_key", "fake")
+    monkeypatch.setattr(settings, "ai_model_name", "fake")
+    monkeypatch.setattr(fake_ai_server, "LATENCIA", 0)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_ai_server.app), base_url="http://fake-ai")
+    return AiAssistantService(client=client)
+
+
+def test_gerar_resposta_usa_cliente_async(service):
+    resposta = asyncio.run(service.gerar_resposta({"paciente": None}, "oi"))
+    assert resposta == fake_ai_server.RESPOSTA
+
+
+def test_stream_repassa_trechos(service):
+    async def coletar():
+        return [trecho async for trecho in service.gerar_resposta_stream({}, "oi")]
+
+    trechos = asyncio.run(coletar())
+    assert len(trechos) > 1
+    assert "".join(trechos).strip() == fake_ai_server.RESPOSTA
+
+
+def test_limite_por_tenant(monkeypatch):
+    monkeypatch.setattr(settings, "ai_max_concorrencia_tenant", 1)
+    monkeypatch.setattr(ai_assistant, "_semaforos", {})
+
+    async def cenario():
+        async with limite_tenant(1):
+            with pytest.raises(LimiteConcorrenciaExcedido):
+                async with limite_tenant(1):
+                    pass
+            async with limite_tenant(2):
+                pass
+        async with limite_tenant(1):
+            pass
+
+    asyncio.run(cenario())
+
+
+def test_cache_isola_tenants_e_normaliza_mensagem():
+    contexto = {"paciente": {"id": 1, "nome": "Maria  da Silva"}}
+    chave = ai_cache.chave_resposta(1, "fake", contexto, "Qual a  conduta?")
+    assert chave == ai_cache.chave_resposta(1, "fake", {"paciente": {"nome": "Maria da Silva", "id": 1}}, " qual a conduta? ")
+    assert chave != ai_cache.chave_resposta(2, "fake", contexto, "Qual a  conduta?")
+
+
+def test_cache_compartilha_resposta_entre_usuarios_do_tenant():
+    contexto = {"paciente": {"id": 1}, "usuario": {"id": 10, "nome": "Ana"}}
+    chave = ai_cache.chave_resposta(1, "fake", contexto, "Qual a conduta?")
+    assert chave == ai_cache.chave_resposta(1, "fake", {**contexto, "usuario": {"id": 11, "nome": "Bruno"}}, "Qual a conduta?")
+    assert chave != ai_cache.chave_resposta(1, "fake", {**contexto, "paciente": {"id": 2}}, "Qual a conduta?")
+
+
+def test_cache_memoria_ttl_e_lru(monkeypatch):
+    cache = ai_cache.CacheMemoria(ttl_seconds=60, max_itens=2)
+    agora = [1000.0]
+    monkeypatch.setattr(ai_cache.time, "monotonic", lambda: agora[0])
+
+    async def cenario():
+        await cache.guardar("a", "A")
+        await cache.guardar("b", "B")
+        assert await cache.obter("a") == "A"
+        await cache.guardar("c", "C")
+        assert await cache.obter("b") is None
+        assert await cache.obter("a") == "A"
+        agora[0] += 61
+        assert await cache.obter("c") is None
+
+    asyncio.run(cenario())
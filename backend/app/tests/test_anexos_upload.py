@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+from datetime import datetime
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from app import models
+from app.api.routes import anexos
+from app.database import Base
+from app.schemas.base import AnexoUploadDireto
+from app.services import anexo_storage, minio_service
+
+
+class _MinioFake:
+    def __init__(self):
+        self.objetos = {}
+        self.uploads = {}
+        self.abortados = []
+        self.maior_parte = 0
+
+    def iniciar_multipart(self, key, content_type):
+        self.uploads[key] = []
+        return f"up-{key}"
+
+    def enviar_parte(self, key, upload_id, numero, dados):
+        self.maior_parte = max(self.maior_parte, len(dados))
+        self.uploads[key].append(dados)
+        return {"PartNumber": numero, "ETag": str(numero)}
+
+    def concluir_multipart(self, key, upload_id, partes):
+        assert [p["PartNumber"] for p in partes] == list(range(1, len(partes) + 1))
+        self.objetos[key] = b"".join(self.uploads.pop(key))
+
+    def abortar_multipart(self, key, upload_id):
+        self.uploads.pop(key, None)
+        self.abortados.append(key)
+
+    def presign_put(self, key, content_type, expires=900):
+        return f"http://minio/{key}?assinado"
+
+    def ler_objeto(self, key, chunk_size=1024):
+        if key not in self.objetos:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        dados = self.objetos[key]
+        for inicio in range(0, len(dados), chunk_size):
+            yield dados[inicio:inicio + chunk_size]
+
+    def tamanho_objeto(self, key):
+        if key not in self.objetos:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return len(self.objetos[key])
+
+    def remover_objeto(self, key):
+        self.objetos.pop(key, None)
+
+
+@pytest.fixture
+def minio(monkeypatch):
+    fake = _MinioFake()
+    for nome in ("iniciar_multipart", "enviar_parte", "concluir_multipart", "abortar_multipart", "presign_put", "ler_objeto", "tamanho_objeto", "remover_objeto"):
+        monkeypatch.setattr(minio_service, nome, getattr(fake, nome))
+    monkeypatch.setattr(anexo_storage, "PARTE_BYTES", 1000)
+    return fake
+
+
+def _session():
+    engine = create_engine("sqlite://", future=True, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True, expire_on_commit=False)()
+    db.add(models.Tenant(id=1, name="Tenant"))
+    db.add(models.Unidade(id=1, tenant_id=1, nome="CER", cnes="1234567", cnpj="12345678000199", uf="DF", ibge_cod="5300108", destino="M", competencia_params={}))
+    db.add(models.Profissional(id=1, tenant_id=1, unidade_id=1, nome="Prof", cpf="12345678901", cns="898001160660001", cbo="225120"))
+    db.add(models.Paciente(id=1, tenant_id=1, nome="Paciente", cns="898001160660002", nome_mae="Mae", sexo="F", data_nascimento=datetime(1990, 1, 1).date(), ibge_cod="5300108", contato={}, pcd=False))
+    db.add(models.Atendimento(id=1, tenant_id=1, unidade_id=1, profissional_id=1, paciente_id=1, tipo="consulta", data=datetime(2025, 1, 1)))
+    db.add(models.Usuario(id=1, email="clinico@x", nome="Clinico", hashed_password="x"))
+    db.commit()
+    return db
+
+
+def _request(blocos):
+    mensagens = [{"type": "http.request", "body": b, "more_body": True} for b in blocos]
+    mensagens.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return mensagens.pop(0)
+
+    scope = {"type": "http", "method": "PUT", "path": "/", "headers": [(b"content-type", b"application/pdf")]}
+    return Request(scope, receive)
+
+
+def test_upload_em_stream_envia_partes_e_calcula_hash(minio):
+    db = _session()
+    blocos = [bytes([i]) * 300 for i in range(11)]  # 3300 bytes em blocos de 300
+
+    anexo = asyncio.run(
+        anexos.upload_anexo(1, _request(blocos), tipo="exame", nome_arquivo="laudo.pdf", db=db, current_user=db.get(models.Usuario, 1), current_tenant_id=1)
+    )
+
+    conteudo = b"".join(blocos)
+    assert anexo.hash == hashlib.sha256(conteudo).hexdigest()
+    assert (anexo.tamanho_bytes, anexo.status, anexo.content_type) == (3300, "disponivel", "application/pdf")
+    assert minio.objetos[anexo.storage_key] == conteudo
+    # Nunca mais que uma parte (mais um bloco) em memoria
+    assert minio.maior_parte < 1000 + 300
+
+
+def test_upload_acima_do_limite_aborta_o_multipart(minio, monkeypatch):
+    monkeypatch.setattr(anexo_storage.settings, "anexo_tamanho_maximo_mb", 0)
+    db = _session()
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(anexos.upload_anexo(1, _request([b"x" * 10]), tipo="exame", db=db, current_user=db.get(models.Usuario, 1), current_tenant_id=1))
+    assert exc.value.status_code == 413
+    assert len(minio.abortados) == 1 and not minio.objetos
+    assert db.query(models.AnexoClinico).count() == 0
+
+
+def test_upload_direto_so_fica_disponivel_com_hash_conferido(minio, monkeypatch):
+    db = _session()
+    usuario = db.get(models.Usuario, 1)
+    conteudo = b"%PDF exame" * 500
+    declarado = AnexoUploadDireto(tipo="exame", sha256=hashlib.sha256(conteudo).hexdigest(), tamanho_bytes=len(conteudo))
+
+    emitido = anexos.iniciar_upload_direto(1, declarado, db=db, current_user=usuario, current_tenant_id=1)
+    pendente = db.get(models.AnexoClinico, emitido["anexo_id"])
+    assert pendente.status == "pendente" and emitido["upload_url"].endswith("?assinado")
+
+    with pytest.raises(HTTPException) as exc:
+        anexos.confirmar_upload_direto(pendente.id, db=db, current_user=usuario, current_tenant_id=1)
+    assert exc.value.status_code == 409  # ainda nao enviado
+
+    minio.objetos[pendente.storage_key] = conteudo
+    confirmado = anexos.confirmar_upload_direto(pendente.id, db=db, current_user=usuario, current_tenant_id=1)
+    assert confirmado.status == "disponivel"
+
+    adulterado = anexos.iniciar_upload_direto(1, declarado, db=db, current_user=usuario, current_tenant_id=1)
+    key = db.get(models.AnexoClinico, adulterado["anexo_id"]).storage_key
+    minio.objetos[key] = conteudo[:-1] + b"!"
+    with pytest.raises(HTTPException) as exc:
+        anexos.confirmar_upload_direto(adulterado["anexo_id"], db=db, current_user=usuario, current_tenant_id=1)
+    assert exc.value.status_code == 422
+    assert db.get(models.AnexoClinico, adulterado["anexo_id"]).status == "rejeitado"
+    assert key not in minio.objetos
+
+    # Tamanho divergente e recusado pelo HEAD, sem ler o corpo
+    truncado = anexos.iniciar_upload_direto(1, declarado, db=db, current_user=usuario, current_tenant_id=1)
+    key = db.get(models.AnexoClinico, truncado["anexo_id"]).storage_key
+    minio.objetos[key] = conteudo[:-1]
+    monkeypatch.setattr(minio_service, "ler_objeto", lambda *args, **kwargs: pytest.fail("corpo lido"))
+    with pytest.raises(HTTPException) as exc:
+        anexos.confirmar_upload_direto(truncado["anexo_id"], db=db, current_user=usuario, current_tenant_id=1)
+    assert exc.value.status_code == 422 and "Tamanho" in exc.value.detail
+    assert db.get(models.AnexoClinico, truncado["anexo_id"]).status == "rejeitado"
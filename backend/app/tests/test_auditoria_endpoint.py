@@ -2,19 +2,21 @@ from datetime import datetime, date
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app import models
-from app.api.deps import get_db_session
+from app.api.deps import get_async_db_session, get_async_read_db_session, get_db_session, get_read_db_session
 from app.auth import get_password_hash
-from app.database import Base
+from app.database import Base, get_db as base_get_db
 from app.main import app
 
 
-def _setup_db():
-    engine = create_engine("sqlite:///:memory:", future=True, connect_args={"check_same_thread": False})
+def _setup_db(db_path):
+    engine = create_engine(f"sqlite:///{db_path}", future=True, connect_args={"check_same_thread": False})
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
     Base.metadata.create_all(bind=engine)
+    AsyncTestingSessionLocal = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
 
     def override_get_db():
         db = TestingSessionLocal()
@@ -23,7 +25,15 @@ def _setup_db():
         finally:
             db.close()
 
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_read_db_session] = override_get_db
+    app.dependency_overrides[base_get_db] = override_get_db
+    app.dependency_overrides[get_async_db_session] = override_get_async_db
+    app.dependency_overrides[get_async_read_db_session] = override_get_async_db
     return TestingSessionLocal, engine
 
 
@@ -131,11 +141,12 @@ def _seed_data(SessionLocal):
 
 
 @pytest.fixture
-def client():
-    SessionLocal, engine = _setup_db()
+def client(tmp_path):
+    SessionLocal, engine = _setup_db(tmp_path / "auditoria.db")
     tenant, _ = _seed_data(SessionLocal)
     with TestClient(app) as c:
         c.tenant = tenant
+        c.SessionLocal = SessionLocal
         yield c
     Base.metadata.drop_all(bind=engine)
     app.dependency_overrides.clear()
@@ -156,3 +167,19 @@ def test_auditoria_endpoint_summarizes_erros(client: TestClient):
     assert erros.get("dv_cns_prof_invalido") == 1
     assert data["exemplos_com_erros"]
     assert data["exemplos_com_erros"][0]["mensagens"] == ["dv_cns_prof_invalido"]
+
+
+def test_get_da_auditoria_nao_grava_e_post_grava_snapshot(client: TestClient):
+    login = client.post("/api/auth/login", json={"email": "auditor@test.com", "password": "secret", "tenant_id": 1})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    def snapshots():
+        with client.SessionLocal() as db:
+            return db.query(models.AuditoriaSnapshot).count()
+
+    assert client.get("/api/audit/competencia/202501?incremental=true", headers=headers).status_code == 200
+    assert snapshots() == 0
+    res = client.post("/api/audit/competencia/202501?incremental=true", headers=headers)
+    assert res.status_code == 200 and res.json()["incremental"] is False
+    assert snapshots() == 1
+    assert client.get("/api/audit/competencia/202501?incremental=true", headers=headers).json()["incremental"] is True
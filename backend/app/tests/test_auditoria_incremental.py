@@ -0,0 +1,183 @@
+from datetime import datetime, date
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.api.routes.core import audit_competencia_for_tenant
+from app.database import Base
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, future=True, expire_on_commit=False)()
+
+
+def _seed(db):
+    tenant = models.Tenant(id=1, name="Tenant 1")
+    unidade = models.Unidade(id=1, tenant_id=1, nome="Unidade", cnes="1234567", cnpj="12345678000199", uf="DF", ibge_cod="5300108", destino="M", competencia_params={})
+    prof = models.Profissional(id=1, tenant_id=1, unidade_id=1, nome="Prof", cpf="12345678901", cns="898001160660001", cbo="225120", conselho="CRM")
+    pac = models.Paciente(id=1, tenant_id=1, nome="Paciente", cpf="12345678901", cns="898001160660002", nome_social=None, nome_mae="Mae", sexo="M", data_nascimento=date(1990, 1, 1), ibge_cod="5300108", contato={}, pcd=False, cid_deficiencia=None)
+    at = models.Atendimento(id=1, tenant_id=1, unidade_id=1, profissional_id=1, paciente_id=1, tipo="consulta", data=datetime(2025, 1, 1, 10, 0), status="concluido")
+    tab = models.TabelaSIGTAP(codigo="0301010030", descricao="Consulta", valor=10.0, regras={}, vigencia="202501", exige_cid=False, exige_apac=False, doc_paciente="CNS", sexo_permitido="M", idade_min=None, idade_max=None, vigencia_inicio="202501", vigencia_fim=None)
+    procs = [
+        models.ProcedimentoSUS(id=i, tenant_id=1, atendimento_id=1, sigtap_codigo="0301010030", cid10="F329", quantidade=1, profissional_cbo="225120", valores={}, competencia_aaaamm="202501", validacoes_json={})
+        for i in (1, 2)
+    ]
+    db.add_all([tenant, unidade, prof, pac, at, tab, *procs])
+    db.commit()
+    return pac
+
+
+def _pendentes(db):
+    return {p.procedimento_id for p in db.scalars(select(models.AuditoriaPendencia)).all()}
+
+
+def test_escritas_marcam_procedimentos_afetados():
+    db = _session()
+    pac = _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+    assert _pendentes(db) == set()
+
+    pac.sexo = "F"
+    db.commit()
+    assert _pendentes(db) == {1, 2}
+
+
+def test_auditoria_incremental_revalida_apenas_pendentes():
+    db = _session()
+    pac = _seed(db)
+    completo = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert completo["incremental"] is False
+    assert completo["revalidados"] == 2
+
+    sem_mudanca = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert sem_mudanca["incremental"] is True
+    assert sem_mudanca["revalidados"] == 0
+    assert sem_mudanca["erros"] == completo["erros"]
+
+    proc = db.get(models.ProcedimentoSUS, 2)
+    proc.quantidade = 3
+    db.commit()
+    parcial = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert parcial["revalidados"] == 1
+
+    pac.sexo = "F"
+    db.commit()
+    apos_paciente = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert apos_paciente["revalidados"] == 2
+    assert all("sexo_incompativel" in item["erros"] for item in apos_paciente["erros"])
+    assert apos_paciente["erros"] == audit_competencia_for_tenant("202501", 1, db)["erros"]
+
+
+def test_procedimento_removido_sai_do_snapshot():
+    db = _session()
+    _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+    db.delete(db.get(models.ProcedimentoSUS, 1))
+    db.commit()
+    res = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert [item["procedimento_id"] for item in res["erros"]] == [2]
+
+
+def test_alteracao_sigtap_invalida_snapshot():
+    db = _session()
+    _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+    tabela = db.scalars(select(models.TabelaSIGTAP)).first()
+    tabela.idade_min = 50
+    db.commit()
+    res = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert res["incremental"] is False
+    assert all("idade_inferior_limite" in item["erros"] for item in res["erros"])
+
+
+def test_remarcacao_atualiza_a_mesma_pendencia():
+    db = _session()
+    pac = _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+
+    for sexo in ("F", "M", "F"):
+        pac.sexo = sexo
+        db.commit()
+    proc = db.get(models.ProcedimentoSUS, 1)
+    proc.quantidade = 2
+    db.commit()
+
+    pendencias = db.scalars(select(models.AuditoriaPendencia)).all()
+    assert sorted(p.procedimento_id for p in pendencias) == [1, 2]
+
+
+def test_consulta_sem_persistir_nao_grava_snapshot():
+    db = _session()
+    _seed(db)
+    audit_competencia_for_tenant("202501", 1, db, persistir=False)
+    assert db.scalars(select(models.AuditoriaSnapshot)).first() is None
+    assert _pendentes(db) == {1, 2}
+
+
+def test_abertura_de_competencia_invalida_apenas_tenants_do_cnes():
+    db = _session()
+    _seed(db)
+    db.add_all(
+        [
+            models.Tenant(id=2, name="Tenant 2"),
+            models.Unidade(id=2, tenant_id=2, nome="Outra", cnes="7654321", cnpj="98765432000199", uf="DF", ibge_cod="5300108", destino="M", competencia_params={}),
+        ]
+    )
+    db.commit()
+    for tenant_id in (1, 2):
+        db.add(models.AuditoriaSnapshot(tenant_id=tenant_id, competencia="202501", resultado_json={}))
+    db.commit()
+
+    db.add(models.CompetenciaAberta(unidade_cnes="7654321", competencia="202501"))
+    db.commit()
+
+    restantes = {s.tenant_id for s in db.scalars(select(models.AuditoriaSnapshot)).all()}
+    assert restantes == {1}
+
+
+def test_marcacao_gravada_durante_a_auditoria_nao_e_consumida(monkeypatch):
+    from app.services import auditoria_incremental
+
+    db = _session()
+    _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+    proc = db.get(models.ProcedimentoSUS, 1)
+    proc.quantidade = 2
+    db.commit()
+    lidas = auditoria_incremental.pendencias
+
+    def pendencias_com_escrita_concorrente(db, tenant_id, competencia):
+        resultado = lidas(db, tenant_id, competencia)
+        # Outra transacao comita uma marcacao carimbada antes da ultima lida
+        db.execute(
+            insert(models.AuditoriaPendencia).values(
+                tenant_id=1, procedimento_id=2, competencia="202501", marcado_em=datetime(2000, 1, 1)
+            )
+        )
+        return resultado
+
+    monkeypatch.setattr(auditoria_incremental, "pendencias", pendencias_com_escrita_concorrente)
+    res = audit_competencia_for_tenant("202501", 1, db, incremental=True)
+    assert res["revalidados"] == 1
+    assert _pendentes(db) == {2}
+
+
+def test_remarcacao_sem_upsert_nativo_atualiza_a_pendencia(monkeypatch):
+    from app.services import auditoria_incremental
+
+    monkeypatch.setattr(auditoria_incremental, "_UPSERTS", {})
+    db = _session()
+    pac = _seed(db)
+    audit_competencia_for_tenant("202501", 1, db)
+
+    for sexo in ("F", "M"):
+        pac.sexo = sexo
+        db.commit()
+    proc = db.get(models.ProcedimentoSUS, 1)
+    proc.quantidade = 2
+    db.commit()
+
+    assert sorted(p.procedimento_id for p in db.scalars(select(models.AuditoriaPendencia)).all()) == [1, 2]
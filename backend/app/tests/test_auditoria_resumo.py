@@ -0,0 +1,88 @@
+import asyncio
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, select, true
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import Base
+from app.services import auditoria_resumo
+
+
+def _seed(caminho) -> None:
+    engine = create_engine(f"sqlite:///{caminho}")
+    Base.metadata.create_all(engine)
+    validacoes = [
+        {"ok": True, "erros": [], "avisos": []},
+        {"ok": False, "erros": ["cns_invalido", "cid_incompativel"]},
+        {"ok": False, "erros": ["cns_invalido"]},
+        {"ok": False, "erros": []},
+        {"ok": False},
+        None,
+        {},
+        {"ok": False, "erros": ["idade_incompativel", "cns_invalido"]},
+        {"ok": False, "erros": ["cid_incompativel"]},
+    ]
+    with Session(engine) as db:
+        db.add(models.Tenant(id=1, name="T1"))
+        db.add(models.Tenant(id=2, name="T2"))
+        db.add(models.Unidade(id=1, tenant_id=1, nome="U", cnes="1234567", cnpj="12345678000199", uf="DF", ibge_cod="5300108"))
+        db.add(models.Profissional(id=1, tenant_id=1, unidade_id=1, nome="P", cpf="12345678901", cns="123456789012345", cbo="225120"))
+        db.add(models.Paciente(id=1, tenant_id=1, nome="Maria", sexo="F", data_nascimento=date(1980, 1, 1), ibge_cod="5300108", contato={}, pcd=False))
+        db.add(models.Atendimento(id=1, tenant_id=1, unidade_id=1, profissional_id=1, paciente_id=1, tipo="consulta", data=datetime(2025, 1, 10), status="concluido"))
+        for i, v in enumerate(validacoes, start=1):
+            db.add(models.ProcedimentoSUS(id=i, tenant_id=1, atendimento_id=1, sigtap_codigo="0301010030", cid10="F329", quantidade=1, profissional_cbo="225120", valores={}, competencia_aaaamm="202501", validacoes_json=v))
+        db.add(models.ProcedimentoSUS(id=100, tenant_id=2, atendimento_id=1, sigtap_codigo="0301010030", cid10="F329", quantidade=1, profissional_cbo="225120", valores={}, competencia_aaaamm="202501", validacoes_json={"ok": False, "erros": ["outro_tenant"]}))
+        db.commit()
+
+
+def _resumir(caminho, fallback: bool) -> dict:
+    async def cenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{caminho}")
+        try:
+            async with async_sessionmaker(engine)() as db:
+                if fallback:
+                    return await auditoria_resumo._resumo_fallback(db, models.ProcedimentoSUS.tenant_id == 1)
+                return await auditoria_resumo.resumir_competencia(db, 1, "202501")
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(cenario())
+
+
+def test_resumo_agrega_no_banco_igual_ao_fallback(tmp_path, query_budget):
+    caminho = tmp_path / "resumo.db"
+    _seed(caminho)
+
+    with query_budget(3):
+        resumo = _resumir(caminho, fallback=False)
+
+    assert resumo["total_procedimentos"] == 9
+    assert resumo["total_com_erros"] == 6
+    assert resumo["erros_agrupados"] == [
+        {"tipo": "cns_invalido", "quantidade": 3},
+        {"tipo": "cid_incompativel", "quantidade": 2},
+        {"tipo": "validacao_falhou_sem_erros", "quantidade": 2},
+        {"tipo": "idade_incompativel", "quantidade": 1},
+    ]
+    assert [e["id"] for e in resumo["exemplos_com_erros"]] == [2, 3, 4, 5, 8]
+    assert resumo["exemplos_com_erros"][0] == {
+        "id": 2,
+        "paciente": "Maria",
+        "procedimento": "0301010030",
+        "mensagens": ["cns_invalido", "cid_incompativel"],
+    }
+    assert resumo["exemplos_com_erros"][2]["mensagens"] == ["validacao_falhou_sem_erros"]
+
+    assert _resumir(caminho, fallback=True) == resumo
+
+
+def test_expressoes_postgres_desaninham_jsonb():
+    elementos, com_erros, _ = auditoria_resumo._expressoes("postgresql")
+    stmt = select(elementos.c.value).select_from(models.ProcedimentoSUS).join(elementos, true()).where(com_erros)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "jsonb_array_elements_text" in sql
+    assert "jsonb_typeof" in sql
+    assert "jsonb_array_length" in sql
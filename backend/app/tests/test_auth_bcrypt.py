@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import auth, models
+from app.api.deps import get_db_session
+from app.database import Base
+from app.database import get_db as base_get_db
+from app.main import app
+from app.models import entities  # noqa: F401
+
+
+@pytest.fixture
+def sessao():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    Base.metadata.create_all(bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[base_get_db] = override_get_db
+    yield SessionLocal
+    app.dependency_overrides.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+def _criar_usuario(SessionLocal, hashed_password: str) -> int:
+    with SessionLocal() as db:
+        tenant = models.Tenant(name="Tenant Bcrypt")
+        db.add(tenant)
+        db.commit()
+        user = models.Usuario(email="login@test.com", nome="Login", hashed_password=hashed_password, ativo=True)
+        db.add(user)
+        db.commit()
+        db.add(models.TenantUserRole(user_id=user.id, tenant_id=tenant.id, role=models.Role.RECEPCAO.value, ativo=True))
+        db.commit()
+        return tenant.id
+
+
+def test_login_regrava_hash_com_custo_antigo(sessao, monkeypatch):
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5))
+    hash_antigo = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    tenant_id = _criar_usuario(sessao, hash_antigo)
+
+    with TestClient(app) as client:
+        resp = client.post("/api/auth/login", json={"email": "login@test.com", "password": "secret", "tenant_id": tenant_id})
+        assert resp.status_code == 200
+
+        with sessao() as db:
+            novo_hash = db.query(models.Usuario).filter_by(email="login@test.com").one().hashed_password
+        assert novo_hash != hash_antigo
+        assert "$05$" in novo_hash
+        assert not auth.pwd_context.needs_update(novo_hash)
+
+        # Hash ja atualizado nao e regravado de novo
+        assert client.post("/api/auth/login", json={"email": "login@test.com", "password": "secret", "tenant_id": tenant_id}).status_code == 200
+        with sessao() as db:
+            assert db.query(models.Usuario).filter_by(email="login@test.com").one().hashed_password == novo_hash
+
+        resp = client.post("/api/auth/login", json={"email": "login@test.com", "password": "errada", "tenant_id": tenant_id})
+        assert resp.status_code == 401
+
+
+def test_login_recusa_com_fila_do_bcrypt_cheia(sessao, monkeypatch):
+    tenant_id = _criar_usuario(sessao, CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret"))
+    monkeypatch.setattr(auth, "_bcrypt_vagas", threading.Semaphore(0))
+
+    with TestClient(app) as client:
+        resp = client.post("/api/auth/login", json={"email": "login@test.com", "password": "secret", "tenant_id": tenant_id})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_hash_sincrono_de_scripts_nao_passa_pelo_executor(monkeypatch):
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    monkeypatch.setattr(auth, "_bcrypt_vagas", threading.Semaphore(0))
+    assert auth.pwd_context.verify("secret", auth.get_password_hash("secret"))
@@ -3,6 +3,7 @@ import pyotp
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app import models
 from app.api.deps import get_db_session
@@ -12,8 +13,13 @@ from app.main import app
 
 
 def _setup_db():
-    engine = create_engine("sqlite:///:memory:", future=True, connect_args={"check_same_thread": False})
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+    engine = create_engine(
+        "sqlite:///:memory:",
+        future=True,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine, future=True)
     Base.metadata.create_all(bind=engine)
 
     def override_get_db():
@@ -0,0 +1,92 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import database
+from app.core.config import settings
+
+
+def test_engine_postgres_usa_configuracao_do_pool(monkeypatch):
+    monkeypatch.setattr(settings, "db_pool_size", 3)
+    monkeypatch.setattr(settings, "db_max_overflow", 2)
+    monkeypatch.setattr(settings, "db_statement_timeout_ms", 15000)
+    kwargs = database._engine_kwargs("postgresql+psycopg2://u:p@db:5432/nexus")
+    assert kwargs["poolclass"] is database.QueuePoolMedido
+    assert kwargs["pool_size"] == 3
+    assert kwargs["max_overflow"] == 2
+    assert kwargs["pool_pre_ping"] is True
+    assert kwargs["connect_args"] == {"options": "-c statement_timeout=15000"}
+    assert "poolclass" not in database._engine_kwargs("sqlite:///:memory:")
+
+
+def test_pool_mede_espera_e_conta_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=database.QueuePoolMedido,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    antes_espera = REGISTRY.get_sample_value("nexusclin_db_pool_espera_segundos_count") or 0
+    antes_timeouts = REGISTRY.get_sample_value("nexusclin_db_pool_timeouts_total") or 0
+    conn = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    conn.close()
+    assert REGISTRY.get_sample_value("nexusclin_db_pool_espera_segundos_count") == antes_espera + 2
+    assert REGISTRY.get_sample_value("nexusclin_db_pool_timeouts_total") == antes_timeouts + 1
+
+
+def test_url_async_troca_apenas_o_driver():
+    assert database.url_async("postgresql+psycopg2://u:p@db:5432/nexus") == "postgresql+asyncpg://u:p@db:5432/nexus"
+    assert database.url_async("sqlite:///./dev.db") == "sqlite+aiosqlite:///./dev.db"
+    assert database.url_async("sqlite+aiosqlite:///./dev.db") == "sqlite+aiosqlite:///./dev.db"
+
+
+def test_engine_async_postgres_usa_pool_medido():
+    engine = database.criar_engine_async("postgresql+psycopg2://u:p@db:5432/nexus", "async_teste")
+    assert isinstance(engine.sync_engine.pool, database.AsyncQueuePoolMedido)
+    assert REGISTRY.get_sample_value("nexusclin_db_pool_conexoes", {"pool": "async_teste", "estado": "ociosas"}) == 0
+
+
+def test_modo_multiprocesso_grava_estado_a_cada_checkout(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=database.QueuePoolMedido, pool_size=2)
+    database._expor_pool(engine, "mp_teste")
+
+    def amostra(estado):
+        return REGISTRY.get_sample_value("nexusclin_db_pool_conexoes", {"pool": "mp_teste", "estado": estado})
+
+    conn = engine.connect()
+    assert (amostra("em_uso"), amostra("ociosas")) == (1, 0)
+    conn.close()
+    assert (amostra("em_uso"), amostra("ociosas")) == (0, 1)
+    engine.dispose()
+    with engine.connect():
+        assert amostra("em_uso") == 1
+
+
+def test_fork_descarta_o_pool_herdado_de_todas_as_engines(monkeypatch):
+    descartadas = []
+
+    class _Engine:
+        def __init__(self, nome):
+            self.nome = nome
+            self.sync_engine = self
+
+        def dispose(self, close=True):
+            descartadas.append((self.nome, close))
+
+    monkeypatch.setattr(database, "engine", _Engine("primario"))
+    monkeypatch.setattr(database, "replica_engine", _Engine("replica"))
+    monkeypatch.setattr(database, "_engines_async", [_Engine("async"), _Engine("async_replica")])
+
+    database.reiniciar_pool_apos_fork()
+    assert descartadas == [("primario", False), ("replica", False), ("async", False), ("async_replica", False)]
+
+    monkeypatch.setattr(database, "replica_engine", None)
+    monkeypatch.setattr(database, "_engines_async", [])
+    descartadas.clear()
+    database.reiniciar_pool_apos_fork()
+    assert descartadas == [("primario", False)]
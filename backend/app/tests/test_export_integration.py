@@ -1,20 +1,24 @@
 from datetime import datetime, date
 
 import pytest
-from sqlalchemy import create_engine
+from fastapi import HTTPException
+from sqlalchemy import create_engine, select, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app import models
 import app.api.routes.exports as exports
 from app.database import Base
-from app.services import minio_service
+from app.services import export_storage, minio_service
 
 
 @pytest.fixture(autouse=True)
-def _patch_minio(monkeypatch):
+def _patch_minio(monkeypatch, tmp_path):
     monkeypatch.setattr(minio_service, "upload_bytes", lambda *args, **kwargs: None)
+    monkeypatch.setattr(minio_service, "upload_file", lambda key, *args, **kwargs: key)
     monkeypatch.setattr(minio_service, "presign_get", lambda *args, **kwargs: None)
+    monkeypatch.setattr(minio_service, "object_exists", lambda *args, **kwargs: False)
+    monkeypatch.setattr(export_storage, "EXPORTS_DIR", tmp_path / "exports")
 
 
 def _make_session():
@@ -147,3 +151,120 @@ def test_generate_apac_from_real_data(tmp_path, monkeypatch):
     assert linhas[1][266:281] == "898001160660006"  # CNS paciente
     assert path.endswith(".rem")
     db.close()
+
+
+def test_exportacao_apac_mantem_o_numero_fixo_da_remessa(monkeypatch):
+    TestingSessionLocal = _make_session()
+    tenant = _seed_minimal(TestingSessionLocal, exige_apac=True)
+    db = TestingSessionLocal()
+    db.execute(update(models.ProcedimentoSUS).values(id=42))
+    db.commit()
+    monkeypatch.setattr(exports.ContextoCompetencia, "auditar", lambda self, item: [])
+
+    artefato = exports.auditar_e_gerar("apac", "202501", tenant.id, db)
+    corpo = artefato.conteudo.splitlines()[1]
+    assert exports.NUMERO_APAC_EXPORTACAO in corpo and "0000000000042" not in corpo
+    # Fora da rota de exportacao, o numero continua vindo do procedimento
+    assert "0000000000042" in exports._gerar_artefato_apac("202501", tenant.id, db).ler_conteudo().splitlines()[1]
+    db.close()
+
+
+def test_export_reuses_artifact_for_identical_inputs():
+    TestingSessionLocal = _make_session()
+    tenant = _seed_minimal(TestingSessionLocal, exige_apac=False)
+    db = TestingSessionLocal()
+    primeiro = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    assert primeiro.cache is False
+    assert len(primeiro.arquivo_hash) == 64
+    unidade = db.scalars(select(models.Unidade)).first()
+    exp = exports.registrar_exportacao(db, "bpa", tenant.id, "202501", unidade.id, primeiro)
+    assert exp.checksum == primeiro.arquivo_hash
+    assert exp.entrada_hash == primeiro.entrada_hash
+    assert exp.tamanho_bytes == len(primeiro.conteudo)
+    assert 0 < exp.tamanho_comprimido < exp.tamanho_bytes
+    assert export_storage.caminho_gzip(primeiro.arquivo_local).is_file()
+
+    segundo = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    assert segundo.cache is True
+    assert segundo.ler_conteudo() == primeiro.conteudo
+    assert segundo.tamanho_comprimido == exp.tamanho_comprimido
+    assert exports.registrar_exportacao(db, "bpa", tenant.id, "202501", unidade.id, segundo).id == exp.id
+
+    proc = db.scalars(select(models.ProcedimentoSUS)).first()
+    proc.quantidade = 2
+    db.commit()
+    terceiro = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    assert terceiro.cache is False
+    assert terceiro.entrada_hash != primeiro.entrada_hash
+    db.close()
+
+
+def test_reaproveita_objeto_do_minio_quando_o_arquivo_local_sumiu(monkeypatch):
+    objetos = {}
+
+    def upload_file(key, path, **kwargs):
+        objetos[key] = path.read_bytes()
+        return key
+
+    monkeypatch.setattr(minio_service, "upload_file", upload_file)
+    monkeypatch.setattr(minio_service, "object_exists", lambda key: key in objetos)
+    monkeypatch.setattr(minio_service, "ler_objeto", lambda key, chunk_size: iter([objetos[key][:50], objetos[key][50:]]))
+    monkeypatch.setattr(export_storage.settings, "export_compressao", "gzip")
+    TestingSessionLocal = _make_session()
+    tenant = _seed_minimal(TestingSessionLocal, exige_apac=False)
+    db = TestingSessionLocal()
+    primeiro = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    unidade = db.scalars(select(models.Unidade)).first()
+    exports.registrar_exportacao(db, "bpa", tenant.id, "202501", unidade.id, primeiro)
+
+    # Outra replica: nada do diretorio local de exportacoes
+    for arquivo in primeiro.arquivo_local.parent.iterdir():
+        arquivo.unlink()
+    segundo = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    assert segundo.cache is True
+    assert segundo.ler_conteudo() == primeiro.conteudo
+
+    # Objeto adulterado nao e aceito: gera de novo
+    segundo.arquivo_local.unlink()
+    chave = next(iter(objetos))
+    objetos[chave] = b"lixo"
+    assert exports._gerar_artefato_bpa("202501", tenant.id, db).cache is False
+    db.close()
+
+
+def test_url_usa_chave_gravada_mesmo_apos_mudar_compressao(monkeypatch):
+    monkeypatch.setattr(minio_service, "presign_get", lambda key, *args, **kwargs: f"https://minio/{key}")
+    monkeypatch.setattr(export_storage.settings, "export_compressao", "gzip")
+    TestingSessionLocal = _make_session()
+    tenant = _seed_minimal(TestingSessionLocal, exige_apac=False)
+    db = TestingSessionLocal()
+    artefato = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    unidade = db.scalars(select(models.Unidade)).first()
+    exp = exports.registrar_exportacao(db, "bpa", tenant.id, "202501", unidade.id, artefato)
+    assert exp.storage_key.endswith(".rem.gz")
+
+    monkeypatch.setattr(export_storage.settings, "export_compressao", "none")
+    reaproveitado = exports._gerar_artefato_bpa("202501", tenant.id, db)
+    assert reaproveitado.cache is True
+    assert reaproveitado.path == f"https://minio/{exp.storage_key}"
+    db.close()
+
+
+def test_auditar_e_gerar_aborta_com_erros_da_auditoria():
+    TestingSessionLocal = _make_session()
+    tenant = _seed_minimal(TestingSessionLocal, exige_apac=False)
+    db = TestingSessionLocal()
+    with pytest.raises(HTTPException) as exc:
+        exports.auditar_e_gerar("bpa", "202501", tenant.id, db)
+    assert exc.value.status_code == 400
+    assert "competencia_fechada" in exc.value.detail["erros"]
+
+    db.add(models.CompetenciaAberta(unidade_cnes="1234560", competencia="202501", aberta=True))
+    db.scalars(select(models.Profissional)).first().cns = "123456789010010"
+    db.commit()
+    artefato = exports.auditar_e_gerar("bpa", "202501", tenant.id, db)
+    assert artefato.conteudo.splitlines()[1].startswith("1234560")
+    # A exportacao so le a auditoria: snapshot e pendencias ficam para a rota de auditoria
+    assert db.scalars(select(models.AuditoriaSnapshot)).first() is None
+    assert db.scalars(select(models.AuditoriaPendencia)).first() is not None
+    db.close()
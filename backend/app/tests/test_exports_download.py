@@ -1,7 +1,17 @@
 import asyncio
-from fastapi.responses import StreamingResponse
+import gzip
+import zipfile
 
-from app.api.routes.core import _build_download_response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.requests import Request
+
+from app.api.routes.exports import servir_arquivo
+from app.services import export_storage
+
+
+def _request(headers: dict | None = None) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
 
 
 async def _collect(resp: StreamingResponse) -> bytes:
@@ -11,11 +21,65 @@ async def _collect(resp: StreamingResponse) -> bytes:
     return b"".join(chunks)
 
 
-def test_download_response_headers_and_body():
-    conteudo = "HEADER\r\nBODY\r\n"
-    resp: StreamingResponse = _build_download_response(conteudo, "arquivo_test.rem")
-    body = asyncio.run(_collect(resp))
-    assert resp.headers["Content-Disposition"].endswith("arquivo_test.rem\"")
+def test_download_serves_file_from_disk(tmp_path):
+    path = tmp_path / "arquivo.rem"
+    path.write_bytes(b"HEADER\r\nBODY\r\n")
+    resp = servir_arquivo(_request(), path, "arquivo_test.rem")
+    assert isinstance(resp, FileResponse)
+    assert resp.headers["content-disposition"].endswith("arquivo_test.rem\"")
+    assert resp.headers["accept-ranges"] == "bytes"
     assert resp.media_type.startswith("text/plain")
-    assert body.endswith(b"\r\n")
-    assert len(body) > 0
+
+
+def test_download_range_returns_partial_content(tmp_path):
+    path = tmp_path / "arquivo.rem"
+    path.write_bytes(b"HEADER\r\nBODY\r\n")
+    resp = servir_arquivo(_request({"Range": "bytes=8-11"}), path, "arquivo_test.rem")
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == "bytes 8-11/14"
+    assert asyncio.run(_collect(resp)) == b"BODY"
+
+    sufixo = servir_arquivo(_request({"Range": "bytes=-2"}), path, "arquivo_test.rem")
+    assert asyncio.run(_collect(sufixo)) == b"\r\n"
+
+
+def test_download_range_unsatisfiable(tmp_path):
+    path = tmp_path / "arquivo.rem"
+    path.write_bytes(b"HEADER\r\n")
+    resp = servir_arquivo(_request({"Range": "bytes=100-"}), path, "arquivo_test.rem")
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == "bytes */8"
+
+    vazio = tmp_path / "vazio.rem"
+    vazio.write_bytes(b"")
+    for faixa in ("bytes=0-", "bytes=-5", "bytes=0-0"):
+        resp = servir_arquivo(_request({"Range": faixa}), vazio, "vazio.rem")
+        assert resp.status_code == 416, faixa
+        assert resp.headers["content-range"] == "bytes */0"
+
+
+def test_download_negocia_gzip_pre_comprimido(tmp_path):
+    path = tmp_path / "arquivo.rem"
+    path.write_bytes(b"HEADER\r\nBODY\r\n")
+    (tmp_path / "arquivo.rem.gz").write_bytes(gzip.compress(b"HEADER\r\nBODY\r\n"))
+    resp = servir_arquivo(_request({"Accept-Encoding": "br, gzip"}), path, "arquivo_test.rem")
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert resp.headers["content-disposition"].endswith("arquivo_test.rem\"")
+
+    com_range = servir_arquivo(_request({"Accept-Encoding": "gzip", "Range": "bytes=0-5"}), path, "arquivo_test.rem")
+    assert "content-encoding" not in com_range.headers
+    recusado = servir_arquivo(_request({"Accept-Encoding": "gzip;q=0"}), path, "arquivo_test.rem")
+    assert "content-encoding" not in recusado.headers
+
+
+def test_empacotar_zip_reaproveita_pacote(tmp_path):
+    path = tmp_path / "abc.rem"
+    path.write_bytes(b"HEADER\r\nBODY\r\n")
+    zip_path = export_storage.empacotar_zip(path, "BPA_202501.rem")
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == ["BPA_202501.rem"]
+        assert zf.read("BPA_202501.rem") == b"HEADER\r\nBODY\r\n"
+    mtime = zip_path.stat().st_mtime_ns
+    assert export_storage.empacotar_zip(path, "BPA_202501.rem") == zip_path
+    assert zip_path.stat().st_mtime_ns == mtime
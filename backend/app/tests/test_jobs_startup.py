@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+from app.core.config import settings
+from app.jobs import startup
+
+
+def test_jobs_iniciais_disparam_uma_vez_por_janela(monkeypatch):
+    monkeypatch.setattr(settings, "sigtap_job_enabled", True)
+    monkeypatch.setattr(settings, "cmd_job_enabled", True)
+    disparos = []
+    monkeypatch.setattr(startup.sigtap_job, "schedule", lambda: disparos.append("sigtap"))
+    monkeypatch.setattr(startup.cmd_job, "schedule", lambda: disparos.append("cmd"))
+    locks = iter([True, False])
+    monkeypatch.setattr(startup, "_adquirir_lock", lambda: next(locks))
+
+    assert startup.disparar_jobs_iniciais() is True
+    assert startup.disparar_jobs_iniciais() is False
+    assert disparos == ["sigtap", "cmd"]
+
+
+def test_falha_no_broker_nao_propaga(monkeypatch):
+    monkeypatch.setattr(settings, "sigtap_job_enabled", True)
+
+    def _redis_fora():
+        raise ConnectionError("redis indisponivel")
+
+    monkeypatch.setattr(startup, "_adquirir_lock", _redis_fora)
+    assert startup.disparar_jobs_iniciais() is False
+
+
+def test_import_da_api_nao_carrega_dependencias_pesadas():
+    codigo = "import sys, app.main; print(sorted(m for m in ('boto3', 'celery') if m in sys.modules))"
+    saida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    assert saida.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,68 @@
+import io
+import zipfile
+
+from prometheus_client import REGISTRY
+
+from app.services.cmd_client import CmdSoapClient
+from app.services.sigtap_delta import RelatorioDelta
+from app.services.sigtap_sync import SIGTAPSyncService
+
+
+def _valor(nome: str, **labels) -> float:
+    return REGISTRY.get_sample_value(nome, labels) or 0.0
+
+
+class _RepoFake:
+    def __init__(self):
+        self.codigos = set()
+
+    def aplicar(self, registros, competencia, relacoes=None):
+        relatorio = RelatorioDelta(competencia)
+        for item in registros:
+            if item["codigo"] in self.codigos:
+                relatorio.inalterados += 1
+            else:
+                self.codigos.add(item["codigo"])
+                relatorio.novos.append(item["codigo"])
+        return relatorio
+
+    def total_registros(self):
+        return len(self.codigos)
+
+    def publicar_snapshot(self):
+        pass
+
+
+def _zip_sigtap() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr(
+            "tb_procedimento.csv",
+            "CO_PROCEDIMENTO;NO_PROCEDIMENTO;VL_SA\n0301010030;CONSULTA;10,00\n0301010030;CONSULTA;10,00\n",
+        )
+    return buffer.getvalue()
+
+
+def test_sigtap_sync_registra_fases_e_registros():
+    antes_download = _valor("nexusclin_sigtap_fase_segundos_count", fase="download")
+    antes_novos = _valor("nexusclin_sigtap_registros_total", resultado="novo")
+    antes_inalterados = _valor("nexusclin_sigtap_registros_total", resultado="inalterado")
+
+    SIGTAPSyncService(_RepoFake(), fetcher=lambda competencia: _zip_sigtap()).sync("202501")
+
+    assert _valor("nexusclin_sigtap_fase_segundos_count", fase="download") == antes_download + 1
+    assert _valor("nexusclin_sigtap_fase_segundos_count", fase="insert") >= 1
+    assert _valor("nexusclin_sigtap_registros_total", resultado="novo") == antes_novos + 1
+    assert _valor("nexusclin_sigtap_registros_total", resultado="inalterado") == antes_inalterados + 1
+
+
+def test_cmd_soap_latencia_por_operacao_e_resultado():
+    class _Resposta:
+        status_code = 500
+        text = "<Envelope><codigoRetorno>99</codigoRetorno></Envelope>"
+
+    client = CmdSoapClient("http://cmd", "u", "s", "cpf", "senha")
+    client._post = lambda envelope: _Resposta()
+    antes = _valor("nexusclin_cmd_soap_segundos_count", operacao="detalhar", resultado="erro_http")
+    client.detalhar_contato("uuid")
+    assert _valor("nexusclin_cmd_soap_segundos_count", operacao="detalhar", resultado="erro_http") == antes + 1
@@ -0,0 +1,42 @@
+import logging
+
+from sqlalchemy import select
+
+from app import models
+from app.core import query_stats
+from app.core.config import settings
+from app.services.export_pipeline import ContextoCompetencia
+from app.tests.test_auditoria_incremental import _seed, _session
+
+
+def test_contexto_competencia_tem_numero_fixo_de_consultas(query_budget):
+    db = _session()
+    _seed(db)
+    db.add_all(
+        models.ProcedimentoSUS(id=i, tenant_id=1, atendimento_id=1, sigtap_codigo="0301010030", cid10="F329", quantidade=1, profissional_cbo="225120", valores={}, competencia_aaaamm="202501", validacoes_json={})
+        for i in range(3, 30)
+    )
+    db.commit()
+    with query_budget(8) as consultas:
+        contexto = ContextoCompetencia.carregar(db, 1, "202501")
+    assert len(contexto.itens) == 29
+    assert consultas.total > 0
+
+
+def test_detecta_mesmo_statement_repetido(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "sql_n_mais_um_limite", 5)
+    db = _session()
+    _seed(db)
+    with query_stats.medir_consultas() as consultas:
+        for proc_id in range(6):
+            db.execute(select(models.ProcedimentoSUS).where(models.ProcedimentoSUS.id == proc_id)).all()
+    assert consultas.repetidas(5)[0][1] == 6
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        query_stats.verificar_n_mais_um(consultas, "teste")
+    assert any(r.message == "possivel_n_mais_1" and r.vezes == 6 for r in caplog.records)
+
+
+def test_fora_de_medicao_nada_e_contado():
+    db = _session()
+    db.execute(select(models.Tenant)).all()
+    assert query_stats.atual() is None
@@ -7,7 +7,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app import models
-from app.api.deps import get_db_session
+from app.api.deps import get_db_session, get_read_db_session
 from app.auth import create_access_token
 from app.database import Base
 from app.main import app
@@ -37,6 +37,7 @@ def _setup_db():
             db.close()
 
     app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_read_db_session] = override_get_db
     return TestingSessionLocal, engine
 
 
@@ -0,0 +1,74 @@
+import asyncio
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models
+from app.database import Base, RoutingSession
+
+
+def _bancos(tmp_path):
+    engines = {}
+    for nome in ("primario", "replica"):
+        engine = create_engine(f"sqlite:///{tmp_path / nome}.db", future=True)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(models.Tenant.__table__.insert().values(id=1, name=nome))
+        engines[nome] = engine
+    return engines["primario"], engines["replica"]
+
+
+def _nome_tenant(db) -> str:
+    return db.scalar(select(models.Tenant.name).where(models.Tenant.id == 1))
+
+
+def test_leitura_vai_para_replica_ate_a_primeira_escrita(tmp_path):
+    primario, replica = _bancos(tmp_path)
+    Sessao = sessionmaker(bind=primario, class_=RoutingSession, future=True)
+
+    db = Sessao(info={"replica_bind": replica})
+    assert _nome_tenant(db) == "replica"
+    db.add(models.Tenant(id=2, name="novo"))
+    db.flush()
+    assert _nome_tenant(db) == "primario"
+    db.commit()
+    db.close()
+
+    sem_replica = Sessao()
+    assert _nome_tenant(sem_replica) == "primario"
+    sem_replica.close()
+
+
+def test_escrita_na_requisicao_vale_para_outras_sessoes(tmp_path):
+    primario, replica = _bancos(tmp_path)
+    Sessao = sessionmaker(bind=primario, class_=RoutingSession, future=True)
+    token = database.iniciar_requisicao()
+    try:
+        leitura = Sessao(info={"replica_bind": replica})
+        assert _nome_tenant(leitura) == "replica"
+        leitura.rollback()
+
+        escrita = Sessao()
+        escrita.execute(update(models.Tenant).where(models.Tenant.id == 1).values(name="alterado"))
+        escrita.commit()
+
+        assert _nome_tenant(leitura) == "alterado"
+    finally:
+        database.encerrar_requisicao(token)
+    assert _nome_tenant(Sessao(info={"replica_bind": replica})) == "replica"
+
+
+def test_sessao_async_de_leitura_usa_replica(tmp_path):
+    _bancos(tmp_path)
+    replica_async = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica'}.db")
+    primario_async = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primario'}.db")
+    Sessao = async_sessionmaker(
+        primario_async, class_=AsyncSession, sync_session_class=RoutingSession, info={"replica_bind": replica_async.sync_engine}
+    )
+
+    async def cenario():
+        async with Sessao() as db:
+            return await db.scalar(select(models.Tenant.name).where(models.Tenant.id == 1))
+
+    assert asyncio.run(cenario()) == "replica"
@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import sigtap_backfill, sigtap_rules
+from app.tests.test_sigtap_delta import _proc, _servico
+from app.tests.test_sigtap_sync_realistic import _build_zip
+
+
+def test_intervalo_vira_o_ano_e_valida_entrada():
+    assert sigtap_backfill.competencias_intervalo("202411", "202502") == ["202411", "202412", "202501", "202502"]
+    assert sigtap_backfill.intervalo_anterior("202502", 3) == ["202412", "202501", "202502"]
+    with pytest.raises(ValueError):
+        sigtap_backfill.competencias_intervalo("202503", "202501")
+    with pytest.raises(ValueError):
+        sigtap_backfill.competencias_intervalo("202513", "202601")
+
+
+def test_backfill_aplica_em_ordem_cronologica_com_downloads_fora_de_ordem():
+    pacotes = {
+        "202501": [_proc("0301010030", "10,00")],
+        "202502": [_proc("0301010030", "12,00")],
+        "202503": [_proc("0301010030", "12,00")],
+        "202504": [_proc("0301010030", "15,00")],
+    }
+    session, repo, _ = _servico({})
+    atrasos = {"202501": 0.15, "202502": 0.0, "202503": 0.1, "202504": 0.0}
+
+    def fetcher(competencia):
+        time.sleep(atrasos[competencia])
+        if competencia == "202503":
+            raise RuntimeError("pacote indisponivel")
+        return _build_zip(pacotes[competencia], [])
+
+    progresso = []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        resultados = sigtap_backfill.backfill(
+            repo, list(pacotes), fetcher=fetcher, executor=executor, progresso=progresso.append
+        )
+
+    assert [r["competencia"] for r in progresso] == ["202501", "202502", "202503", "202504"]
+    assert [r["status"] for r in resultados] == ["importada", "importada", "erro", "importada"]
+    assert resultados[2]["erro"] == "pacote indisponivel"
+    janelas = [
+        (float(t.valor), t.vigencia_inicio, t.vigencia_fim)
+        for t in (sigtap_rules.get_tabela_para_competencia(session, "0301010030", c) for c in ("202501", "202503", "202504"))
+    ]
+    assert janelas == [(10.0, "202501", "202501"), (12.0, "202502", "202503"), (15.0, "202504", None)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        repetido = sigtap_backfill.backfill(repo, ["202501", "202502"], fetcher=fetcher, executor=executor)
+    assert [r["status"] for r in repetido] == ["ja_importada", "ja_importada"]
+    session.close()
+
+
+def test_backfill_em_pool_de_processos_le_espelho_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(sigtap_backfill.settings, "sigtap_backfill_workers", 2)
+    for competencia, valor in (("202501", "10,00"), ("202502", "11,00")):
+        (tmp_path / f"SIGTAP_{competencia}.zip").write_bytes(_build_zip([_proc("0301010030", valor)], []))
+    session, repo, _ = _servico({})
+
+    resultados = sigtap_backfill.backfill(repo, ["202502", "202501"], base_url=str(tmp_path))
+
+    assert [(r["competencia"], r["status"]) for r in resultados] == [("202501", "importada"), ("202502", "importada")]
+    atual = sigtap_rules.get_tabela_para_competencia(session, "0301010030", "202502")
+    assert float(atual.valor) == 11.0
+    session.close()
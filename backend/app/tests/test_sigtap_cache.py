@@ -0,0 +1,115 @@
+import io
+import zipfile
+
+import httpx
+import pytest
+
+from app.services.sigtap_cache import CachePacotes, obter_pacote
+
+URL = "https://datasus.example/SIGTAP_202501.zip"
+
+
+def _zip(nome: str = "tb_procedimento.txt") -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr(nome, "0301010030;CONSULTA")
+    return buffer.getvalue()
+
+
+PACOTE = _zip()
+
+
+def _origem(pedidos, conteudo=PACOTE, etag='"v1"'):
+    def handler(request: httpx.Request) -> httpx.Response:
+        pedidos.append(request)
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, content=conteudo, headers={"ETag": etag})
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_segunda_leitura_vem_do_disco_sem_rede(tmp_path):
+    pedidos = []
+    cache = CachePacotes(str(tmp_path), max_idade_horas=24)
+    with _origem(pedidos) as client:
+        assert obter_pacote("202501", [URL], client=client, cache=cache) == PACOTE
+        assert obter_pacote("202501", [URL], client=client, cache=cache) == PACOTE
+    assert len(pedidos) == 1
+    assert len(list((tmp_path / "objetos").iterdir())) == 1
+
+
+def test_cache_vencido_revalida_com_get_condicional(tmp_path):
+    pedidos = []
+    with _origem(pedidos) as client:
+        obter_pacote("202501", [URL], client=client, cache=CachePacotes(str(tmp_path)))
+        vencido = CachePacotes(str(tmp_path), max_idade_horas=0)
+        assert obter_pacote("202501", [URL], client=client, cache=vencido) == PACOTE
+    assert pedidos[-1].headers["if-none-match"] == '"v1"'
+
+
+def test_objeto_corrompido_forca_novo_download(tmp_path):
+    pedidos = []
+    cache = CachePacotes(str(tmp_path))
+    with _origem(pedidos) as client:
+        obter_pacote("202501", [URL], client=client, cache=cache)
+        objeto = next((tmp_path / "objetos").iterdir())
+        objeto.write_bytes(b"truncado")
+        assert obter_pacote("202501", [URL], client=client, cache=cache) == PACOTE
+    assert len(pedidos) == 2
+
+
+def test_resposta_que_nao_e_zip_nao_entra_no_cache(tmp_path):
+    pagina_erro = b"<html>Servico indisponivel</html>"
+    cache = CachePacotes(str(tmp_path))
+    with _origem([], conteudo=pagina_erro) as client:
+        with pytest.raises(RuntimeError, match="nao e um ZIP"):
+            obter_pacote("202501", [URL], client=client, cache=cache)
+    assert cache.ler_entrada("202501") is None
+
+    with _origem([]) as client:
+        obter_pacote("202501", [URL], client=client, cache=cache)
+    # Na revalidacao, uma pagina de erro mantem o pacote que ja estava em cache
+    with _origem([], conteudo=pagina_erro, etag='"v2"') as client:
+        vencido = CachePacotes(str(tmp_path), max_idade_horas=0)
+        assert obter_pacote("202501", [URL], client=client, cache=vencido) == PACOTE
+    assert cache.ler_objeto(cache.ler_entrada("202501")) == PACOTE
+
+
+def test_origem_fora_do_ar_usa_cache_vencido(tmp_path):
+    with _origem([]) as client:
+        obter_pacote("202501", [URL], client=client, cache=CachePacotes(str(tmp_path)))
+
+    def fora(request):
+        raise httpx.ConnectError("sem rede")
+
+    with httpx.Client(transport=httpx.MockTransport(fora)) as client:
+        vencido = CachePacotes(str(tmp_path), max_idade_horas=0)
+        assert obter_pacote("202501", [URL], client=client, cache=vencido) == PACOTE
+
+
+def test_espelho_local_dispensa_rede(tmp_path):
+    (tmp_path / "TabelaUnificada_202501.zip").write_bytes(b"PK-espelho")
+    urls = [f"{tmp_path}/SIGTAP_202501.zip", f"file://{tmp_path}/TabelaUnificada_202501.zip"]
+    assert obter_pacote("202501", urls) == b"PK-espelho"
+    with pytest.raises(RuntimeError):
+        obter_pacote("202502", [f"{tmp_path}/SIGTAP_202502.zip"])
+
+
+def test_lista_mista_le_o_espelho_antes_da_rede(tmp_path):
+    (tmp_path / "SIGTAP_202501.zip").write_bytes(b"PK-espelho")
+    pedidos = []
+    with _origem(pedidos) as client:
+        urls = [f"{tmp_path}/SIGTAP_202501.zip", URL]
+        assert obter_pacote("202501", urls, client=client, cache=CachePacotes(str(tmp_path / "cache"))) == b"PK-espelho"
+        urls = [f"{tmp_path}/SIGTAP_202502.zip", URL]
+        assert obter_pacote("202502", urls, client=client, cache=CachePacotes(str(tmp_path / "cache"))) == PACOTE
+    assert [str(p.url) for p in pedidos] == [URL]
+
+
+def test_diretorio_relativo_resolvido_na_raiz_do_backend(monkeypatch):
+    from app.services import sigtap_cache
+
+    monkeypatch.setattr(sigtap_cache.settings, "sigtap_cache_dir", "sigtap_cache")
+    assert sigtap_cache.diretorio_cache() == sigtap_cache.BACKEND_DIR / "sigtap_cache"
+    assert (sigtap_cache.BACKEND_DIR / "app").is_dir()
@@ -0,0 +1,82 @@
+import io
+import zipfile
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app import models
+from app.services import sigtap_compatibilidades, sigtap_rules
+from app.tests.test_sigtap_delta import _proc, _servico
+from app.tests.test_sigtap_sync_realistic import _csv_content
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpo():
+    sigtap_compatibilidades.limpar_cache()
+    yield
+    sigtap_compatibilidades.limpar_cache()
+
+
+def _pacote(cids, cbos, habilitacoes=None):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        # Relacao listada antes da tabela de procedimentos de proposito
+        zf.writestr("rl_procedimento_cid.csv", _csv_content([{"CO_PROCEDIMENTO": p, "CO_CID": c, "ST_PRINCIPAL": "S"} for p, c in cids]))
+        zf.writestr("tb_procedimento.csv", _csv_content([_proc("0301010030", "10,00"), _proc("0301010056", "20,00")]))
+        if cbos:
+            zf.writestr("rl_procedimento_ocupacao.csv", _csv_content([{"CO_PROCEDIMENTO": p, "CO_OCUPACAO": c} for p, c in cbos]))
+        if habilitacoes:
+            zf.writestr("rl_procedimento_habilitacao.csv", _csv_content([{"CO_PROCEDIMENTO": p, "CO_HABILITACAO": c} for p, c in habilitacoes]))
+    return buffer.getvalue()
+
+
+def _validar(session, competencia, cid="F329", cbo="225120", unidade_params=None):
+    paciente = SimpleNamespace(cns="898001160660001", cpf="12345678901", sexo="F", data_nascimento=date(1990, 1, 1))
+    proc = SimpleNamespace(sigtap_codigo="0301010030", cid10=cid, profissional_cbo=cbo, competencia_aaaamm=competencia)
+    unidade = SimpleNamespace(cnes="1234560", competencia_params=unidade_params or {})
+    profissional = SimpleNamespace(cns="898001160660001", cbo=cbo)
+    return sigtap_rules.validate_procedimento(session, paciente, proc, unidade, profissional, date(2025, 1, 10))
+
+
+def test_relacoes_importadas_com_vigencia_e_consultadas_por_competencia():
+    session, repo, service = _servico({})
+    pacotes = {
+        "202501": _pacote([("0301010030", "F32.9"), ("0301010030", "F330")], [("0301010030", "225120")], [("0301010030", "0601")]),
+        "202502": _pacote([("0301010030", "F330")], [("0301010030", "225120"), ("0301010030", "225125")]),
+    }
+    service.fetcher = lambda comp: pacotes[comp]
+
+    primeiro = service.sync("202501")
+    assert primeiro["delta"]["novos"] == 2
+    assert primeiro["delta"]["relacoes"]["cid"] == {"abertos": 2, "encerrados": 0, "vigentes": 2}
+    segundo = service.sync("202502")
+    assert segundo["delta"]["relacoes"]["cid"] == {"abertos": 0, "encerrados": 1, "vigentes": 1}
+    assert "habilitacao" not in segundo["delta"]["relacoes"]  # ausente do pacote: intocada
+
+    cids = session.execute(select(models.SigtapProcedimentoCID.codigo, models.SigtapProcedimentoCID.vigencia_fim)).all()
+    assert sorted(cids) == [("F329", "202501"), ("F330", None)]
+
+    assert _validar(session, "202501") == []
+    assert _validar(session, "202502") == ["cid_incompativel"]
+    assert _validar(session, "202502", cid="F330", cbo="999999") == ["cbo_incompativel"]
+    assert _validar(session, "202502", cid="F330", unidade_params={"habilitacoes": ["0602"]}) == ["habilitacao_ausente"]
+    assert _validar(session, "202502", cid="F330", unidade_params={"habilitacoes": ["0602", "0601"]}) == []
+
+    compat = sigtap_compatibilidades.carregar(session, "202502")
+    assert compat is sigtap_compatibilidades.carregar(session, "202502")
+    assert compat.permite("cid", "0301010056", "Z000")  # sem relacao: sem restricao
+    session.close()
+
+
+def test_reimportacao_remove_par_aberto_na_mesma_competencia():
+    session, repo, service = _servico({})
+    pacotes = [_pacote([("0301010030", "F329"), ("0301010030", "F330")], []), _pacote([("0301010030", "F330")], [])]
+    service.fetcher = lambda comp: pacotes.pop(0)
+    service.sync("202501")
+    service.sync("202501")
+
+    cids = session.execute(select(models.SigtapProcedimentoCID.codigo, models.SigtapProcedimentoCID.vigencia_inicio)).all()
+    assert cids == [("F330", "202501")]
+    session.close()
@@ -0,0 +1,120 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import Base
+from app.services import sigtap_rules
+from app.services.sigtap_delta import mes_anterior
+from app.services.sigtap_sync import SIGTAPSyncService, TabelaSIGTAPRepository
+from app.tests.test_sigtap_sync_realistic import _build_zip
+
+
+def _proc(codigo: str, valor: str, idade_max: str = "") -> dict:
+    return {
+        "CO_PROCEDIMENTO": codigo,
+        "NO_PROCEDIMENTO": f"Procedimento {codigo}",
+        "VL_PROCEDIMENTO": valor,
+        "TP_SEXO": "A",
+        "NU_IDADE_MAXIMA": idade_max,
+        "CO_COMPLEXIDADE": "01",
+    }
+
+
+def _servico(pacotes):
+    engine = create_engine("sqlite:///:memory:", future=True)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, future=True)()
+    repo = TabelaSIGTAPRepository(session)
+    fixtures = {comp: _build_zip(rows, []) for comp, rows in pacotes.items()}
+    return session, repo, SIGTAPSyncService(repo, fetcher=lambda comp: fixtures[comp])
+
+
+def test_mes_anterior_vira_o_ano():
+    assert mes_anterior("202501") == "202412"
+    assert mes_anterior("202510") == "202509"
+
+
+def test_sync_grava_apenas_procedimentos_alterados():
+    session, repo, service = _servico(
+        {
+            "202501": [_proc("0301010030", "10,00"), _proc("0301010056", "20,00")],
+            "202502": [_proc("0301010030", "10,00"), _proc("0301010056", "20,00")],
+            "202503": [_proc("0301010030", "10,00"), _proc("0301010056", "25,50", idade_max="60"), _proc("0201010011", "5,00")],
+        }
+    )
+
+    primeiro = service.sync("202501")
+    assert primeiro["delta"]["novos"] == 2
+
+    repetido = service.sync("202502")
+    assert repetido["importados"] == 0
+    assert repetido["ja_existiam"] == 2
+    assert repo.total_registros() == 2
+    assert repo.competencia_importada("202502")
+    assert repo.ultima_competencia() == "202502"
+
+    mudanca = service.sync("202503")
+    assert mudanca["delta"]["novos"] == 1
+    assert mudanca["delta"]["alteracoes"] == [{"codigo": "0301010056", "campos": ["valor", "idade_max"]}]
+    assert repo.total_registros() == 4
+
+    antiga = sigtap_rules.get_tabela_para_competencia(session, "0301010056", "202502")
+    nova = sigtap_rules.get_tabela_para_competencia(session, "0301010056", "202504")
+    assert float(antiga.valor) == 20.0 and antiga.vigencia_fim == "202502"
+    assert float(nova.valor) == 25.5 and nova.vigencia_inicio == "202503" and nova.vigencia_fim is None
+
+    importacao = session.get(models.SigtapImportacao, "202503")
+    assert (importacao.novos, importacao.alterados, importacao.inalterados) == (1, 1, 1)
+    session.close()
+
+
+def test_reimportacao_da_mesma_competencia_corrige_no_lugar():
+    pacotes = {"202501": [_proc("0301010030", "10,00")]}
+    session, repo, service = _servico(pacotes)
+    service.sync("202501")
+
+    service.fetcher = lambda comp: _build_zip([_proc("0301010030", "12,00")], [])
+    resultado = service.sync("202501")
+
+    assert resultado["delta"]["alteracoes"] == [{"codigo": "0301010030", "campos": ["valor"]}]
+    linhas = session.scalars(select(models.TabelaSIGTAP)).all()
+    assert len(linhas) == 1
+    assert float(linhas[0].valor) == 12.0
+    session.close()
+
+
+def test_procedimento_ausente_entra_no_relatorio_sem_encerrar_vigencia():
+    session, repo, service = _servico(
+        {
+            "202501": [_proc("0301010030", "10,00"), _proc("0301010056", "20,00")],
+            "202502": [_proc("0301010030", "10,00")],
+        }
+    )
+    service.sync("202501")
+    resultado = service.sync("202502")
+
+    assert resultado["delta"]["ausentes"] == 1
+    assert sigtap_rules.get_tabela_para_competencia(session, "0301010056", "202502") is not None
+    session.close()
+
+
+def test_competencia_anterior_ao_historico_fecha_antes_da_linha_seguinte():
+    session, repo, service = _servico(
+        {
+            "202503": [_proc("0301010030", "10,00"), _proc("0301010056", "20,00")],
+            "202501": [_proc("0301010030", "8,00"), _proc("0301010056", "20,00")],
+        }
+    )
+    service.sync("202503")
+    resultado = service.sync("202501")
+
+    assert resultado["delta"]["novos"] == 1
+    antiga = sigtap_rules.get_tabela_para_competencia(session, "0301010030", "202502")
+    atual = sigtap_rules.get_tabela_para_competencia(session, "0301010030", "202504")
+    assert float(antiga.valor) == 8.0 and (antiga.vigencia_inicio, antiga.vigencia_fim) == ("202501", "202502")
+    assert float(atual.valor) == 10.0 and atual.vigencia_fim is None
+
+    # Igual a linha seguinte: nenhuma linha nova, a vigente passa a comecar antes
+    igual = session.scalars(select(models.TabelaSIGTAP).where(models.TabelaSIGTAP.codigo == "0301010056")).all()
+    assert [(l.vigencia_inicio, l.vigencia_fim) for l in igual] == [("202501", None)]
+    session.close()
@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+from sqlalchemy import delete
+
+from app import models
+from app.services import sigtap_rules, sigtap_snapshot
+from app.tests.test_sigtap_delta import _proc, _servico
+
+
+def test_sync_publica_snapshot_com_as_mesmas_janelas_do_banco():
+    session, repo, service = _servico(
+        {
+            "202501": [_proc("0301010030", "10,00"), _proc("0301010056", "20,00"), _proc("0201010011", "5,00")],
+            "202503": [_proc("0301010030", "12,50", idade_max="60"), _proc("0301010056", "20,00")],
+        }
+    )
+    service.sync("202501")
+    service.sync("202503")
+    esperado = {
+        (codigo, competencia): sigtap_rules.get_tabela_para_competencia(session, codigo, competencia)
+        for codigo in ("0301010030", "0301010056", "0201010011", "9999999999")
+        for competencia in ("202412", "202501", "202502", "202503", "202506")
+    }
+
+    leitor = sigtap_snapshot.leitor(session)
+    assert leitor is not None and len(leitor) == 4 and leitor.competencia == "202503"
+    # Sem linhas no banco, as consultas continuam respondidas pelo arquivo
+    session.execute(delete(models.TabelaSIGTAP))
+    session.commit()
+    for (codigo, competencia), tabela in esperado.items():
+        lida = sigtap_rules.get_tabela_para_competencia(session, codigo, competencia)
+        assert (lida is None) == (tabela is None), (codigo, competencia)
+        if lida is not None:
+            assert (lida.valor, lida.vigencia_inicio, lida.vigencia_fim, lida.idade_max) == (
+                Decimal(tabela.valor), tabela.vigencia_inicio, tabela.vigencia_fim, tabela.idade_max
+            )
+
+    atual = leitor.buscar("0301010030", "202506")
+    assert atual.valor == Decimal("12.50") and atual.idade_max == 60 and atual.descricao == "Procedimento 0301010030"
+    assert sigtap_rules.existe_procedimento(session, "0201010011")
+    assert not sigtap_rules.existe_procedimento(session, "9999999999")
+    session.close()
+
+
+def test_troca_atomica_e_percebida_por_leitores_de_outros_processos(monkeypatch):
+    monkeypatch.setattr(sigtap_snapshot.settings, "sigtap_snapshot_verificar_segundos", 0)
+    session, repo, service = _servico(
+        {"202501": [_proc("0301010030", "10,00")], "202502": [_proc("0301010030", "11,00")]}
+    )
+    service.sync("202501")
+    antigo = sigtap_snapshot.leitor(session)
+    caminho = sigtap_snapshot.caminho_snapshot()
+
+    # Outro processo so ve o arquivo trocado no disco
+    sigtap_snapshot._leitores.clear()
+    service.sync("202502")
+    sigtap_snapshot._leitores[caminho] = (antigo, 0.0, True)
+
+    novo = sigtap_snapshot.leitor(session)
+    assert novo is not antigo and novo.versao > antigo.versao
+    assert novo.buscar("0301010030", "202502").valor == Decimal("11.00")
+    # O mapeamento antigo continua legivel para quem ainda o usa
+    assert antigo.buscar("0301010030", "202502").valor == Decimal("10.00")
+
+    caminho.write_bytes(b"lixo")
+    assert sigtap_snapshot.leitor(session) is None
+    session.close()
+
+
+def test_falha_ao_publicar_remove_o_snapshot_anterior(monkeypatch):
+    session, repo, service = _servico(
+        {"202501": [_proc("0301010030", "10,00")], "202502": [_proc("0301010030", "11,00")]}
+    )
+    service.sync("202501")
+    assert sigtap_snapshot.leitor(session) is not None
+
+    def _falha(*args, **kwargs):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(sigtap_snapshot, "_empacotar", _falha)
+    service.sync("202502")
+
+    caminho = sigtap_snapshot.caminho_snapshot()
+    assert not caminho.exists() and list(caminho.parent.glob("*.tmp")) == []
+    assert sigtap_snapshot.leitor(session) is None
+    assert sigtap_rules.get_tabela_para_competencia(session, "0301010030", "202502").valor == Decimal("11.00")
+    session.close()
+
+
+def test_importacao_em_outro_container_faz_o_snapshot_local_cair_para_o_banco(monkeypatch):
+    monkeypatch.setattr(sigtap_snapshot.settings, "sigtap_snapshot_verificar_segundos", 0)
+    session, repo, service = _servico(
+        {"202501": [_proc("0301010030", "10,00")], "202502": [_proc("0301010030", "11,00")]}
+    )
+    service.sync("202501")
+    assert sigtap_snapshot.leitor(session) is not None
+
+    # O worker importa e publica no proprio disco; este arquivo fica como estava
+    service.importar("202502", service.preparar("202502"), publicar_snapshot=False)
+
+    assert sigtap_snapshot.leitor(session) is None
+    assert sigtap_rules.get_tabela_para_competencia(session, "0301010030", "202502").valor == Decimal("11.00")
+    session.close()
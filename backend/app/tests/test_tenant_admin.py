@@ -6,7 +6,7 @@ from fastapi.testclient import TestClient
 from app.database import Base
 from app import models as all_models  # ensure models are registered
 from app.main import app
-from app.api.deps import get_db_session
+from app.api.deps import get_db_session, get_read_db_session
 from app.database import get_db as base_get_db
 from app import models
 from app.auth import get_password_hash
@@ -37,6 +37,7 @@ def setup_test_app():
             db.close()
 
     app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_read_db_session] = override_get_db
     app.dependency_overrides[base_get_db] = override_get_db
     return engine, TestingSessionLocal
 
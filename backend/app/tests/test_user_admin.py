@@ -6,7 +6,7 @@ from fastapi.testclient import TestClient
 from app.database import Base
 from app import models as all_models  # ensure models are registered
 from app.main import app
-from app.api.deps import get_db_session
+from app.api.deps import get_db_session, get_read_db_session
 from app.database import get_db as base_get_db
 from app import models
 from app.auth import get_password_hash
@@ -37,6 +37,7 @@ def setup_test_app():
             db.close()
 
     app.dependency_overrides[get_db_session] = override_get_db
+    app.dependency_overrides[get_read_db_session] = override_get_db
     app.dependency_overrides[base_get_db] = override_get_db
     return engine, TestingSessionLocal
 
@@ -114,6 +115,13 @@ def test_user_crud_and_reset_password():
         assert res.status_code == 200
         emails = [u["email"] for u in res.json()]
         assert "clinico@test.com" in emails
+        assert "x-next-cursor" not in res.headers
+
+        # paginacao so quando pedida
+        res = client.get("/api/users?limit=1", headers=headers)
+        assert len(res.json()) == 1 and res.headers["x-next-cursor"]
+        res = client.get(f"/api/users?cursor={res.headers['x-next-cursor']}", headers=headers)
+        assert [u["email"] for u in res.json()] == ["clinico@test.com"]
 
         # reset password
         res = client.post(
@@ -172,3 +180,46 @@ def test_user_without_permission_cannot_manage_users():
 
     Base.metadata.drop_all(bind=engine)
     app.dependency_overrides.clear()
+
+
+def test_listar_usuarios_agrega_papeis_em_uma_consulta(query_budget):
+    from app.api.routes.users import listar_usuarios
+
+    engine, SessionLocal = setup_test_app()
+    tenant_id = seed_admin(SessionLocal)
+    try:
+        db = SessionLocal()
+        usuarios = [models.Usuario(email=f"u{i}@test.com", nome=f"Usuario {i}", hashed_password="x", ativo=True) for i in range(5)]
+        db.add_all(usuarios)
+        db.flush()
+        for i, u in enumerate(usuarios):
+            db.add(models.TenantUserRole(user_id=u.id, tenant_id=tenant_id, role=models.Role.RECEPCAO.value, ativo=True))
+            if i % 2 == 0:
+                db.add(models.TenantUserRole(user_id=u.id, tenant_id=tenant_id, role=models.Role.CLINICO.value, ativo=True))
+        db.commit()
+
+        with query_budget(1):
+            pagina, cursor = listar_usuarios(db, tenant_id, limit=4)
+        assert [u["email"] for u in pagina] == ["admin@test.com", "u0@test.com", "u1@test.com", "u2@test.com"]
+        assert pagina[1]["roles"] == sorted([models.Role.CLINICO.value, models.Role.RECEPCAO.value])
+
+        resto, fim = listar_usuarios(db, tenant_id, cursor=cursor, limit=4)
+        assert [u["email"] for u in resto] == ["u3@test.com", "u4@test.com"]
+        assert fim is None
+
+        clinicos, _ = listar_usuarios(db, tenant_id, role=models.Role.CLINICO.value)
+        assert [u["email"] for u in clinicos] == ["u0@test.com", "u2@test.com", "u4@test.com"]
+        assert all(len(u["roles"]) == 2 for u in clinicos)
+
+        todos, sem_cursor = listar_usuarios(db, tenant_id, limit=None)
+        assert len(todos) == 6 and sem_cursor is None
+
+        por_nome, _ = listar_usuarios(db, tenant_id, nome="usuario 3")
+        assert [u["email"] for u in por_nome] == ["u3@test.com"]
+        # Curingas do LIKE no filtro sao literais
+        assert listar_usuarios(db, tenant_id, email="u_@")[0] == []
+        assert listar_usuarios(db, tenant_id, nome="%")[0] == []
+        db.close()
+    finally:
+        app.dependency_overrides.clear()
+        Base.metadata.drop_all(engine)